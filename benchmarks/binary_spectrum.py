@@ -0,0 +1,118 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Compares saving and opening a large spectrum in the text and binary
+formats, and the file sizes.
+
+Run it from the top directory with
+
+    python benchmarks/binary_spectrum.py
+'''
+
+# std lib imports
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__))), 'src'))
+
+# third party imports
+import numpy as np
+
+# local imports
+from simplepl.simple_pl_parser import SimplePLParser
+from simplepl.spectrum_data import writeSpectrum, BINARY_EXTENSION
+
+ROWS = 1000000
+
+
+class Spectrum(object):
+    '''
+    A spectrum with the AbstractSpectrum getters, without Qt.
+    '''
+
+    def __init__(self, rows):
+        random = np.random.RandomState(0)
+        self._wavelength = np.linspace(900., 2400., rows)
+        self._rawSignal = random.rand(rows) * 1e-6
+        self._phase = random.rand(rows) * 360. - 180.
+        self._settleTime = random.rand(rows)
+        self._time = 1.4e9 + np.arange(rows) * 0.1
+
+    def getWavelength(self):
+        return self._wavelength
+
+    def getSignal(self):
+        return self._rawSignal
+
+    def getRawSignal(self):
+        return self._rawSignal
+
+    def getPhase(self):
+        return self._phase
+
+    def getSignalError(self):
+        return None
+
+    def getRawSignalError(self):
+        return None
+
+    def getSettleTime(self):
+        return self._settleTime
+
+    def getTime(self):
+        return self._time
+
+
+def timeit(func):
+    start = time.time()
+    result = func()
+    return time.time() - start, result
+
+
+def openSpectrum(filepath, mmap):
+    parser = SimplePLParser(filepath)
+    parser.parse(mmap=mmap)
+    return parser
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    try:
+        spectrum = Spectrum(ROWS)
+        cases = (('text', '.txt', False),
+                 ('binary', BINARY_EXTENSION, False),
+                 ('binary mmap', BINARY_EXTENSION, True))
+        for name, extension, mmap in cases:
+            filepath = os.path.join(directory, 'spectrum' + extension)
+            tSave, _ = timeit(lambda: writeSpectrum(spectrum, filepath,
+                                                    dict(sample_id='A1')))
+            tOpen, parser = timeit(lambda: openSpectrum(filepath, mmap))
+            tRead, _ = timeit(lambda: float(parser.rawSignal[ROWS // 2]))
+            size = os.path.getsize(filepath) / 2. ** 20
+            print ('%-11s save %.3f s, open %.3f s, first read %.4f s, '
+                   '%.1f MB' % (name, tSave, tOpen, tRead, size))
+            del parser
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,88 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Compares looking up the grating and filter for a wavelength by reading
+the configs from the QSettings and searching them linearly with the
+compiled ConfigTable, one wavelength at a time and vectorized.
+
+Run it from the top directory with
+
+    python benchmarks/config_lookup.py
+'''
+
+# std lib imports
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__))), 'src'))
+
+# third party imports
+import numpy as np
+from PySide import QtCore
+
+# local imports
+from simplepl.instruments.config_table import ConfigTable
+
+
+def makeSettings(path):
+    settings = QtCore.QSettings(path, QtCore.QSettings.IniFormat)
+    wavelengths = [800., 1000., 1600., 2500., 3500., 5000.]
+    settings.beginWriteArray('spectrometer/configs', size=len(wavelengths))
+    for i, wavelength in enumerate(wavelengths):
+        settings.setArrayIndex(i)
+        settings.setValue('wavelength', wavelength)
+        settings.setValue('grating', i % 3 + 1)
+        settings.setValue('filter', i % 6 + 1)
+    settings.endArray()
+    return settings
+
+
+if __name__ == "__main__":
+    fd, path = tempfile.mkstemp(suffix='.ini')
+    os.close(fd)
+    try:
+        settings = makeSettings(path)
+
+        def oldTargetFor(wavelength):
+            table = ConfigTable.fromSettings(settings)
+            wavelengths, gratings, filters = table.getConfigs()
+            for i in xrange(len(gratings)):
+                if wavelength <= wavelengths[i + 1]:
+                    return gratings[i], filters[i]
+
+        table = ConfigTable.fromSettings(settings)
+        targets = np.linspace(800., 5000., 1000)
+        n = 10
+        tOld = timeit.timeit(lambda: [oldTargetFor(w) for w in targets],
+                             number=n) / n
+        tNew = timeit.timeit(lambda: [table.targetFor(w) for w in targets],
+                             number=n) / n
+        tVec = timeit.timeit(lambda: table.targetsFor(targets),
+                             number=n) / n
+        # the times are for len(targets) == 1000 lookups, so ms -> us
+        print 'per-point QSettings lookup: {:.2f} us'.format(tOld * 1e3)
+        print 'per-point compiled lookup:  {:.2f} us'.format(tNew * 1e3)
+        print 'vectorized targetsFor:      {:.3f} us'.format(tVec * 1e3)
+    finally:
+        os.remove(path)
@@ -0,0 +1,55 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Checks the settle times suggested by SR830.get_suggested_delay against
+the modelled lock-in filter: the fraction of a step reached after each
+suggested delay, and the delay needed to reach 99%.
+
+Run it from the top directory with
+
+    python benchmarks/lockin_settle.py
+'''
+
+# std lib imports
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__))), 'src'))
+
+# third party imports
+import numpy as np
+
+# local imports
+from simplepl.instruments.drivers.lockin_model import getStepResponse
+
+# The delays suggested for each filter slope, in time constants
+MULTIPLIERS = (5., 7., 9., 10.)
+
+
+if __name__ == "__main__":
+    times = np.linspace(0., 15., 3001)
+    for slope, multiplier in enumerate(MULTIPLIERS):
+        response = getStepResponse(1., slope, times)
+        reached = np.interp(multiplier, times, response)
+        t99 = times[np.argmax(response >= 0.99)]
+        print ('%2d dB/oct: %4.1f tau reaches %.4f, 99%% at %.1f tau'
+               % (6 * (slope + 1), multiplier, reached, t99))
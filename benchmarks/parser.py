@@ -0,0 +1,104 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Compares reading text spectra line by line, as the original parser did,
+with SimplePLParser.parse and iterChunks.
+
+Run it from the top directory with
+
+    python benchmarks/parser.py
+'''
+
+# std lib imports
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__))), 'src'))
+
+# third party imports
+import numpy as np
+
+# local imports
+from simplepl.simple_pl_parser import SimplePLParser
+from simplepl.spectrum_data import writeTable
+
+HEADER = 'Wavelength\tSignal\tRaw_Signal\tPhase\tSettle_Time\n'
+ROW_FORMAT = '%.1f\t%E\t%E\t%.1f\t%.3f\n'
+
+
+def writeFile(filepath, rows):
+    random = np.random.RandomState(0)
+    columns = [np.linspace(900., 2400., rows)] + [random.rand(rows)
+                                                 for _ in xrange(4)]
+    with open(filepath, 'w') as f:
+        f.write(HEADER)
+        writeTable(f, ROW_FORMAT, columns)
+
+
+def parseLineByLine(filepath):
+    '''
+    Reads the columns one line and one value at a time, like the original
+    parser.
+    '''
+    wavelength = []
+    signal = []
+    rawSignal = []
+    phase = []
+    with open(filepath, 'rU') as f:
+        f.readline()  # column headers
+        for line in f:
+            values = line.split()
+            wavelength.append(float(values[0]))
+            signal.append(float(values[1]))
+            rawSignal.append(float(values[2]))
+            phase.append(float(values[3]))
+    return (np.array(wavelength), np.array(signal), np.array(rawSignal),
+            np.array(phase))
+
+
+def timeit(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def iterAll(filepath):
+    for _chunk in SimplePLParser(filepath).iterChunks():
+        pass
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(directory, 'spectrum.txt')
+        for rows in (10000, 1000000):
+            writeFile(filepath, rows)
+            tOld = timeit(lambda: parseLineByLine(filepath))
+            tNew = timeit(lambda: SimplePLParser(filepath).parse())
+            tChunks = timeit(lambda: iterAll(filepath))
+            print '%7d rows: line by line %.3f s, parse %.3f s, ' \
+                  'iterChunks %.3f s' % (rows, tOld, tNew, tChunks)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,59 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Compares the array functions of the simplefit models with evaluating
+each point in Python, using the scalar references from
+tests/test_simulated_spectrum.py.
+
+Run it from the top directory with
+
+    python benchmarks/simplefit_models.py
+'''
+
+# std lib imports
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__))))
+
+# third party imports
+import numpy as np
+
+# local imports
+from tests.test_simulated_spectrum import CASES, scalarEvaluate
+from simplefit import simulated_spectrum
+
+
+if __name__ == "__main__":
+    energy = np.linspace(0.9, 1.3, 20000)
+    for name, reference, parameters in CASES:
+        cls = getattr(simulated_spectrum, name)
+        scalarTime = timeit.timeit(
+                        lambda: scalarEvaluate(reference, energy, parameters),
+                        number=1)
+        n = 10
+        arrayTime = timeit.timeit(lambda: cls.function(energy, *parameters),
+                                  number=n) / n
+        print '{:34s} {:8.2f} ms scalar, {:6.3f} ms array, {:5.0f}x'.format(
+                name, scalarTime * 1e3, arrayTime * 1e3,
+                scalarTime / arrayTime)
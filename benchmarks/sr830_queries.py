@@ -0,0 +1,63 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Counts the lock-in queries per measured point, with the settings cached
+in the SR830 driver. The real driver is run against an emulated SR830
+(see fake_visa.py), which adds the GPIB turnaround time to each query,
+and the simulated driver is counted too.
+
+Run it from the top directory with
+
+    python benchmarks/sr830_queries.py
+'''
+
+# std lib imports
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__))), 'src'))
+
+# local imports
+from simplepl.instruments.drivers import srs_sr830, srs_sr830_sim
+from simplepl.instruments.drivers.fake_visa import FakeSR830
+
+
+def countQueries(sr830, n=100):
+    '''
+    Returns the queries and the time per point of n measurements.
+    '''
+    sr830.query_count = 0
+    start = time.time()
+    for _ in xrange(n):
+        sr830.adjust_and_get_outputs(0.)
+    elapsed = time.time() - start
+    return float(sr830.query_count) / n, elapsed / n
+
+
+if __name__ == "__main__":
+    drivers = (('emulated SR830', srs_sr830.SR830(inst=FakeSR830())),
+               ('simulated SR830', srs_sr830_sim.SR830()))
+    for name, sr830 in drivers:
+        queries, seconds = countQueries(sr830)
+        print '%-16s %.2f queries, %.1f ms per point' % (name, queries,
+                                                          seconds * 1e3)
@@ -25,9 +25,26 @@
 from PySide import QtCore
 
 # local imports
+from simplepl.derived_columns import DerivedColumns
 
 class AbstractSpectrum(QtCore.QObject):
     sigChanged = QtCore.Signal()
     wavelength = None
     energy = None
-    intensity = None
\ No newline at end of file
+    intensity = None
+
+    def __init__(self, *args, **kwargs):
+        # before QObject.__init__, which may set properties from kwargs
+        self._derived = DerivedColumns()
+        super(AbstractSpectrum, self).__init__(*args, **kwargs)
+
+    def _changed(self):
+        '''
+        Clears the derived columns, and emits sigChanged. Call this
+        whenever the arrays change.
+        '''
+        self._derived.invalidate()
+        self.sigChanged.emit()
+
+    def getDerivedColumns(self):
+        return self._derived
\ No newline at end of file
@@ -0,0 +1,125 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+
+# std lib imports
+
+# third party imports
+import numpy as np
+
+# local imports
+
+
+class FitModel(object):
+    '''
+    The sum of the simulated spectra, as a function of the unlocked
+    parameter values, for curve_fit. The parameters of all the spectra
+    are laid out in one array, with the locked values filled in once, so
+    that each evaluation only copies the unlocked values into it and
+    sums the spectrum functions into a preallocated array.
+
+    Parameters
+    ----------
+    spectra : list of simulated spectra
+        each with a function staticmethod, and optionally a jacobian
+    values : list of floats
+        the values of all of the parameters of the spectra, in order
+    lockMask : list of bools
+        True for each parameter that is locked at its value
+    '''
+
+    def __init__(self, spectra, values, lockMask):
+        self._values = np.array(values, dtype=float)
+        lockMask = np.asarray(lockMask, dtype=bool)
+        if lockMask.size != self._values.size:
+            raise ValueError('values and lockMask must be the same length')
+        self._unlocked = np.flatnonzero(~lockMask)
+
+        # (function, start, stop) of each spectrum's parameters, and
+        # (jacobian, start, stop, its unlocked columns, and where they go
+        # in the full jacobian) of the spectra with unlocked parameters
+        self._functions = []
+        self._jacobians = []
+        self._hasJacobian = True
+        start = 0
+        for spectrum in spectra:
+            stop = start + len(spectrum.parameters)
+            self._functions.append((spectrum.function, start, stop))
+            jacobian = getattr(spectrum, 'jacobian', None)
+            if jacobian is None:
+                self._hasJacobian = False
+            columns = np.flatnonzero(~lockMask[start:stop])
+            if columns.size:
+                self._jacobians.append((jacobian, start, stop, columns,
+                                        np.searchsorted(self._unlocked,
+                                                        start + columns)))
+            start = stop
+        if start != self._values.size:
+            raise ValueError('values must have one value per parameter')
+
+        self._result = None
+        self._jacobian = None
+
+    def getInitialGuess(self):
+        '''
+        Returns the unlocked parameter values.
+        '''
+        return self._values[self._unlocked].copy()
+
+    def hasJacobian(self):
+        '''
+        Returns True if all of the spectra have an analytic jacobian.
+        '''
+        return self._hasJacobian
+
+    def _setValues(self, args):
+        values = self._values
+        values[self._unlocked] = args
+        return values
+
+    def __call__(self, x, *args):
+        '''
+        Returns the sum of the spectra at the energies x, for the unlocked
+        parameter values args. The returned array is reused by the next
+        call.
+        '''
+        values = self._setValues(args)
+        result = self._result
+        if result is None or result.shape != np.shape(x):
+            result = self._result = np.empty(np.shape(x))
+        result.fill(0.)
+        for function, start, stop in self._functions:
+            result += function(x, *values[start:stop])
+        return result
+
+    def jacobian(self, x, *args):
+        '''
+        Returns the derivatives of the sum of the spectra with respect to
+        the unlocked parameters, as the columns of an array. The returned
+        array is reused by the next call.
+        '''
+        values = self._setValues(args)
+        shape = (np.size(x), self._unlocked.size)
+        result = self._jacobian
+        if result is None or result.shape != shape:
+            result = self._jacobian = np.empty(shape)
+        for jacobian, start, stop, columns, targets in self._jacobians:
+            result[:, targets] = jacobian(x, *values[start:stop])[:, columns]
+        return result
@@ -38,7 +38,7 @@ class MeasuredSpectrum(AbstractSpectrum):
     
     def _getEnergy(self):
         '''Returns the energy array'''
-        return 1239.842/self.wavelength
+        return self._derived.get('energy', lambda: 1239.842/self.wavelength)
     
     energy = QtCore.Property(np.ndarray, _getEnergy)
 
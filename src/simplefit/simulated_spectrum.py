@@ -34,6 +34,17 @@ kB = 8.6173324e-5  # eV / K
 
 
 class AbstractSimulatedSpectrum(AbstractSpectrum):
+    '''
+    Subclasses define function(energy, *parameters) as a staticmethod,
+    which is evaluated for every residual while fitting, so it must take
+    an array of energies and compute the intensities with array
+    operations, rather than looping over the energies in Python.
+
+    They also define jacobian(energy, *parameters), which returns the
+    derivatives of function with respect to each parameter, as the
+    columns of an array of shape (energy.size, len(parameters)).
+    '''
+
     def __init__(self, *args, **kwargs):
         super(AbstractSimulatedSpectrum, self).__init__(*args, **kwargs)
         self.parameters = []
@@ -44,18 +55,18 @@ class AbstractSimulatedSpectrum(AbstractSpectrum):
 
     def _setEnergy(self, energy):
         self._energy = energy
-        self.sigChanged.emit()
+        self._changed()
 
     energy = QtCore.Property(np.ndarray, _getEnergy, _setEnergy)
 
     def _getWavelength(self):
         if self.energy is None:
             return None
-        return 1239.842 / self.energy
+        return self._derived.get('wavelength', lambda: 1239.842 / self.energy)
 
     def _setWavelength(self, wavelength):
         self._energy = 1239.842 / wavelength
-        self.sigChanged.emit()
+        self._changed()
 
     wavelength = QtCore.Property(np.ndarray, _getWavelength, _setWavelength)
 
@@ -83,6 +94,10 @@ class ConstantSpectrum(AbstractSimulatedSpectrum):
     def function(energy, c):
         return energy * 0. + c
 
+    @staticmethod
+    def jacobian(energy, c):
+        return np.ones((np.size(energy), 1))
+
     def getIntegral(self):
         return 0.  # the background shouldn't contribute
 
@@ -121,6 +136,15 @@ class GaussianSpectrum(AbstractPeakSpectrum):
     def function(energy, a, c, w):
         return (a * np.exp(-(energy - c) ** 2. / (2. * (w / 2.35482) ** 2.)))
 
+    @staticmethod
+    def jacobian(energy, a, c, w):
+        s2 = (w / 2.35482) ** 2.
+        x = energy - c
+        g = np.exp(-x ** 2. / (2. * s2))
+        return np.column_stack((g,
+                                a * g * x / s2,
+                                a * g * x ** 2. / (s2 * w)))
+
     def getIntegral(self):
         return self.amplitude.value * self.fwhm.value * np.sqrt(np.pi)
 
@@ -130,6 +154,14 @@ class LorentzianSpectrum(AbstractPeakSpectrum):
     def function(energy, a, c, w):
         return (a / (1. + (2. * (energy - c) / w) ** 2.))
 
+    @staticmethod
+    def jacobian(energy, a, c, w):
+        u = 2. * (energy - c) / w
+        d = 1. / (1. + u ** 2.)
+        return np.column_stack((d,
+                                4. * a * u * d ** 2. / w,
+                                2. * a * u ** 2. * d ** 2. / w))
+
     def getIntegral(self):
         return self.amplitude.value * self.fwhm.value * np.pi / 2.
 
@@ -171,21 +203,27 @@ class AsymmetricGaussianSpectrum(AbstractSimulatedSpectrum):
     @staticmethod
     def function(energy, a, c, w1, w2):
         '''
-        Assumes energy is a numpy array.
+        A gaussian with a half width of w1 below the center, and w2 above
+        it.
         '''
         # I want exp( - x**2 ) as x --> 0
         # and exp( - x ) as x --> -oo, oo
-        def f(energy):
-            if energy < c:
-                return (a * np.exp(-(energy - c) ** 2. /
-                                   (2. * (2 * w1 / 2.35482) ** 2.)))
-            else:
-                return (a * np.exp(-(energy - c) ** 2. /
-                                   (2. * (2 * w2 / 2.35482) ** 2.)))
-        result = np.empty_like(energy)
-        for i in xrange(energy.size):
-            result[i] = f(energy[i])
-        return result
+        w = np.where(energy < c, w1, w2)
+        return (a * np.exp(-(energy - c) ** 2. /
+                           (2. * (2 * w / 2.35482) ** 2.)))
+
+    @staticmethod
+    def jacobian(energy, a, c, w1, w2):
+        below = energy < c
+        w = np.where(below, w1, w2)
+        s2 = (2 * w / 2.35482) ** 2.
+        x = energy - c
+        g = np.exp(-x ** 2. / (2. * s2))
+        dw = a * g * x ** 2. / (s2 * w)
+        return np.column_stack((g,
+                                a * g * x / s2,
+                                np.where(below, dw, 0.),
+                                np.where(below, 0., dw)))
 
     def getIntegral(self):
         return self.amplitude.value * \
@@ -231,6 +269,22 @@ class WaveVectorConservingPLSpectrum(AbstractPLSpectrum):
         result = scale * np.sqrt(E - Eg) * np.exp(-(energy - Eg) / (kB * T))
         return result.real
 
+    @staticmethod
+    def jacobian(energy, A, Eg, T):
+        if T <= 0:
+            return np.zeros((energy.size, 3))
+        x = energy - Eg
+        above = x > 0
+        r = np.sqrt(np.where(above, x, 0.))  # the real part of sqrt(x)
+        base = (r * np.exp(-x / (kB * T)) /
+                (np.sqrt(.5 * kB * T) * np.exp(-.5)))
+        result = A * base
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dEg = np.where(above, result * (1. / (kB * T) - .5 / x), 0.)
+        return np.column_stack((base,
+                                dEg,
+                                result * (x / (kB * T ** 2.) - .5 / T)))
+
 
 class WaveVectorNonConservingPLSpectrum(AbstractPLSpectrum):
     @staticmethod
@@ -245,3 +299,19 @@ class WaveVectorNonConservingPLSpectrum(AbstractPLSpectrum):
         result *= step_function
         # return result.real
         return result
+
+    @staticmethod
+    def jacobian(energy, A, Eg, T):
+        if T <= 0:
+            return np.zeros((energy.size, 3))
+        x = energy - Eg
+        step_function = 0.5 * (np.sign(x) + 1)
+        base = (x ** 2. * np.exp(-x / (kB * T)) * step_function /
+                ((2. * kB * T) ** 2. * np.exp(-2.)))
+        result = A * base
+        dEg = (A * step_function * np.exp(-x / (kB * T)) *
+               (x ** 2. / (kB * T) - 2. * x) /
+               ((2. * kB * T) ** 2. * np.exp(-2.)))
+        return np.column_stack((base,
+                                dEg,
+                                result * (x / (kB * T ** 2.) - 2. / T)))
@@ -20,6 +20,7 @@
 #######################################################################
 
 # std lib imports
+import inspect
 
 # third party imports
 from PySide import QtGui, QtCore
@@ -37,6 +38,7 @@ from simulated_spectrum import (ConstantSpectrum, GaussianSpectrum,
                                 WaveVectorConservingPLSpectrum,
                                 WaveVectorNonConservingPLSpectrum)
 from summed_spectrum import SummedSpectrum
+from fit_model import FitModel
 
 class SpectraControlWidget(QtGui.QWidget):
     sigChanged = QtCore.Signal()
@@ -231,53 +233,36 @@ class SpectraControlWidget(QtGui.QWidget):
         x = spectrum.energy
         y = spectrum.intensity
         pvalues = [] # initial parameter values (both locked and unlocked)
-        p0 = [] # initial guess (unlocked parameter values)
         unlocked_parameters = [] # the unlocked parameter objects
         lock_mask = []
-        funcs = []
-        pcounts = []
         for spectrum, control in zip(self._spectra, self._controls):
-            funcs.append(spectrum.function)
-            pcounts.append(len(spectrum.parameters))
             for p, lock in zip(spectrum.parameters,
                                control.lockFitCheckBoxes):
                 pvalues.append(p.value)
                 if lock.isChecked():
                     lock_mask.append(True)
                 else:
-                    p0.append(p.value)
                     unlocked_parameters.append(p)
                     lock_mask.append(False)
-        
-        if not p0:
+
+        if not unlocked_parameters:
             return # autoFit does nothing if there are no unlocked parameters
-        
-        # create a function that sums up the spectrum functions
-        def sum_funcs(x, *args):
-            result = None
-            i = 0 # current parameter index
-            j = 0 # current args index
-            for func, pcount in zip(funcs, pcounts):
-                func_args = []
-                for k in xrange(pcount):
-                    if lock_mask[i]:
-                        func_args.append(pvalues[i])
-                    else:
-                        func_args.append(args[j])
-                        j += 1
-                    i += 1
-                if result is None:
-                    result = func(x, *func_args)
-                else:
-                    result += func(x, *func_args)
-            return result
-        
+
+        # the sum of the spectrum functions, of the unlocked parameters
+        model = FitModel(self._spectra, pvalues, lock_mask)
+        p0 = model.getInitialGuess()
+
         print 'p0 = ', p0
         from scipy.optimize import curve_fit
-        popt, pcov = curve_fit(sum_funcs, x, y, p0)
+        kwargs = {}
+        if (model.hasJacobian() and
+                'jac' in inspect.getargspec(curve_fit).args):
+            # analytic derivatives, rather than finite differences
+            kwargs['jac'] = model.jacobian
+        popt, pcov = curve_fit(model, x, y, p0, **kwargs)
         #TODO: make sigma user adjustable
         sigma = 6e-7 # estimated from a scan with laser blocked, using 300 ms time constnat
-        chi = (y - sum_funcs(x, *popt)) / sigma
+        chi = (y - model(x, *popt)) / sigma
         chi2 = (chi ** 2).sum()
         dof = len(x) - len(popt)
         factor = (chi2 / dof)
@@ -27,6 +27,7 @@ from PySide import QtCore
 
 # local imports
 from abstract_spectrum import AbstractSpectrum
+from simplepl.decimation import LineDecimator
 
 # Use black text on white background
 pg.setConfigOption('background', 'w')
@@ -51,6 +52,7 @@ class SpectraPlotItem(pg.PlotItem):
             enableMenu=True, **kwargs)
         self._spectra = []
         self._signalLines = []
+        self._decimator = LineDecimator(self)
         self._xAxisView = kwargs.get('xaxis', 'wavelength')
         for spectrum in spectra:
             self.addSpectrum(spectrum)
@@ -59,8 +61,9 @@ class SpectraPlotItem(pg.PlotItem):
     def removeSpectrum(self, spectrum):
         if spectrum not in self._spectra:
             raise ValueError('spectrum not in plot')
-        spectrum.sigChanged.disconnect(self.updateLines())
+        spectrum.sigChanged.disconnect(self.updateLines)
         i = self._spectra.index(spectrum)
+        self._decimator.remove(self._signalLines[i])
         self.removeItem(self._signalLines[i])
         del self._spectra[i]
         del self._signalLines[i]
@@ -77,7 +80,8 @@ class SpectraPlotItem(pg.PlotItem):
             raise ValueError('Unsupported value for xaxis: {}'
                              .format(self._xAxisView))
         y = spectrum.intensity
-        line = self.plot(x=x, y=y)
+        line = self.plot()
+        self._decimator.setData(line, x, y)
         self._signalLines.append(line)
         self._spectra.append(spectrum)
         spectrum.sigChanged.connect(self.updateLines)
@@ -92,7 +96,7 @@ class SpectraPlotItem(pg.PlotItem):
                 raise ValueError('Unsupported value for xaxis: {}'
                                  .format(self._xAxisView))
             y = spectrum.intensity
-            line.setData(x=x, y=y)
+            self._decimator.setData(line, x, y)
     
     def autofit(self):
         raise NotImplementedError()
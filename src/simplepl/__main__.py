@@ -113,5 +113,11 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--debug', action='store_true')
     parser.add_argument('--simulate', action='store_true')
+    parser.add_argument('--emulate', action='store_true',
+                        help='run the real drivers against emulated '
+                             'instruments')
     args = parser.parse_args()
-    run(args.debug, args.simulate)
+    if args.emulate:
+        run(args.debug, 2)  # see instruments.core.SIMULATE_PROTOCOL
+    else:
+        run(args.debug, args.simulate)
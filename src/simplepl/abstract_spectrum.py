@@ -21,6 +21,10 @@
 
 # third party imports
 from PySide import QtCore
+import numpy as np
+
+# local imports
+from derived_columns import DerivedColumns
 
 
 class AbstractSpectrum(QtCore.QObject):
@@ -29,6 +33,31 @@ class AbstractSpectrum(QtCore.QObject):
     def __init__(self, **kwargs):
         super(AbstractSpectrum, self).__init__()
         self._color = kwargs.get('color', None)
+        self._derived = DerivedColumns()
+
+    def _changed(self):
+        '''
+        Clears the derived columns, and emits sigChanged. Call this
+        whenever the arrays change. Arrays that may be read from another
+        thread should be changed in a ``with self._derived.changing():``
+        block first.
+        '''
+        self._derived.invalidate()
+        self.sigChanged.emit()
+
+    def getDerivedColumns(self):
+        '''
+        Returns the DerivedColumns cache, e.g. to check its hit counts.
+        '''
+        return self._derived
+
+    def getRewriteCount(self):
+        '''
+        Returns the number of times that points were changed, moved or
+        removed, or None if unknown. While it stays the same, the arrays
+        only change by appending points.
+        '''
+        return None
 
     def getWavelength(self):
         raise NotImplementedError()
@@ -45,6 +74,35 @@ class AbstractSpectrum(QtCore.QObject):
     def getEnergy(self):
         raise NotImplementedError()
 
+    def getNormalizedSignal(self):
+        '''
+        Returns the signal divided by its maximum.
+        '''
+        return self._derived.get('normalizedSignal', self._normalizeSignal)
+
+    def _normalizeSignal(self):
+        signal = self.getSignal()
+        return signal / np.nanmax(signal)
+
+    def getSignalError(self):
+        '''
+        Returns the standard error of the signal, or None if unknown.
+        '''
+        return None
+
+    def getRawSignalError(self):
+        '''
+        Returns the standard error of the raw signal, or None if unknown.
+        '''
+        return None
+
+    def getSettleTime(self):
+        '''
+        Returns the time waited for the lock-in to settle at each point,
+        in seconds, or None if unknown.
+        '''
+        return None
+
     def setColor(self, color):
         self._color = color
 
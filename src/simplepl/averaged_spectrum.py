@@ -0,0 +1,140 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+
+# third party imports
+import logging
+log = logging.getLogger(__name__)
+import numpy as np
+
+# local imports
+from measured_spectrum import MeasuredSpectrum
+
+
+class AveragedSpectrum(MeasuredSpectrum):
+    '''
+    A spectrum that averages repeated measurements at a fixed set of
+    target wavelengths, as taken by a multi-pass scan. The running mean,
+    variance and count at each target wavelength are updated in place
+    using Welford's algorithm, so no individual passes are stored.
+
+    Only target wavelengths that have been measured at least once are
+    returned by the getters.
+    '''
+
+    def __init__(self, targetWavelengths, sysres=None, **kwargs):
+        super(AveragedSpectrum, self).__init__(**kwargs)
+        self.sysres = sysres
+        self._targets = np.sort(np.asarray(targetWavelengths,
+                                           dtype=np.float64))
+        size = self._targets.size
+        self._count = np.zeros(size, dtype=np.int64)
+        self._meanWavelength = np.zeros(size)
+        self._meanRawSignal = np.zeros(size)
+        self._m2RawSignal = np.zeros(size)
+        self._meanPhase = np.zeros(size)
+        self._meanSettleTime = np.zeros(size)
+        if sysres is None:
+            log.warning("No sysrem response provided. Using raw value.")
+            self._sysres = np.ones(size)
+        else:
+            self._sysres = sysres(self._targets)
+
+    def add(self, targetWavelength, wavelength, rawSignal, phase,
+            settleTime=np.nan):
+        '''
+        Adds a measurement taken at the given target wavelength.
+        '''
+        i = np.searchsorted(self._targets, targetWavelength)
+        if i == self._targets.size or (
+                i > 0 and (targetWavelength - self._targets[i - 1] <
+                           self._targets[i] - targetWavelength)):
+            i -= 1
+        with self._derived.changing():
+            self._count[i] += 1
+            n = self._count[i]
+            self._meanWavelength[i] += ((wavelength - self._meanWavelength[i])
+                                        / n)
+            self._meanPhase[i] += (phase - self._meanPhase[i]) / n
+            self._meanSettleTime[i] += ((settleTime - self._meanSettleTime[i])
+                                        / n)
+            delta = rawSignal - self._meanRawSignal[i]
+            self._meanRawSignal[i] += delta / n
+            self._m2RawSignal[i] += delta * (rawSignal -
+                                             self._meanRawSignal[i])
+        self._changed()
+
+    def _measured(self):
+        return self._derived.get('measured', lambda: self._count > 0)
+
+    def _getMeasured(self, name, values):
+        '''
+        Returns the named column of values at the measured targets.
+        '''
+        return self._derived.get(name, lambda: values[self._measured()])
+
+    def getCount(self):
+        return self._getMeasured('count', self._count)
+
+    def getWavelength(self):
+        return self._getMeasured('wavelength', self._meanWavelength)
+
+    def getRawSignal(self):
+        return self._getMeasured('rawSignal', self._meanRawSignal)
+
+    def getSignal(self):
+        return self._derived.get('signal', self._computeSignal)
+
+    def _computeSignal(self):
+        return self.getRawSignal() / self._getMeasured('sysres',
+                                                       self._sysres)
+
+    def getPhase(self):
+        return self._getMeasured('phase', self._meanPhase)
+
+    def getSettleTime(self):
+        '''
+        Returns the mean settle time at each target wavelength.
+        '''
+        return self._getMeasured('settleTime', self._meanSettleTime)
+
+    def getRawSignalError(self):
+        '''
+        Returns the standard error of the mean raw signal, which is NaN
+        where there is only one measurement.
+        '''
+        return self._derived.get('rawSignalError',
+                                 self._computeRawSignalError)
+
+    def _computeRawSignalError(self):
+        n = self.getCount().astype(np.float64)
+        m2 = self._getMeasured('m2RawSignal', self._m2RawSignal)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = m2 / (n - 1)
+            return np.where(n > 1, np.sqrt(variance / n), np.nan)
+
+    def getSignalError(self):
+        '''
+        Returns the standard error of the mean signal, which is NaN
+        where there is only one measurement.
+        '''
+        return self._derived.get('signalError', lambda:
+                                 self.getRawSignalError() /
+                                 self._getMeasured('sysres', self._sysres))
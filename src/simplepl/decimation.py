@@ -0,0 +1,332 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Min/max decimation of long lines for fast plotting.
+'''
+
+# std lib imports
+
+# third party imports
+import numpy as np
+
+# local imports
+from expanding_buffer import ExpandingBuffer
+
+# Each level of a MinMaxPyramid has this many times fewer bins than the
+# level below it
+FACTOR = 4
+
+# The levels stop when they have this many bins or fewer
+MIN_BINS = 64
+
+# The number of bins drawn across the view, if its width is unknown
+DEFAULT_PIXELS = 1000
+
+
+class MinMaxPyramid(object):
+    '''
+    A multi-resolution summary of a line, y vs x, for plotting. Level k
+    holds the min and max of y in bins of FACTOR**k points, so any part of
+    the line can be drawn at about screen resolution without visiting
+    every point, while keeping the peaks and the bounds of the data.
+
+    x should be ascending or descending. Otherwise, the line is not
+    decimated.
+
+    The levels are stored in ExpandingBuffers, so that appending points
+    only computes the new bins.
+    '''
+
+    def __init__(self, x=None, y=None):
+        self._x = ExpandingBuffer()
+        self._descending = False
+        self._monotonic = True
+        # the mins and maxs of each level. Level 0 is y itself.
+        self._mins = [ExpandingBuffer()]
+        self._maxs = self._mins[:]
+        if x is not None:
+            self.update(x, y)
+
+    def __len__(self):
+        return len(self._x)
+
+    def update(self, x, y):
+        '''
+        Updates the pyramid to the new x and y arrays, and returns True
+        if they changed. Only the bins from the first changed point on are
+        recomputed, but the arrays are compared with the current line, so
+        use append() when points were only appended.
+        '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if x.size != y.size:
+            raise ValueError('x and y must be the same length')
+        first = self._getFirstChange(x, y)
+        if first is None:
+            return False
+        self._extend(x[first:], y[first:], first)
+        return True
+
+    def append(self, x, y):
+        '''
+        Appends the points in the x and y arrays to the line, and returns
+        True if there were any. This takes time proportional to the number
+        of new points, not to the length of the line.
+        '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if x.size != y.size:
+            raise ValueError('x and y must be the same length')
+        if not x.size:
+            return False
+        self._extend(x, y, len(self._x))
+        return True
+
+    def _extend(self, x, y, first):
+        '''
+        Replaces the points from first on with x and y.
+        '''
+        self._x.truncate(first)
+        self._x.extend(x)
+        self._mins[0].truncate(first)
+        self._mins[0].extend(y)
+        self._updateOrder(first)
+        self._updateLevels(first)
+
+    def _getFirstChange(self, x, y):
+        '''
+        Returns the index of the first point that differs from the current
+        line, or None if they are the same.
+        '''
+        oldX = self._x.get()
+        oldY = self._mins[0].get()
+        n = min(oldX.size, x.size)
+        differs = (oldX[:n] != x[:n])
+        unequal = (oldY[:n] != y[:n])
+        if unequal.any():
+            # nan != nan, but isn't a change
+            unequal &= ~(np.isnan(oldY[:n]) & np.isnan(y[:n]))
+            differs |= unequal
+        if differs.any():
+            return int(differs.argmax())
+        if n == oldX.size == x.size:
+            return None
+        return n
+
+    def _updateOrder(self, first):
+        x = self._x.get()
+        descending = x.size > 1 and x[-1] < x[0]
+        if descending != self._descending or not self._monotonic:
+            first = 0  # recheck the whole line
+        self._descending = descending
+        steps = np.diff(x[max(first - 1, 0):])
+        if descending:
+            backwards = (steps > 0).any()
+        else:
+            backwards = (steps < 0).any()
+        self._monotonic = (first == 0 or self._monotonic) and not backwards
+
+    def _updateLevels(self, first):
+        '''
+        Recomputes the bins of each level from the point first on.
+        '''
+        belowMins = belowMaxs = self._mins[0].get()
+        level = 1
+        while belowMins.size > MIN_BINS:
+            if level == len(self._mins):
+                self._mins.append(ExpandingBuffer())
+                self._maxs.append(ExpandingBuffer())
+            mins = self._mins[level]
+            maxs = self._maxs[level]
+            # keep the whole bins before the first change
+            first //= FACTOR
+            mins.truncate(first)
+            maxs.truncate(first)
+            first = len(mins)
+            starts = np.arange(first * FACTOR, belowMins.size, FACTOR)
+            if starts.size:
+                # fmin and fmax ignore nans, unless the whole bin is nan
+                mins.extend(np.fmin.reduceat(belowMins, starts))
+                maxs.extend(np.fmax.reduceat(belowMaxs, starts))
+            belowMins = mins.get()
+            belowMaxs = maxs.get()
+            level += 1
+        del self._mins[level:]
+        del self._maxs[level:]
+
+    def isDecimated(self, pixels=DEFAULT_PIXELS):
+        '''
+        Returns True if the line is drawn with fewer points than it has,
+        when it is pixels wide.
+        '''
+        return self._monotonic and len(self._x) > 2 * pixels
+
+    def get(self, xmin=None, xmax=None, pixels=DEFAULT_PIXELS):
+        '''
+        Returns the x and y arrays to draw the line, for a view of
+        [xmin, xmax] that is pixels wide. The visible part of the line is
+        drawn with about one bin per pixel, each bin giving its min and
+        max, and the rest with about pixels bins in total, so that the
+        bounds of the data are unchanged.
+        '''
+        x = self._x.get()
+        y = self._mins[0].get()
+        n = x.size
+        if not self.isDecimated(pixels):
+            return x, y
+        if xmin is None or xmax is None:
+            start, stop = 0, n
+        elif self._descending:
+            start = max(self._bisect(-xmax, -1) - 1, 0)
+            stop = min(self._bisect(-xmin, -1, right=True) + 1, n)
+        else:
+            start = max(self._bisect(xmin, 1) - 1, 0)
+            stop = min(self._bisect(xmax, 1, right=True) + 1, n)
+        coarse = self._getLevel(n, pixels)
+        fine = self._getLevel(stop - start, pixels)
+        size = FACTOR ** coarse
+        start = start // size * size
+        stop = min(-(-stop // size) * size, n)
+        xs = []
+        ys = []
+        self._addBins(xs, ys, coarse, 0, start)
+        self._addBins(xs, ys, fine, start, stop)
+        self._addBins(xs, ys, coarse, stop, n)
+        # the last bin starts before the last point
+        xs.append(x[-1:])
+        ys.append(y[-1:])
+        return np.concatenate(xs), np.concatenate(ys)
+
+    def _bisect(self, value, sign, right=False):
+        '''
+        Returns the index to insert value at in sign * x, which is
+        ascending.
+        '''
+        x = self._x.get()
+        lo = 0
+        hi = x.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = sign * x[mid]
+            if key < value or (right and key == value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _getLevel(self, count, pixels):
+        '''
+        Returns the lowest level with no more than pixels bins for count
+        points.
+        '''
+        level = 0
+        size = 1
+        while count > pixels * size and level < len(self._mins) - 1:
+            level += 1
+            size *= FACTOR
+        return level
+
+    def _addBins(self, xs, ys, level, start, stop):
+        '''
+        Adds the bins of the given level that cover the points from start
+        to stop to the lists xs and ys.
+        '''
+        if start >= stop:
+            return
+        if level == 0:
+            xs.append(self._x.get()[start:stop])
+            ys.append(self._mins[0].get()[start:stop])
+            return
+        size = FACTOR ** level
+        first = start // size
+        last = -(-stop // size)
+        binX = self._x.get()[first * size:stop:size]
+        binY = np.empty(2 * binX.size)
+        binY[0::2] = self._mins[level].get()[first:last]
+        binY[1::2] = self._maxs[level].get()[first:last]
+        xs.append(np.repeat(binX, 2))
+        ys.append(binY)
+
+
+class LineDecimator(object):
+    '''
+    Draws the lines (PlotDataItems) of a pyqtgraph PlotItem from
+    MinMaxPyramids, so that each line is drawn with about one bin per
+    pixel of the visible range, and redraws the long lines when the view
+    changes.
+    '''
+
+    def __init__(self, plotItem):
+        self._plotItem = plotItem
+        self._pyramids = {}
+        self._appendKeys = {}
+        viewBox = plotItem.getViewBox()
+        viewBox.sigXRangeChanged.connect(self.redraw)
+        viewBox.sigResized.connect(self.redraw)
+
+    def setData(self, line, x, y, appendKey=None):
+        '''
+        Sets the data of the line, updating its pyramid.
+
+        If appendKey is not None, and is the same as the appendKey of the
+        last call for the line, x and y must be the previous arrays with
+        points appended, and only the new points are added to the pyramid.
+        '''
+        if x is None or y is None:
+            self.remove(line)
+            line.setData(x=x, y=y)
+            return
+        pyramid = self._pyramids.get(line)
+        if pyramid is None:
+            pyramid = self._pyramids[line] = MinMaxPyramid()
+        n = len(pyramid)
+        if (appendKey is not None and len(x) >= n and
+                appendKey == self._appendKeys.get(line)):
+            pyramid.append(x[n:], y[n:])
+        else:
+            pyramid.update(x, y)
+        self._appendKeys[line] = appendKey
+        self._draw(line, pyramid)
+
+    def remove(self, line):
+        self._pyramids.pop(line, None)
+        self._appendKeys.pop(line, None)
+
+    def redraw(self, *args):
+        '''
+        Redraws the visible lines that are decimated, for the current
+        view.
+        '''
+        pixels = self._getPixels()
+        for line, pyramid in self._pyramids.iteritems():
+            if line.isVisible() and pyramid.isDecimated(pixels):
+                self._draw(line, pyramid)
+
+    def _draw(self, line, pyramid):
+        xmin, xmax = self._plotItem.getViewBox().viewRange()[0]
+        if self._plotItem.ctrl.logXCheck.isChecked():
+            xmin, xmax = 10 ** xmin, 10 ** xmax
+        x, y = pyramid.get(xmin, xmax, self._getPixels())
+        line.setData(x=x, y=y)
+
+    def _getPixels(self):
+        pixels = int(self._plotItem.getViewBox().width())
+        return pixels if pixels > 0 else DEFAULT_PIXELS
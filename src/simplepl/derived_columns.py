@@ -0,0 +1,91 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+A cache of the columns derived from a spectrum's arrays.
+'''
+
+# std lib imports
+from contextlib import contextmanager
+import threading
+
+# third party imports
+
+# local imports
+
+
+class DerivedColumns(object):
+    '''
+    Caches the columns that are derived from a spectrum's arrays, such as
+    the energy or the normalized signal, so that they are computed once
+    rather than on every call. The spectrum changes its arrays in a
+    changing() block, or calls invalidate() after they change.
+
+    The cached arrays are shared, so they must not be modified in place.
+    computed and hits count the cache misses and hits.
+    '''
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._columns = {}
+        self._version = 0
+        self.computed = 0
+        self.hits = 0
+
+    def get(self, name, compute):
+        '''
+        Returns the named column, calling compute() to compute it if it
+        isn't cached.
+        '''
+        with self._lock:
+            if name in self._columns:
+                self.hits += 1
+                return self._columns[name]
+            version = self._version
+        value = compute()
+        with self._lock:
+            self.computed += 1
+            # don't cache a value computed from arrays that have since
+            # changed, or were changing
+            if version == self._version:
+                self._columns[name] = value
+        return value
+
+    def invalidate(self):
+        '''
+        Clears the cache. Call this whenever the arrays change.
+        '''
+        with self._lock:
+            self._version += 1
+            self._columns = {}
+
+    @contextmanager
+    def changing(self):
+        '''
+        Clears the cache, and holds the lock while the arrays are changed
+        in the with block, so that no column computed from the arrays
+        before or during the change is cached:
+
+            with derived.changing():
+                ...  # change the arrays
+        '''
+        with self._lock:
+            self.invalidate()
+            yield
@@ -33,6 +33,8 @@ if __name__ == '__main__':
         os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
     import simplepl
 from simplepl.simple_pl_parser import SimplePLParser
+from simplepl.measured_spectrum import MeasuredSpectrum
+from simplepl.spectrum_data import writeTable
 
 
 class GenerateVeuszFileDialog(QtGui.QDialog):
@@ -281,35 +283,29 @@ class GenerateVeuszFileDialog(QtGui.QDialog):
         with open(save_filepath, 'w') as f:
             for pl_filepath, prefix in zip(pl_filepaths, prefixes):
 
-                parser = SimplePLParser(pl_filepath)
-                parser.parse()
+                spectrum = MeasuredSpectrum.open(pl_filepath)
 
                 # Output the wavelength array
                 f.write("ImportString(u'`%s Wavelength`(numeric)','''\n" %
                         prefix)
-                for w in parser.wavelength:
-                    f.write("%.1f\n" % w)
+                writeTable(f, '%.1f\n', [spectrum.getWavelength()])
                 f.write("''')\n")
 
                 # Output the energy array
                 f.write("ImportString(u'`%s Energy`(numeric)','''\n" % prefix)
-                for w in parser.energy:
-                    f.write("%E\n" % w)
+                writeTable(f, '%E\n', [spectrum.getEnergy()])
                 f.write("''')\n")
 
                 # Output the system response removed array
                 f.write("ImportString(u'`%s SysResRem`(numeric)','''\n" %
                         prefix)
-                for w in parser.signal:
-                    f.write("%E\n" % w)
+                writeTable(f, '%E\n', [spectrum.getSignal()])
                 f.write("''')\n")
 
                 # Output the normalized array
-                normalized = parser.signal / parser.signal.max()
                 f.write("ImportString(u'`%s Normalized`(numeric)','''\n" %
                         prefix)
-                for w in normalized:
-                    f.write("%E\n" % w)
+                writeTable(f, '%E\n', [spectrum.getNormalizedSignal()])
                 f.write("''')\n")
 
             # Output the Normalized page
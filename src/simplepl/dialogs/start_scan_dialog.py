@@ -24,6 +24,11 @@ from PySide import QtGui, QtCore
 
 # local imports
 from ..wavelength_spin_box import WavelengthSpinBox
+from ..scan_planner import planScan
+
+# Scan modes, in the order they appear in the dialog
+SCAN_MODES = ('step', 'sweep', 'adaptive')
+SCAN_MODE_LABELS = ('Step and settle', 'Continuous sweep', 'Adaptive')
 
 
 class StartScanDialog(QtGui.QDialog):
@@ -39,6 +44,22 @@ class StartScanDialog(QtGui.QDialog):
         stop = float(settings.value('scan/stop', maxWavelength))
         step = float(settings.value('scan/step', 10.))
         delay = float(settings.value('scan/delay', 1.5))
+        mode = settings.value('scan/mode', 'step')
+        rate = float(settings.value('scan/rate', 100.))
+        buffered = bool(int(settings.value('scan/buffered', 0)))
+        maxPoints = int(settings.value('scan/max_points', 200))
+        threshold = float(settings.value('scan/threshold', 3.))
+        passes = int(settings.value('scan/passes', 1))
+        alternate = bool(int(settings.value('scan/alternate', 0)))
+        sampleId = settings.value('scan/sample_id', '') or ''
+
+        self.sampleIdLineEdit = QtGui.QLineEdit(sampleId)
+
+        self.modeComboBox = QtGui.QComboBox()
+        for label in SCAN_MODE_LABELS:
+            self.modeComboBox.addItem(label)
+        if mode in SCAN_MODES:
+            self.modeComboBox.setCurrentIndex(SCAN_MODES.index(mode))
 
         self.startSpinBox = WavelengthSpinBox(value=start)
         self.startSpinBox.setRange(minWavelength, maxWavelength)
@@ -54,13 +75,47 @@ class StartScanDialog(QtGui.QDialog):
         self.delaySpinBox.setDecimals(1)
         self.delaySpinBox.setRange(0., 100.)
         self.delaySpinBox.setSingleStep(.1)
+        # A delay of 0 waits only until the lock-in settles
+        self.delaySpinBox.setSpecialValueText('Auto')
         self.delaySpinBox.setValue(delay)
 
+        self.rateSpinBox = QtGui.QDoubleSpinBox()
+        self.rateSpinBox.setDecimals(2)
+        self.rateSpinBox.setRange(0.01, 10000.)
+        self.rateSpinBox.setSingleStep(10.)
+        self.rateSpinBox.setValue(rate)
+
+        self.bufferedCheckBox = QtGui.QCheckBox('Use lock-in buffer')
+        self.bufferedCheckBox.setChecked(buffered)
+
+        self.maxPointsSpinBox = QtGui.QSpinBox()
+        self.maxPointsSpinBox.setRange(2, 100000)
+        self.maxPointsSpinBox.setSingleStep(10)
+        self.maxPointsSpinBox.setValue(maxPoints)
+
+        self.thresholdSpinBox = QtGui.QDoubleSpinBox()
+        self.thresholdSpinBox.setDecimals(1)
+        self.thresholdSpinBox.setRange(0.1, 1000.)
+        self.thresholdSpinBox.setSingleStep(.5)
+        self.thresholdSpinBox.setValue(threshold)
+
+        self.passesSpinBox = QtGui.QSpinBox()
+        self.passesSpinBox.setRange(1, 1000)
+        self.passesSpinBox.setValue(passes)
+
+        self.alternateCheckBox = QtGui.QCheckBox('Alternate direction')
+        self.alternateCheckBox.setChecked(alternate)
+
+        self._configTable = spectrometer.getConfigTable()
+        self.planLabel = QtGui.QLabel('')
         self.timeEstimateLabel = QtGui.QLabel('')
+        self._updateMode()
         self._updateTimeEstimate()
 
         layout = QtGui.QVBoxLayout(self)
         form = QtGui.QFormLayout()
+        form.addRow('Sample ID', self.sampleIdLineEdit)
+        form.addRow('Scan Mode', self.modeComboBox)
         form.addRow('Wavelength Start ({})'
                     ''.format(self.startSpinBox.getUnits()),
                     self.startSpinBox)
@@ -71,6 +126,13 @@ class StartScanDialog(QtGui.QDialog):
                     ''.format(self.stepSpinBox.getUnits()),
                     self.stepSpinBox)
         form.addRow('Delay (s)', self.delaySpinBox)
+        form.addRow('Scan Rate (nm/min)', self.rateSpinBox)
+        form.addRow('', self.bufferedCheckBox)
+        form.addRow('Maximum Points', self.maxPointsSpinBox)
+        form.addRow('Refine Threshold (noise sigma)', self.thresholdSpinBox)
+        form.addRow('Passes', self.passesSpinBox)
+        form.addRow('', self.alternateCheckBox)
+        form.addRow('Scan Plan:', self.planLabel)
         form.addRow('Minimum Scan Time:', self.timeEstimateLabel)
         layout.addLayout(form)
 
@@ -81,32 +143,94 @@ class StartScanDialog(QtGui.QDialog):
         layout.addWidget(self.buttons)
 
         # Connect signals and slots
+        self.modeComboBox.currentIndexChanged.connect(self._updateMode)
+        self.modeComboBox.currentIndexChanged.connect(
+                                                self._updateTimeEstimate)
         self.startSpinBox.valueChanged.connect(self._updateTimeEstimate)
         self.stopSpinBox.valueChanged.connect(self._updateTimeEstimate)
         self.stepSpinBox.valueChanged.connect(self._updateTimeEstimate)
         self.delaySpinBox.valueChanged.connect(self._updateTimeEstimate)
+        self.rateSpinBox.valueChanged.connect(self._updateTimeEstimate)
+        self.maxPointsSpinBox.valueChanged.connect(self._updateTimeEstimate)
+        self.passesSpinBox.valueChanged.connect(self._updateTimeEstimate)
         self.buttons.accepted.connect(self.accept)
         self.buttons.rejected.connect(self.reject)
 
+    def getMode(self):
+        return SCAN_MODES[self.modeComboBox.currentIndex()]
+
+    @QtCore.Slot()
+    def _updateMode(self):
+        sweep = (self.getMode() == 'sweep')
+        adaptive = (self.getMode() == 'adaptive')
+        self.stepSpinBox.setEnabled(not sweep)
+        self.delaySpinBox.setEnabled(not sweep)
+        self.rateSpinBox.setEnabled(sweep)
+        self.bufferedCheckBox.setEnabled(sweep)
+        self.maxPointsSpinBox.setEnabled(adaptive)
+        self.thresholdSpinBox.setEnabled(adaptive)
+        step = (self.getMode() == 'step')
+        self.passesSpinBox.setEnabled(step)
+        self.alternateCheckBox.setEnabled(step)
+
     @QtCore.Slot()
     def _updateTimeEstimate(self):
         start = self.startSpinBox.value()
         stop = self.stopSpinBox.value()
         step = self.stepSpinBox.value()
         delay = self.delaySpinBox.value()
+        rate = self.rateSpinBox.value()
+        maxPoints = self.maxPointsSpinBox.value()
+
+        # Update the scan plan
+        if self.getMode() == 'sweep':
+            self.planLabel.setText('')
+        else:
+            try:
+                plan = planScan(self._configTable, start, stop,
+                                step if start <= stop else -step)
+            except ValueError as e:
+                self.planLabel.setText(str(e))
+            else:
+                self.planLabel.setText(plan.describe())
 
         # Update time estimate
-        t = int(abs(float(stop - start) / step * delay))
+        if self.getMode() == 'sweep':
+            t = int(abs(float(stop - start) / rate * 60.))
+            self.timeEstimateLabel.setText(self._formatTime(t))
+        elif delay == 0.:
+            self.timeEstimateLabel.setText('Unknown (auto delay)')
+        elif self.getMode() == 'adaptive':
+            coarsePoints = int(abs(float(stop - start) / step))
+            t = int(coarsePoints * delay)
+            tMax = int(max(coarsePoints, maxPoints) * delay)
+            self.timeEstimateLabel.setText('{} to {}'.format(
+                                                    self._formatTime(t),
+                                                    self._formatTime(tMax)))
+        else:
+            passes = self.passesSpinBox.value()
+            t = int(abs(float(stop - start) / step * delay) * passes)
+            self.timeEstimateLabel.setText(self._formatTime(t))
+
+    @staticmethod
+    def _formatTime(t):
         h = t / 3600
         m = (t - h * 3600) / 60
         s = t - h * 3600 - m * 60
-        self.timeEstimateLabel.setText('%d h %d m %d s'%(h, m, s))
+        return '%d h %d m %d s'%(h, m, s)
 
     @classmethod
     def getScanParameters(cls, spectrometer, parent=None):
         '''
-        Returns (start, stop, step, delay) and changes the corresponding
-        values in the settings if accepted, or None if not.
+        Returns (mode, start, stop, step, delay, rate, maxPoints,
+        threshold, passes, alternate, sampleId) and changes the
+        corresponding values in the settings if accepted, or None if not.
+
+        mode is 'step', 'sweep' or 'adaptive'. The rate is in nm/min, and
+        is only used in the 'sweep' mode. maxPoints and threshold (in
+        units of the noise) are only used in the 'adaptive' mode. passes
+        and alternate are only used in the 'step' mode. sampleId is saved
+        in the metadata of binary spectra.
         '''
         dialog = cls(spectrometer=spectrometer, parent=parent)
         result = dialog.exec_()
@@ -121,6 +245,14 @@ class StartScanDialog(QtGui.QDialog):
         if start > stop:
             step *= -1
         delay = abs(dialog.delaySpinBox.value())
+        mode = dialog.getMode()
+        rate = abs(dialog.rateSpinBox.value())
+        buffered = dialog.bufferedCheckBox.isChecked()
+        maxPoints = dialog.maxPointsSpinBox.value()
+        threshold = dialog.thresholdSpinBox.value()
+        passes = dialog.passesSpinBox.value()
+        alternate = dialog.alternateCheckBox.isChecked()
+        sampleId = dialog.sampleIdLineEdit.text().strip()
 
         # Remember the current values
         settings = QtCore.QSettings()
@@ -128,6 +260,15 @@ class StartScanDialog(QtGui.QDialog):
         settings.setValue('scan/stop', stop)
         settings.setValue('scan/step', step)
         settings.setValue('scan/delay', delay)
+        settings.setValue('scan/mode', mode)
+        settings.setValue('scan/rate', rate)
+        settings.setValue('scan/buffered', int(buffered))
+        settings.setValue('scan/max_points', maxPoints)
+        settings.setValue('scan/threshold', threshold)
+        settings.setValue('scan/passes', passes)
+        settings.setValue('scan/alternate', int(alternate))
+        settings.setValue('scan/sample_id', sampleId)
         settings.sync()
 
-        return start, stop, step, delay
+        return (mode, start, stop, step, delay, rate, maxPoints, threshold,
+                passes, alternate, sampleId)
@@ -82,15 +82,51 @@ class ExpandingBuffer(object):
         self._buffer[i] = value
         self._index += 1
 
+    def insert(self, index, value):
+        '''
+        Insert a value before the given index of the ExpandingBuffer.
+
+        :param integer index: the index to insert the value before
+        :param number value: a value to insert into the ExpandingBuffer
+        :returns None:
+        '''
+        assert 0 <= index <= self._index
+        self.append(value)  # make room for the value
+        self._buffer[index + 1:self._index] = \
+            self._buffer[index:self._index - 1].copy()
+        self._buffer[index] = value
+
     def extend(self, iterable):
         '''
-        Extend the ExpandingBuffer with the values in iterable.
+        Extend the ExpandingBuffer with the values in iterable. numpy
+        arrays are copied in at once.
 
         :param sequence iterable: a sequency of values to append
         :returns None:
         '''
-        for v in iterable:
-            self.append(v)
+        if not isinstance(iterable, np.ndarray):
+            for v in iterable:
+                self.append(v)
+            return
+        size = self._index + iterable.size
+        if size > self._size:
+            # get a new buffer that's at least 2x longer
+            old_buffer = self._buffer
+            self._size = max(self._size * 2, size)
+            self._buffer = np.empty(self._size, dtype=self.dtype)
+            self._buffer[:self._index] = old_buffer[:self._index]
+        self._buffer[self._index:size] = iterable.ravel()
+        self._index = size
+
+    def truncate(self, size):
+        '''
+        Removes the values after the first size values.
+
+        :param integer size: the number of values to keep
+        :returns None:
+        '''
+        assert size >= 0
+        self._index = min(self._index, size)
 
     def get(self):
         '''
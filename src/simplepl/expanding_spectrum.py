@@ -22,52 +22,71 @@
 # std lib imports
 
 # third party imports
-import logging
-log = logging.getLogger(__name__)
-from PySide import QtCore
 import numpy as np
 
 # local imports
 from measured_spectrum import MeasuredSpectrum
-from expanding_buffer import ExpandingBuffer
+from spectrum_data import SpectrumBuffer
 
 
 class ExpandingSpectrum(MeasuredSpectrum):
+    '''
+    A growing spectrum for live plotting. The points are stored in a
+    SpectrumBuffer, and sigChanged is emitted after each new point.
+    SpectraPlotItem coalesces these, so appending quickly is fine.
+    '''
 
-    def __init__(self, sysresParser=None, **kwargs):
+    def __init__(self, sysres=None, **kwargs):
         super(ExpandingSpectrum, self).__init__(**kwargs)
-        self.sysresParser = sysresParser
-        self._wavelength = ExpandingBuffer()
-        self._energy = ExpandingBuffer()
-        self._rawSignal = ExpandingBuffer()
-        self._phase = ExpandingBuffer()
-        self._signal = ExpandingBuffer()
-
-    def append(self, wavelength, rawSignal, phase):
-        if self.sysresParser is None:
-            log.warning("No sysrem response provided. Using raw value.")
-            signal = rawSignal
-        else:
-            sysres = self.sysresParser.getSysRes(wavelength)
-            signal = rawSignal / sysres
-        self._wavelength.append(wavelength)
-        self._signal.append(signal)
-        self._rawSignal.append(rawSignal)
-        self._phase.append(phase)
-        self._energy.append(1239.842 / wavelength)
-        self.sigChanged.emit()
+        self._data = SpectrumBuffer(sysres)
+        self._rewrites = 0
+
+    @property
+    def sysres(self):
+        return self._data.sysres
+
+    def append(self, wavelength, rawSignal, phase, timestamp=None,
+               settleTime=np.nan):
+        with self._derived.changing():
+            self._data.append(wavelength, rawSignal, phase, timestamp,
+                              settleTime)
+        self._changed()
+
+    def insert(self, wavelength, rawSignal, phase, timestamp=None,
+               settleTime=np.nan):
+        '''
+        Inserts a point so that the wavelengths stay in the same
+        (ascending or descending) order as the existing points.
+        '''
+        with self._derived.changing():
+            self._data.insert(wavelength, rawSignal, phase, timestamp,
+                              settleTime)
+            self._rewrites += 1
+        self._changed()
+
+    def getRewriteCount(self):
+        return self._rewrites
 
     def getWavelength(self):
-        return self._wavelength.get()
+        return self._data.getWavelength()
 
     def getSignal(self):
-        return self._signal.get()
+        return self._data.getSignal()
 
     def getRawSignal(self):
-        return self._rawSignal.get()
+        return self._data.getRawSignal()
 
     def getPhase(self):
-        return self._phase.get()
+        return self._data.getPhase()
 
     def getEnergy(self):
-        return self._energy.get()
+        return self._data.getEnergy()
+
+    def getTime(self):
+        '''
+        Returns the time.time() timestamp of each point.
+        '''
+        return self._data.getTime()
+
+    def getSettleTime(self):
+        return self._data.getSettleTime()
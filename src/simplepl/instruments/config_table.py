@@ -0,0 +1,129 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Defines the ConfigTable class--a compiled, in-memory copy of the
+spectrometer grating and filter configs.
+'''
+
+# third party imports
+import numpy as np
+
+
+class ConfigTable(object):
+    '''
+    The grating and filter configs, compiled into numpy arrays so that the
+    target grating and filter for one or many wavelengths can be looked up
+    without reading the QSettings.
+
+    Config i covers the wavelengths in (wavelengths[i], wavelengths[i + 1]],
+    with wavelengths[0] itself included in config 0.
+    '''
+
+    def __init__(self, wavelengths, gratings, filters):
+        '''
+        Parameters
+        ----------
+        wavelengths : list of floats of length N
+        gratings : list of ints of length (N - 1)
+        filters : list of ints of length (N - 1)
+        '''
+        self.wavelengths = np.array(wavelengths, dtype=np.float64)
+        self.gratings = np.array(gratings, dtype=np.int64)
+        self.filters = np.array(filters, dtype=np.int64)
+        self._upperEdges = self.wavelengths[1:]
+
+    @classmethod
+    def fromSettings(cls, settings):
+        '''
+        Reads the 'spectrometer/configs' array from a QSettings object.
+        '''
+        wavelengths = []
+        gratings = []
+        filters = []
+        size = settings.beginReadArray('spectrometer/configs')
+        for i in xrange(size):
+            settings.setArrayIndex(i)
+            wavelengths.append(float(settings.value('wavelength')))
+            if i < size - 1:
+                gratings.append(int(settings.value('grating')))
+                filters.append(int(settings.value('filter')))
+        settings.endArray()
+        return cls(wavelengths, gratings, filters)
+
+    def getConfigs(self):
+        '''
+        Returns
+        -------
+        wavelengths : list of floats of length N
+        gratings : list of ints of length (N - 1)
+        filters : list of ints of length (N - 1)
+        '''
+        return (self.wavelengths.tolist(),
+                self.gratings.tolist(),
+                self.filters.tolist())
+
+    def getMinWavelength(self, default=0.):
+        if len(self.wavelengths) == 0:
+            return default
+        return float(self.wavelengths[0])
+
+    def getMaxWavelength(self, default=10000.):
+        if len(self.wavelengths) == 0:
+            return default
+        return float(self.wavelengths[-1])
+
+    def indicesFor(self, wavelengths):
+        '''
+        Returns the config index for each of the given wavelengths.
+
+        Raises ValueError if any of the wavelengths are outside the
+        configured range.
+        '''
+        wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        if len(self.wavelengths) < 2:
+            raise ValueError('no grating and filter configs')
+        if np.any(wavelengths < self.wavelengths[0]):
+            raise ValueError('wavelengths shorter than {} are not supported'
+                             ''.format(self.wavelengths[0]))
+        if np.any(wavelengths > self.wavelengths[-1]):
+            raise ValueError('wavelengths longer than {} are not supported'
+                             ''.format(self.wavelengths[-1]))
+        return np.searchsorted(self._upperEdges, wavelengths, side='left')
+
+    def targetFor(self, wavelength):
+        '''
+        Returns the target (grating, filter) for a single wavelength.
+        '''
+        wavelength = float(wavelength)
+        if (len(self.wavelengths) < 2 or
+                not self.wavelengths[0] <= wavelength <= self.wavelengths[-1]):
+            self.indicesFor(wavelength)  # raises the appropriate ValueError
+        i = self._upperEdges.searchsorted(wavelength)
+        return int(self.gratings[i]), int(self.filters[i])
+
+    def targetsFor(self, wavelengths):
+        '''
+        Returns arrays of the target gratings and filters for an array of
+        wavelengths.
+        '''
+        indices = self.indicesFor(wavelengths)
+        return self.gratings[indices], self.filters[indices]
+
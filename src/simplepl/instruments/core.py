@@ -0,0 +1,694 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Thread-safe, Qt-free interfaces to the instruments. These are used
+directly by headless scripts, and wrapped by the Qt classes in
+spectrometer.py and lockin.py, which turn the callbacks into Signals.
+'''
+
+# std lib imports
+import threading
+
+# local imports
+from .config_table import ConfigTable
+
+
+def _ignore(*args):
+    pass
+
+
+class SpectrometerCore(object):
+    '''
+    Provides a thread-safe interface to the spectrometer and filter wheel
+    drivers.
+
+    The grating, filter and wavelength are cached. Changes are reported
+    through the following callbacks, which do nothing by default:
+
+        onChangingGrating(), onChangingFilter(), onChangingWavelength()
+        onGrating(int), onFilter(int), onWavelength(float)
+    '''
+
+    def __init__(self, spectrometer, filterWheel, settings):
+        self._spectrometerLock = threading.Lock()
+        self._spectrometer = spectrometer
+        self._filterWheelLock = threading.Lock()
+        self._filterWheel = filterWheel
+        self._settings = settings
+        self._configTable = ConfigTable.fromSettings(settings)
+
+        # Initialized cached values
+        self._grating = None
+        self._filter = None
+        self._wavelength = None
+
+        self.onChangingGrating = _ignore
+        self.onChangingFilter = _ignore
+        self.onChangingWavelength = _ignore
+        self.onGrating = _ignore
+        self.onFilter = _ignore
+        self.onWavelength = _ignore
+
+    def getGratingCount(self):
+        return 9
+
+    def getFilterCount(self):
+        return 6
+
+    def getGrating(self):
+        if self._grating is not None:
+            return self._grating
+        with self._spectrometerLock:
+            result = self._spectrometer.get_grating()
+        self._grating = result
+        self.onGrating(result)
+        return result
+
+    def setGrating(self, i):
+        self._grating = None
+        self.onChangingGrating()
+        with self._spectrometerLock:
+            self._spectrometer.set_grating(i)
+        self.getGrating()  # read and report the resulting grating
+
+    def getFilter(self):
+        if self._filter is not None:
+            return self._filter
+        with self._filterWheelLock:
+            result = self._filterWheel.get_filter()
+        self._filter = result
+        self.onFilter(result)
+        return result
+
+    def setFilter(self, i):
+        self._filter = None
+        self.onChangingFilter()
+        with self._filterWheelLock:
+            self._filterWheel.set_filter(i)
+        self.getFilter()  # read and report the resulting filter
+
+    def _setAndGetFilter(self, i):
+        with self._filterWheelLock:
+            self._filterWheel.set_filter(i)
+            return self._filterWheel.get_filter()
+
+    def setGratingAndFilter(self, grating, filter):
+        '''
+        Changes the grating and filter in parallel.
+        '''
+        self._filter = None
+        self.onChangingFilter()
+        filterChanger = self._filterWheel.call_async(self._setAndGetFilter,
+                                                     filter)
+        self.setGrating(grating)
+        result = filterChanger.wait()
+        self._filter = result
+        self.onFilter(result)
+
+    def setGratingAndFilterFor(self, wavelength):
+        '''
+        Changes the grating and/or filter to those configured for the
+        given wavelength, if needed. Returns True if either was changed.
+        '''
+        targetGrating, targetFilter = self._configTable.targetFor(wavelength)
+        return self.changeGratingAndFilter(targetGrating, targetFilter)
+
+    def changeGratingAndFilter(self, grating, filter):
+        '''
+        Changes the grating and/or filter, if needed. If both need to be
+        changed, they are changed in parallel. Returns True if either was
+        changed.
+        '''
+        if self.getGrating() != grating:
+            if self.getFilter() != filter:
+                self.setGratingAndFilter(grating, filter)
+            else:
+                self.setGrating(grating)
+        elif self.getFilter() != filter:
+            self.setFilter(filter)
+        else:
+            return False
+        return True
+
+    def getWavelength(self):
+        '''
+        Returns the current wavelength in nm.
+        '''
+        if self._wavelength is not None:
+            return self._wavelength
+        with self._spectrometerLock:
+            result = self._spectrometer.get_wavelength()
+        self._wavelength = result
+        self.onWavelength(result)
+        return result
+
+    def setWavelength(self, wavelength):
+        '''
+        Changes the grating and/or filter if needed, and goes to the given
+        wavelength.
+        '''
+        self._wavelength = None
+        self.onChangingWavelength()
+        self.setGratingAndFilterFor(wavelength)
+        self.moveTo(wavelength)
+
+    def moveTo(self, wavelength):
+        '''
+        Goes to the given wavelength without changing the grating or
+        filter.
+        '''
+        self._wavelength = None
+        self.onChangingWavelength()
+        with self._spectrometerLock:
+            self._spectrometer.goto(wavelength)
+        self.getWavelength()  # read and report the resulting wavelength
+
+    def startMoveTo(self, wavelength):
+        '''
+        Starts moving to the given wavelength without changing the grating
+        or filter, and returns immediately. Call the returned object's
+        wait() method before using the spectrometer again. After wait()
+        returns, its elapsed attribute is the duration of the move.
+        '''
+        return self._spectrometer.call_async(self.moveTo, wavelength)
+
+    def scanTo(self, wavelength, rate):
+        '''
+        Starts a continuous scan to the given wavelength (in nm) at the
+        given rate (in nm/min), and returns immediately. The grating and
+        filter are not changed, so the scan should not cross a grating or
+        filter boundary.
+        '''
+        self._wavelength = None
+        self.onChangingWavelength()
+        with self._spectrometerLock:
+            self._spectrometer.scanto(wavelength, rate)
+
+    def getPosition(self):
+        '''
+        Reads the current wavelength in nm from the spectrometer, even
+        while scanning.
+        '''
+        with self._spectrometerLock:
+            result = self._spectrometer.get_position()
+        self.onWavelength(result)
+        return result
+
+    def getScanProgress(self):
+        '''
+        Reads the current wavelength in nm, and whether the current scanTo
+        operation is done. This takes fewer queries than calling
+        getPosition() and isScanDone().
+        '''
+        with self._spectrometerLock:
+            result, done = self._spectrometer.get_scan_progress()
+        self.onWavelength(result)
+        return result, done
+
+    def waitForScan(self, interval=None):
+        '''
+        Waits until the current scanTo operation is done, reporting the
+        position through onWavelength every interval seconds (default: the
+        'spectrometer/progress_interval' setting, or 0.1 s).
+        '''
+        if interval is None:
+            interval = float(self._settings.value(
+                                    'spectrometer/progress_interval', 0.1))
+        with self._spectrometerLock:
+            self._spectrometer.wait_until_done(callback=self.onWavelength,
+                                               interval=interval)
+
+    def isScanDone(self):
+        '''
+        Returns True if the current scanTo operation is done.
+        '''
+        with self._spectrometerLock:
+            return self._spectrometer.is_done()
+
+    def abortScan(self):
+        '''
+        Stops the current scanTo operation.
+        '''
+        with self._spectrometerLock:
+            self._spectrometer.abort_scan()
+        self._wavelength = None
+        self.getWavelength()  # read and report the resulting wavelength
+
+    def cancelIO(self):
+        '''
+        Makes the spectrometer and filter wheel operations in progress
+        raise a CancelledError, without waiting for them to finish.
+        Further operations raise a CancelledError until resumeIO() is
+        called. This is safe to call from any thread.
+        '''
+        self._spectrometer.cancel_io()
+        self._filterWheel.cancel_io()
+
+    def close(self):
+        '''
+        Closes the spectrometer and filter wheel, and stops their I/O
+        threads.
+        '''
+        self._spectrometer.close()
+        self._filterWheel.close()
+
+    def resumeIO(self):
+        self._spectrometer.resume_io()
+        self._filterWheel.resume_io()
+        # the cancelled operations may have left the cache stale
+        self._grating = None
+        self._filter = None
+        self._wavelength = None
+
+    def getConfigTable(self):
+        '''
+        Returns the compiled ConfigTable of the current configs.
+        '''
+        return self._configTable
+
+    def getConfigs(self):
+        '''
+        Returns
+        -------
+        wavelengths : list of floats of length N
+        gratings : list of ints of length (N - 1)
+        filters : list of ints of length (N - 1)
+        '''
+        return self._configTable.getConfigs()
+
+    def setConfigs(self, wavelengths, gratings, filters):
+        '''
+        Parameters
+        ----------
+        wavelengths : list of floats of length N
+        gratings : list of ints of length (N - 1)
+        filters : list of ints of length (N - 1)
+        '''
+        assert wavelengths == sorted(wavelengths)
+        size = len(wavelengths)
+        self._settings.beginWriteArray('spectrometer/configs', size=size)
+        for i in xrange(size - 1):
+            self._settings.setArrayIndex(i)
+            self._settings.setValue('wavelength', wavelengths[i])
+            self._settings.setValue('grating', gratings[i])
+            self._settings.setValue('filter', filters[i])
+        self._settings.setArrayIndex(size - 1)
+        self._settings.setValue('wavelength', wavelengths[size - 1])
+        self._settings.endArray()
+        self._settings.sync()
+        self._configTable = ConfigTable(wavelengths, gratings, filters)
+        return wavelengths, gratings, filters
+
+    def getMinWavelength(self):
+        return self._configTable.getMinWavelength()
+
+    def getMaxWavelength(self):
+        return self._configTable.getMaxWavelength()
+
+    def setEntranceMirror(self, s):
+        if s == 'Front':
+            with self._spectrometerLock:
+                self._spectrometer.set_entrance_mirror_front()
+        elif s == 'Side':
+            with self._spectrometerLock:
+                self._spectrometer.set_entrance_mirror_side()
+        else:
+            raise ValueError('Unkown entrance mirror position: {}'.format(s))
+
+    def setExitMirror(self, s):
+        if s == 'Front':
+            with self._spectrometerLock:
+                self._spectrometer.set_exit_mirror_front()
+        elif s == 'Side':
+            with self._spectrometerLock:
+                self._spectrometer.set_exit_mirror_side()
+        else:
+            raise ValueError('Unkown exit mirror position: {}'.format(s))
+
+
+class LockinCore(object):
+    '''
+    Provides a thread-safe interface to the lock-in driver.
+
+    New values are reported through the following callbacks, which do
+    nothing by default:
+
+        onRawSignal(float), onPhase(float)
+        onTimeConstantIndex(int), onTimeConstantSeconds(float)
+    '''
+
+    def __init__(self, inst):
+        self._instLock = threading.Lock()
+        self._inst = inst
+
+        self.onRawSignal = _ignore
+        self.onPhase = _ignore
+        self.onTimeConstantIndex = _ignore
+        self.onTimeConstantSeconds = _ignore
+
+    def getTimeConstantLabelsList(self):
+        with self._instLock:
+            return self._inst.time_constant_labels
+
+    def getTimeConstantSecondsList(self):
+        with self._instLock:
+            return self._inst.time_constant_seconds
+
+    def getTimeConstantIndex(self):
+        with self._instLock:
+            i = self._inst.get_time_constant_index()
+        self.onTimeConstantIndex(i)
+        return i
+
+    def getTimeConstantSeconds(self):
+        '''
+        Returns the time constant in seconds.
+        '''
+        i = self.getTimeConstantIndex()
+        seconds = self.getTimeConstantSecondsList()[i]
+        self.onTimeConstantSeconds(seconds)
+        return seconds
+
+    def setTimeConstantIndex(self, i):
+        with self._instLock:
+            self._inst.set_time_constant_index(i)
+
+    def setReserveModeIndex(self, i):
+        with self._instLock:
+            self._inst.set_reserve_mode(i)
+
+    def setInputLineFilterIndex(self, i):
+        with self._instLock:
+            self._inst.set_input_line_filter(i)
+
+    def invalidateCache(self):
+        '''
+        Forgets the cached lock-in settings, so that they are read from the
+        lock-in again. Use this if the settings may have been changed
+        from the front panel.
+        '''
+        with self._instLock:
+            self._inst.invalidate_cache()
+
+    def getWastedSettleCount(self):
+        '''
+        Returns the number of settle periods wasted on sensitivity changes
+        so far.
+        '''
+        return self._inst.wasted_settle_count
+
+    def getQueryCount(self):
+        '''
+        Returns the number of queries sent to the lock-in so far.
+        '''
+        return self._inst.query_count
+
+    def cancelIO(self):
+        '''
+        Makes the lock-in operation in progress raise a CancelledError,
+        without waiting for it to finish. Further operations raise a
+        CancelledError until resumeIO() is called. This is safe to call
+        from any thread.
+        '''
+        self._inst.cancel_io()
+
+    def close(self):
+        '''
+        Closes the lock-in, and stops its I/O thread.
+        '''
+        with self._instLock:
+            self._inst.close()
+
+    def resumeIO(self):
+        self._inst.resume_io()
+        # the cancelled operations may have left the cache stale
+        self._inst.invalidate_cache()
+
+    def _report(self, rawSignal, phase):
+        self.onRawSignal(rawSignal)
+        self.onPhase(phase)
+        return rawSignal, phase
+
+    def adjustAndGetOutputs(self, delay, previous=None):
+        '''
+        Adjust the sensitivity and returns the rawSignal and phase.
+
+        Params
+        ------
+        delay : float
+            The delay time in seconds. A delay of 5x the time constant is
+            recommended.
+        previous : numpy.array
+            The previous rawSignal values of the scan, if any. These are
+            used to preselect the sensitivity before measuring.
+        '''
+        with self._instLock:
+            rawSignal, phase = self._inst.adjust_and_get_outputs(delay,
+                                                                 previous)
+        return self._report(rawSignal, phase)
+
+    def settleAndGetOutputs(self, maxDelay=None, previous=None):
+        '''
+        Adjusts the sensitivity and returns the rawSignal, phase, and
+        settle time in seconds, waiting only until the lock-in settles.
+
+        Params
+        ------
+        maxDelay : float or None
+            The longest delay time in seconds. If None, the lock-in's
+            suggested delay for the current time constant and filter slope
+            is used.
+        previous : numpy.array
+            The previous rawSignal values of the scan, if any. These are
+            used to preselect the sensitivity before measuring.
+        '''
+        with self._instLock:
+            rawSignal, phase, settleTime = self._inst.settle_and_get_outputs(
+                                            maxDelay, previous=previous)
+        self._report(rawSignal, phase)
+        return rawSignal, phase, settleTime
+
+    def getOutputs(self):
+        '''
+        Returns the rawSignal and phase without adjusting the sensitivity
+        or waiting.
+        '''
+        with self._instLock:
+            rawSignal, phase = self._inst.get_outputs()
+        return self._report(rawSignal, phase)
+
+    def adjustSensitivity(self, rawSignal):
+        '''
+        Changes the sensitivity if rawSignal is outside of the current
+        range. Returns True if the sensitivity was changed.
+        '''
+        with self._instLock:
+            return self._inst.adjust_sensitivity(rawSignal)
+
+    def getSensitivity(self):
+        '''
+        Returns the full scale of the current sensitivity range.
+        '''
+        with self._instLock:
+            i = self._inst.get_sensitivity_index()
+            return self._inst.get_sensitivities()[i]
+
+    def startBufferedOutputs(self, sampleRate):
+        '''
+        Starts storing the rawSignal and phase in the lock-in's internal
+        buffer at a sample rate of at least sampleRate (in Hz). Returns the
+        actual sample rate in Hz.
+        '''
+        with self._instLock:
+            return self._inst.start_buffered_outputs(sampleRate)
+
+    def pauseBufferedOutputs(self):
+        with self._instLock:
+            self._inst.pause_buffer()
+
+    def getBufferCount(self):
+        '''
+        Returns the number of points stored in the lock-in's buffer.
+        '''
+        with self._instLock:
+            return self._inst.get_buffer_count()
+
+    def getBufferSize(self):
+        '''
+        Returns the maximum number of points the lock-in's buffer can hold.
+        '''
+        return self._inst.buffer_size
+
+    def getBufferedOutputs(self, start=0, count=None):
+        '''
+        Returns the rawSignal and phase numpy arrays stored in the lock-in's
+        buffer, starting at point start. The last point read, if any, is
+        reported through the callbacks.
+        '''
+        with self._instLock:
+            rawSignal, phase = self._inst.get_buffered_outputs(start, count)
+        if rawSignal.size:
+            self._report(float(rawSignal[-1]), float(phase[-1]))
+        return rawSignal, phase
+
+
+# Values of the 'simulate' setting
+SIMULATE_DRIVERS = 1   # use the simulated drivers
+SIMULATE_PROTOCOL = 2  # use the real drivers with emulated instruments
+
+# The settings that the simulated and emulated lock-in signals are read
+# from (see _getModelSettings)
+MODEL_SETTINGS = ('simulate/model_spectrum', 'simulate/peak_center',
+                  'simulate/peak_fwhm', 'simulate/peak_amplitude',
+                  'simulate/background', 'simulate/noise_density')
+
+_emulated = {}
+_emulatedKeys = {}
+
+
+def _getEmulated(name, factory, key=None):
+    '''
+    Returns the emulated instrument with the given name, so that the
+    emulated lock-in can follow the emulated spectrometer. It is created
+    with factory() the first time, and again whenever key, e.g. the
+    settings it is made from, is different from the last time.
+    '''
+    if name not in _emulated or _emulatedKeys[name] != key:
+        _emulated[name] = factory()
+        _emulatedKeys[name] = key
+    return _emulated[name]
+
+
+def _getSimulatedWavelength(t):
+    '''
+    Returns the wavelength of the simulated spectrometer at time t, or
+    None if it is not open yet, for the simulated lock-in.
+    '''
+    spectrometer = _emulated.get('simSpectrometer')
+    if spectrometer is None:
+        return None
+    return spectrometer.get_position_at(t)
+
+
+def _getModelSettings(settings):
+    '''
+    Returns the model spectrum and the input noise density (in V/sqrt(Hz))
+    of the simulated or emulated lock-in, from the 'simulate/...'
+    settings. See lockin_model.ModelSpectrum.fromSettings.
+    '''
+    from drivers.lockin_model import ModelSpectrum
+    model = ModelSpectrum.fromSettings(settings)
+    noiseDensity = float(settings.value('simulate/noise_density', 1e-8))
+    return model, noiseDensity
+
+
+def openSpectrometer(settings):
+    '''
+    Connects to the spectrometer and filter wheel (or their simulators, if
+    the 'simulate' setting is enabled) using the given settings, and
+    returns a SpectrometerCore. Raises IOError if unable to connect.
+
+    If the 'simulate' setting is SIMULATE_PROTOCOL, the real drivers are
+    connected to emulated instruments (see fake_serial.py).
+    '''
+    simulate = int(settings.value('simulate', False))
+    spectrometerInst = None
+    filterWheelInst = None
+    if simulate == SIMULATE_PROTOCOL:
+        print "Emulating spectrometer and filter wheel..."
+        from drivers.spectra_pro_2500i import SpectraPro2500i
+        from drivers.thorlabs_fw102c import FW102C
+        from drivers.fake_serial import FakeSpectraPro, FakeFW102C
+        spectrometerInst = _getEmulated('spectrometer', FakeSpectraPro)
+        filterWheelInst = _getEmulated('filterWheel', FakeFW102C)
+    elif simulate:
+        print "Simulating spectrometer and filter wheel..."
+        from drivers.spectra_pro_2500i_sim import SpectraPro2500i
+        from drivers.thorlabs_fw102c_sim import FW102C
+    else:
+        from drivers.spectra_pro_2500i import SpectraPro2500i
+        from drivers.thorlabs_fw102c import FW102C
+
+    # Initialize the spectrometer
+    spectrometerPort = int(settings.value('spectrometer/port', 3))
+    try:
+        spectrometer = SpectraPro2500i(port=spectrometerPort,
+                                       inst=spectrometerInst)
+    except:
+        raise IOError('unable to connect to spectrometer at '
+                      'port {}'.format(spectrometerPort))
+    if simulate and simulate != SIMULATE_PROTOCOL:
+        _emulated['simSpectrometer'] = spectrometer
+
+    # Initialize the filter wheel
+    filterWheelPort = int(settings.value('filterWheel/port', 3))
+    try:
+        filterWheel = FW102C(port=filterWheelPort, inst=filterWheelInst)
+    except:
+        raise IOError('unable to connect to filter wheel at '
+                      'port {}'.format(filterWheelPort))
+
+    return SpectrometerCore(spectrometer, filterWheel, settings)
+
+
+def openLockin(settings):
+    '''
+    Connects to the lock-in (or its simulator, if the 'simulate' setting
+    is enabled) using the given settings, and returns a LockinCore.
+    Raises IOError if unable to connect.
+
+    If the 'simulate' setting is SIMULATE_PROTOCOL, the real driver is
+    connected to an emulated lock-in (see fake_visa.py), whose signal
+    follows the emulated spectrometer. The simulated and emulated signals
+    are read from the 'simulate/...' settings (see _getModelSettings).
+    '''
+    simulate = int(settings.value('simulate', False))
+    inst = None
+    if simulate == SIMULATE_PROTOCOL:
+        print "Emulating lock-in..."
+        from drivers.srs_sr830 import SR830
+        from drivers.fake_serial import FakeSpectraPro
+        from drivers.fake_visa import FakeSR830
+        spectrometer = _getEmulated('spectrometer', FakeSpectraPro)
+        model, noiseDensity = _getModelSettings(settings)
+        inst = _getEmulated('lockin',
+                            lambda: FakeSR830(spectrometer=spectrometer,
+                                              model=model,
+                                              noiseDensity=noiseDensity),
+                            key=tuple(settings.value(name)
+                                      for name in MODEL_SETTINGS))
+    elif simulate:
+        print "Simulating lock-in..."
+        from drivers.srs_sr830_sim import SR830
+    else:
+        from drivers.srs_sr830 import SR830
+
+    lockinPort = settings.value('lockin/port', 'GPIB::8')
+    try:
+        lockin = SR830(port=lockinPort, inst=inst)
+    except:
+        raise IOError('Unable to connect to lock-in at port {}'
+                      ''.format(lockinPort))
+    if simulate and simulate != SIMULATE_PROTOCOL:
+        model, noiseDensity = _getModelSettings(settings)
+        lockin.init_output_generator(model, _getSimulatedWavelength,
+                                     noiseDensity)
+    return LockinCore(lockin)
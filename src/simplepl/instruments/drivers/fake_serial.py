@@ -0,0 +1,310 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Fake serial ports for testing the drivers without the instruments.
+
+A FakeSerial has the parts of the serial.Serial interface that the
+drivers use. Each command written to it is handled by the emulated
+instrument, one at a time, and the response becomes readable after the
+time the instrument takes to execute the command, plus the time it takes
+to send the command and response at the port's baud rate.
+'''
+
+# std lib imports
+import threading
+import time
+
+
+class FakeSerial(object):
+    '''
+    A fake serial port. Subclasses emulate an instrument by implementing
+    handle(command, t), which is called with each command (without the
+    terminator) and the time at which the instrument starts executing
+    it. It returns (response, duration), where duration is the time in
+    seconds that the command takes to execute.
+
+    Parameters
+    ----------
+    baudrate : int
+    timeout : float or None
+        the read timeout in seconds, as for serial.Serial
+    terminator : str
+        the end of each command
+    '''
+
+    def __init__(self, baudrate=9600, timeout=None, terminator='\r'):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.terminator = terminator
+        self._lock = threading.Lock()
+        self._command = ''    # the partially written command
+        self._pending = []    # list of (ready time, response)
+        self._input = ''      # the responses that can be read
+        self._busyUntil = 0.  # when the instrument can start a command
+        self._open = True
+
+    def _transferTime(self, data):
+        # 8 data bits, 1 start bit and 1 stop bit per byte
+        return len(data) * 10. / self.baudrate
+
+    def handle(self, command, t):
+        raise NotImplementedError()
+
+    def write(self, data):
+        now = time.time()
+        with self._lock:
+            self._command += data
+            while self.terminator in self._command:
+                command, self._command = self._command.split(
+                                                    self.terminator, 1)
+                start = max(now + self._transferTime(command +
+                                                     self.terminator),
+                            self._busyUntil)
+                response, duration = self.handle(command, start)
+                done = start + duration
+                self._busyUntil = done
+                ready = done + self._transferTime(response)
+                self._pending.append((ready, response))
+        return len(data)
+
+    def _release(self, now):
+        while self._pending and self._pending[0][0] <= now:
+            self._input += self._pending.pop(0)[1]
+
+    def _nextReadyTime(self):
+        if self._pending:
+            return self._pending[0][0]
+        return None
+
+    def _wait(self, deadline):
+        '''
+        Sleeps until more data may be ready, or the deadline. Returns False
+        if the deadline has passed.
+        '''
+        now = time.time()
+        if deadline is not None and now >= deadline:
+            return False
+        with self._lock:
+            ready = self._nextReadyTime()
+        if ready is None:
+            ready = now + 0.01  # wait for a write from another thread
+        if deadline is not None:
+            ready = min(ready, deadline)
+        time.sleep(max(ready - now, 0.))
+        return True
+
+    def readline(self):
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        while True:
+            with self._lock:
+                self._release(time.time())
+                i = self._input.find('\n')
+                if i >= 0:
+                    line, self._input = (self._input[:i + 1],
+                                         self._input[i + 1:])
+                    return line
+            if not self._wait(deadline):
+                with self._lock:
+                    line, self._input = self._input, ''
+                return line
+
+    def read(self, size=1):
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        while True:
+            with self._lock:
+                self._release(time.time())
+                if len(self._input) >= size:
+                    data, self._input = (self._input[:size],
+                                         self._input[size:])
+                    return data
+            if not self._wait(deadline):
+                with self._lock:
+                    data, self._input = self._input, ''
+                return data
+
+    def inWaiting(self):
+        with self._lock:
+            self._release(time.time())
+            return len(self._input)
+
+    def flushInput(self):
+        with self._lock:
+            self._release(time.time())
+            self._input = ''
+
+    def isOpen(self):
+        return self._open
+
+    def close(self):
+        self._open = False
+
+
+class FakeSpectraPro(FakeSerial):
+    '''
+    Emulates a SpectraPro 2500i monochromator on a 9600 baud port.
+
+    Parameters
+    ----------
+    gotoRate : float
+        the speed of GOTO moves in nm/s
+    gratingTime : float
+        the time it takes to change the grating in seconds
+    '''
+
+    def __init__(self, gotoRate=1000., gratingTime=20., **kwargs):
+        kwargs.setdefault('baudrate', 9600)
+        super(FakeSpectraPro, self).__init__(**kwargs)
+        self.gotoRate = gotoRate
+        self.gratingTime = gratingTime
+        self.nm = 0.
+        self.nm_per_min = 100.
+        self.grating = 1
+        self.turret = 1
+        self.entranceMirror = 'FRONT'
+        self.exitMirror = 'FRONT'
+        self._scan = None  # (start time, start nm, stop nm)
+
+    def getPosition(self, t):
+        '''
+        Returns the position in nm at time t.
+        '''
+        if self._scan is None:
+            return self.nm
+        t0, start, stop = self._scan
+        delta = self.nm_per_min * max(t - t0, 0.) / 60.
+        if stop >= start:
+            return min(start + delta, stop)
+        else:
+            return max(start - delta, stop)
+
+    def _stopScan(self, t):
+        self.nm = self.getPosition(t)
+        self._scan = None
+
+    def _isDone(self, t):
+        return self._scan is None or self.getPosition(t) == self._scan[2]
+
+    def handle(self, command, t):
+        words = command.split()
+        name = words[-1].upper() if words else ''
+        duration = 0.
+        data = None
+        if name == '*IDN?':
+            data = 'SpectraPro 2500i'
+        elif name == 'MODEL':
+            data = 'SP-2-500i'
+        elif name == 'SERIAL':
+            data = '25001234'
+        elif name == '?NM':
+            data = '%.3f nm' % self.getPosition(t)
+        elif name == '?NM/MIN':
+            data = '%.2f nm/min' % self.nm_per_min
+        elif name == 'MONO-?DONE':
+            data = '%d' % self._isDone(t)
+        elif name == 'MONO-STOP':
+            self._stopScan(t)
+        elif name == 'NM/MIN':
+            self.nm_per_min = float(words[0])
+        elif name == 'GOTO':
+            self._stopScan(t)
+            nm = float(words[0])
+            duration = abs(nm - self.nm) / self.gotoRate
+            self.nm = nm
+        elif name == '>NM':
+            self._stopScan(t)
+            self._scan = (t, self.nm, float(words[0]))
+        elif name == 'NM':
+            self._stopScan(t)
+            nm = float(words[0])
+            duration = abs(nm - self.nm) / self.nm_per_min * 60.
+            self.nm = nm
+        elif name == '?GRATING':
+            data = '%d' % self.grating
+        elif name == 'GRATING':
+            i = int(words[0])
+            if i != self.grating:
+                duration = self.gratingTime
+            self.grating = i
+        elif name == '?GRATINGS':
+            lines = ['\r\n']
+            for i in xrange(1, 10):
+                mark = '\x1a' if i == self.grating else ' '
+                lines.append('%s%d  300 g/mm BLZ=  2.0UM \r\n' % (mark, i))
+            lines.append(' ok\r\n')
+            return ''.join(lines), duration
+        elif name == '?TURRET':
+            data = '%d' % self.turret
+        elif name == 'TURRET':
+            self.turret = int(words[0])
+        elif name in ('FRONT', 'SIDE') and words[0] == 'ENT-MIRROR':
+            self.entranceMirror = name
+        elif name in ('FRONT', 'SIDE') and words[0] == 'EXIT-MIRROR':
+            self.exitMirror = name
+        else:
+            data = '?'
+        if data is None:
+            return '%s  ok\r\n' % command, duration
+        return '%s %s  ok\r\n' % (command, data), duration
+
+
+class FakeFW102C(FakeSerial):
+    '''
+    Emulates a ThorLabs FW102C filter wheel on a 115200 baud port. Each
+    command is echoed, followed by the response, if any, and a '>'
+    prompt.
+
+    Parameters
+    ----------
+    moveTime : float
+        the time it takes to move by one position in seconds
+    '''
+
+    positionCount = 6
+
+    def __init__(self, moveTime=0.5, **kwargs):
+        kwargs.setdefault('baudrate', 115200)
+        super(FakeFW102C, self).__init__(**kwargs)
+        self.moveTime = moveTime
+        self.position = 1
+
+    def handle(self, command, t):
+        duration = 0.
+        if command == '*idn?':
+            data = 'THORLABS FW102C/FW212C Filter Wheel version 1.01'
+        elif command == 'pos?':
+            data = '%d' % self.position
+        elif command.startswith('pos='):
+            i = int(command[4:])
+            # the wheel turns the shortest way around
+            steps = abs(i - self.position)
+            steps = min(steps, self.positionCount - steps)
+            duration = steps * self.moveTime
+            self.position = i
+            data = None
+        else:
+            data = 'Command error'
+        if data is None:
+            return '%s\r>' % command, duration
+        return '%s\r%s\r>' % (command, data), duration
@@ -0,0 +1,361 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Fake VISA instruments for testing the drivers without the instruments.
+
+A FakeVisaInstrument has the parts of the visa.instrument interface that
+the drivers use. Like a GPIB instrument, each write and read blocks for
+the bus turnaround and transfer time, and each command is executed by
+the emulated instrument one at a time.
+'''
+
+# std lib imports
+import re
+import struct
+import threading
+import time
+
+# third party imports
+import numpy as np
+
+# local imports
+from lockin_model import LockinFilter, ModelSpectrum
+from transport import TimeoutException
+
+# Serial poll status byte bits
+STB_SCN = 1 << 0
+STB_IFC = 1 << 1
+STB_MAV = 1 << 4
+
+
+def pack_lia(data):
+    '''
+    Packs the data in the SR830's internal format, as transferred by
+    TRCL: a 16 bit mantissa and exponent per point, with the value
+    m * 2 ** (e - 124).
+    '''
+    data = np.asarray(data, dtype=np.float64)
+    exponent = np.zeros(data.size, dtype=np.int16)
+    nonzero = data != 0
+    exponent[nonzero] = (np.floor(np.log2(np.abs(data[nonzero])))
+                         + 124 - 14)
+    mantissa = np.round(data / 2. ** (exponent - 124.))
+    pairs = np.empty(data.size * 2, dtype='<i2')
+    pairs[0::2] = mantissa
+    pairs[1::2] = exponent
+    return pairs.tostring()
+
+
+class FakeVisaInstrument(object):
+    '''
+    A fake VISA instrument. Subclasses emulate an instrument by
+    implementing handle(command, t), which is called with each command
+    and the time at which the instrument starts executing it. It returns
+    (response, duration), where response is None for commands without a
+    response, and duration is the time in seconds that the command takes
+    to execute.
+
+    Parameters
+    ----------
+    turnaround : float
+        the bus overhead of each write or read in seconds
+    byteRate : float
+        the transfer rate in bytes per second
+    timeout : float
+        the read timeout in seconds
+    '''
+
+    termination = '\n'
+
+    def __init__(self, turnaround=0.003, byteRate=1e5, timeout=5.):
+        self.turnaround = turnaround
+        self.byteRate = byteRate
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._pending = []    # list of (ready time, response)
+        self._busyUntil = 0.  # when the instrument can start a command
+
+    def _transfer(self, data):
+        time.sleep(self.turnaround + len(data) / self.byteRate)
+
+    def handle(self, command, t):
+        raise NotImplementedError()
+
+    def write(self, command):
+        self._transfer(command)
+        with self._lock:
+            start = max(time.time(), self._busyUntil)
+            response, duration = self.handle(command, start)
+            self._busyUntil = start + duration
+            if response is not None:
+                self._pending.append((self._busyUntil, response))
+
+    def read_raw(self):
+        with self._lock:
+            if not self._pending:
+                response = None
+            else:
+                ready, response = self._pending.pop(0)
+        if response is None:
+            time.sleep(self.timeout)
+            raise TimeoutException('no response within {} s'
+                                   ''.format(self.timeout))
+        time.sleep(max(ready - time.time(), 0.))
+        self._transfer(response)
+        return response
+
+    def read(self):
+        return self.read_raw().rstrip(self.termination)
+
+    def ask(self, command):
+        self.write(command)
+        return self.read()
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+
+    @property
+    def stb(self):
+        with self._lock:
+            stb = 0
+            if time.time() >= self._busyUntil:
+                stb |= STB_IFC
+            if self._pending:
+                stb |= STB_MAV
+            return stb
+
+    def close(self):
+        pass
+
+
+class FakeSR830(FakeVisaInstrument):
+    '''
+    Emulates an SRS SR830 lock-in amplifier on GPIB.
+
+    Parameters
+    ----------
+    signal : callable or None
+        returns the input signal amplitude in V (or A) at time t. If None,
+        the model spectrum at the spectrometer's position is used.
+    spectrometer : FakeSpectraPro or None
+        the emulated spectrometer that the default signal follows. If
+        None, the signal is the model spectrum at its center.
+    model : ModelSpectrum or None
+        the model spectrum of the default signal
+    noiseDensity : float
+        the input noise density in V/sqrt(Hz)
+
+    The outputs are the signal passed through the selected output filter
+    (see lockin_model.LockinFilter). Buffered points are computed when
+    they are stored, so that the filter is evaluated in time order.
+    '''
+
+    bufferSize = 16383
+
+    _intSettings = ('OUTX', 'FMOD', 'RSLP', 'HARM', 'ISRC', 'IGND', 'ICPL',
+                    'ILIN', 'SENS', 'RMOD', 'OFLT', 'OFSL', 'SRAT', 'SEND')
+    _floatSettings = ('PHAS', 'FREQ', 'SLVL')
+
+    def __init__(self, signal=None, spectrometer=None, model=None,
+                 noiseDensity=1e-8, seed=None, **kwargs):
+        super(FakeSR830, self).__init__(**kwargs)
+        if model is None:
+            model = ModelSpectrum()
+        if signal is None:
+            if spectrometer is None:
+                signal = lambda t: model(model.center)
+            else:
+                signal = lambda t: model(spectrometer.getPosition(t))
+        self.signal = signal
+        self._filter = LockinFilter(lambda t: self.signal(t), noiseDensity,
+                                    seed)
+        self.settings = dict(OUTX=1, FMOD=0, RSLP=0, HARM=1, ISRC=0,
+                             IGND=0, ICPL=0, ILIN=0, SENS=22, RMOD=1,
+                             OFLT=8, OFSL=1, SRAT=4, SEND=1,
+                             PHAS=0., FREQ=1000., SLVL=1.)
+        self.display = {1: 0, 2: 0}
+        # buffer state
+        self._bufferT0 = None     # when the first point was stored
+        self._bufferStart = None  # when storage was started or resumed
+        self._bufferElapsed = 0.  # storage time before the last pause
+        self._bufferR = []
+        self._bufferTheta = []
+
+    def getSensitivity(self):
+        i = self.settings['SENS']
+        sensitivity = (2., 5., 10.)[i % 3] * 10. ** (i // 3) * 1e-9
+        if self.settings['ISRC'] >= 2:
+            sensitivity *= 1e-6  # current input
+        return sensitivity
+
+    def getTimeConstant(self):
+        i = self.settings['OFLT']
+        return (1., 3.)[i % 2] * 10. ** (i // 2) * 1e-5
+
+    def getSampleRate(self):
+        return 0.0625 * 2. ** self.settings['SRAT']
+
+    def getOutputs(self, t):
+        '''
+        Returns R and theta at time t. R overloads at 109% of the
+        sensitivity.
+        '''
+        X, Y = self._filter.getOutputs(t, self.getTimeConstant(),
+                                       self.settings['OFSL'])
+        R = min(np.hypot(X, Y), self.getSensitivity() * 1.09)
+        theta = np.degrees(np.arctan2(Y, X)) - self.settings['PHAS']
+        return R, theta
+
+    def _getBufferCount(self, t):
+        elapsed = self._bufferElapsed
+        if self._bufferStart is not None:
+            elapsed += t - self._bufferStart
+        elif not elapsed:
+            return 0
+        return min(int(elapsed * self.getSampleRate()) + 1,
+                   self.bufferSize)
+
+    def _fillBuffer(self, t):
+        '''
+        Stores the points sampled before time t.
+        '''
+        count = self._getBufferCount(t)
+        rate = self.getSampleRate()
+        while len(self._bufferR) < count:
+            R, theta = self.getOutputs(self._bufferT0 +
+                                       len(self._bufferR) / rate)
+            self._bufferR.append(R)
+            self._bufferTheta.append(theta)
+
+    def _getBufferData(self, channel, start, count):
+        R = np.array(self._bufferR[start:start + count])
+        theta = np.array(self._bufferTheta[start:start + count])
+        if channel == 1:
+            return R if self.display[1] else R * np.cos(np.radians(theta))
+        return theta if self.display[2] else R * np.sin(np.radians(theta))
+
+    def handle(self, command, t):
+        m = re.match(r'(\*?[A-Z]+)(\?)?\s*(.*)$', command.strip())
+        if m is None:
+            return None, 0.
+        name, query, args = m.groups()
+        args = [a for a in args.split(',') if a]
+        duration = 0.
+        self._fillBuffer(t)
+        if name == '*IDN' and query:
+            return 'Stanford_Research_Systems,SR830,s/n00000,ver1.07\n', 0.
+        elif name == '*STB' and query:
+            return '%d\n' % self.stb, 0.
+        elif name in self._intSettings:
+            if query:
+                return '%d\n' % self.settings[name], 0.
+            self.settings[name] = int(args[0])
+        elif name in self._floatSettings:
+            if query:
+                return '%g\n' % self.settings[name], 0.
+            self.settings[name] = float(args[0])
+        elif name == 'SNAP' and query:
+            R, theta = self.getOutputs(t)
+            return '%.6e,%.4f\n' % (R, theta), 0.
+        elif name == 'DDEF':
+            self.display[int(args[0])] = int(args[1])
+        elif name == 'AGAN':
+            # pick the sensitivity for the current signal
+            R = abs(self.signal(t))
+            for i in xrange(27):
+                self.settings['SENS'] = i
+                if self.getSensitivity() > R:
+                    break
+            duration = 3.
+        elif name == 'REST':
+            self._bufferStart = None
+            self._bufferElapsed = 0.
+            self._bufferR = []
+            self._bufferTheta = []
+        elif name == 'STRT':
+            if self._bufferStart is None:
+                if not self._bufferElapsed:
+                    self._bufferT0 = t
+                self._bufferStart = t
+        elif name == 'PAUS':
+            if self._bufferStart is not None:
+                self._bufferElapsed += t - self._bufferStart
+                self._bufferStart = None
+        elif name == 'SPTS' and query:
+            return '%d\n' % self._getBufferCount(t), 0.
+        elif name in ('TRCB', 'TRCL') and query:
+            channel, start, count = [int(a) for a in args]
+            data = self._getBufferData(channel, start, count)
+            if name == 'TRCB':
+                return struct.pack('<%df' % count, *data), 0.
+            return pack_lia(data), 0.
+        return None, duration
+
+
+class FakeLakeshore330(FakeVisaInstrument):
+    '''
+    Emulates a Lakeshore 330 temperature controller on GPIB. The
+    temperature ramps toward the setpoint at the ramp rate.
+    '''
+
+    termination = '\r\n'
+
+    def __init__(self, temperature=300., **kwargs):
+        super(FakeLakeshore330, self).__init__(**kwargs)
+        self.temperature = temperature
+        self.setpoint = temperature
+        self.rampRate = 10.  # K/min
+        self._updated = time.time()
+
+    def getTemperature(self, t):
+        dt = max(t - self._updated, 0.)
+        step = self.rampRate * dt / 60.
+        if self.setpoint > self.temperature:
+            return min(self.temperature + step, self.setpoint)
+        else:
+            return max(self.temperature - step, self.setpoint)
+
+    def _update(self, t):
+        self.temperature = self.getTemperature(t)
+        self._updated = t
+
+    def handle(self, command, t):
+        words = command.split()
+        name = words[0].upper()
+        if name == '*IDN?':
+            return 'LSCI,MODEL330,0,032301\r\n', 0.
+        elif name == '*STB?':
+            return '%d\r\n' % self.stb, 0.
+        elif name == 'SDAT?':
+            return '%.2f\r\n' % self.getTemperature(t), 0.
+        elif name == 'HEAT?':
+            # 5% steps, more power for larger errors
+            error = self.setpoint - self.getTemperature(t)
+            heat = 5 * int(min(max(error, 0.), 20.))
+            return '%d\r\n' % heat, 0.
+        elif name == 'SETP':
+            self._update(t)
+            self.setpoint = float(words[1])
+        elif name == 'RAMPR':
+            self._update(t)
+            self.rampRate = float(words[1])
+        return None, 0.
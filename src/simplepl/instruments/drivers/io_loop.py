@@ -0,0 +1,294 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Runs blocking instrument I/O in the background.
+
+Each instrument gets its own channel with one worker thread, so that
+requests to the same instrument run in order, while requests to
+different instruments run concurrently. Submitting a request returns a
+Request, which can be waited on with a timeout, or cancelled.
+'''
+
+# std lib imports
+import sys
+import threading
+import time
+import Queue
+import logging
+log = logging.getLogger(__name__)
+
+# local imports
+from transport import TimeoutException, CancelledError
+
+
+class Request(object):
+    '''
+    The pending result of a function submitted to an IOLoop.
+
+    After wait() returns, elapsed is the duration of the call in seconds.
+    '''
+
+    def __init__(self, func, args, kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        self._cancelled = False
+        self._result = None
+        self._exception = None
+        self._excInfo = None
+        self._callbacks = []
+        self.elapsed = None
+
+    def _run(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._started = True
+        t0 = time.time()
+        try:
+            self._result = self._func(*self._args, **self._kwargs)
+        except Exception as e:
+            self._exception = e
+            # keep the traceback, so wait() can re-raise it from here
+            self._excInfo = sys.exc_info()
+        self.elapsed = time.time() - t0
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def cancel(self):
+        '''
+        Cancels the request if it hasn't started yet. Returns True if it
+        was cancelled.
+        '''
+        with self._lock:
+            if self._started or self._done.isSet():
+                return False
+            self._cancelled = True
+            self._exception = CancelledError()
+        self._finish()
+        return True
+
+    def cancelled(self):
+        return self._cancelled
+
+    def done(self):
+        return self._done.isSet()
+
+    def wait(self, timeout=None):
+        '''
+        Waits for the request to finish, and returns its result.
+
+        Raises a TimeoutException if it doesn't finish within timeout
+        seconds, the request's exception if it failed, or a CancelledError
+        if it was cancelled.
+        '''
+        if timeout is None:
+            self._done.wait()
+        elif not self._done.wait(timeout):
+            raise TimeoutException('request not done within {} s'
+                                   ''.format(timeout))
+        if self._excInfo is not None:
+            raise self._excInfo[0], self._excInfo[1], self._excInfo[2]
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def result(self, timeout=None):
+        return self.wait(timeout)
+
+    def add_done_callback(self, callback):
+        '''
+        Calls callback(request) when the request is done. The callback is
+        called from the channel's thread, or immediately if the request is
+        already done.
+        '''
+        with self._lock:
+            if not self._done.isSet():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+
+class _Channel(object):
+
+    def __init__(self, name):
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._serve, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            request._run()
+
+    def submit(self, request):
+        self._queue.put(request)
+
+    def cancel(self):
+        '''
+        Cancels the requests that haven't started yet.
+        '''
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except Queue.Empty:
+                return
+            if request is None:
+                self._queue.put(None)  # keep the stop request
+                return
+            request.cancel()
+
+    def stop(self):
+        self._queue.put(None)
+
+
+class IOLoop(object):
+    '''
+    Runs functions in the background, one channel per instrument.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def _get_channel(self, key):
+        with self._lock:
+            try:
+                return self._channels[key]
+            except KeyError:
+                name = 'IOLoop-{}'.format(type(key).__name__)
+                channel = self._channels[key] = _Channel(name)
+                return channel
+
+    def submit(self, key, func, *args, **kwargs):
+        '''
+        Calls func(*args, **kwargs) in the thread of the channel for key,
+        usually an instrument, after any requests already submitted for
+        it. Returns a Request.
+        '''
+        request = Request(func, args, kwargs)
+        self._get_channel(key).submit(request)
+        return request
+
+    def cancel(self, key):
+        '''
+        Cancels the requests for key that haven't started yet.
+        '''
+        with self._lock:
+            channel = self._channels.get(key)
+        if channel is not None:
+            channel.cancel()
+
+    def release(self, key):
+        '''
+        Stops the channel thread for key after its pending requests, e.g.
+        when the instrument is closed. Submitting another request for key
+        starts a new channel.
+        '''
+        with self._lock:
+            channel = self._channels.pop(key, None)
+        if channel is not None:
+            channel.stop()
+
+    def close(self):
+        '''
+        Stops the channel threads after their pending requests.
+        '''
+        with self._lock:
+            channels = self._channels.values()
+            self._channels = {}
+        for channel in channels:
+            channel.stop()
+
+
+_io_loop = None
+_io_loop_lock = threading.Lock()
+
+
+def get_io_loop():
+    '''
+    Returns the shared IOLoop.
+    '''
+    global _io_loop
+    with _io_loop_lock:
+        if _io_loop is None:
+            _io_loop = IOLoop()
+        return _io_loop
+
+
+class AsyncIO(object):
+    '''
+    A mixin that adds asynchronous and cancellable I/O to a driver with
+    _ask and _write methods. Drivers that talk through a transport set
+    self._transport, so that cancel_io() also cancels a read in progress.
+    '''
+
+    _transport = None
+
+    def call_async(self, func, *args, **kwargs):
+        '''
+        Starts func(*args, **kwargs), usually a driver method or an
+        operation built on them, in this instrument's channel of the
+        shared IOLoop, after any other asynchronous requests to it.
+        Returns a Request.
+        '''
+        return get_io_loop().submit(self, func, *args, **kwargs)
+
+    def cancel_io(self):
+        '''
+        Cancels the pending asynchronous requests and the read in
+        progress, if any. Further I/O raises a CancelledError until
+        resume_io() is called. This is safe to call from any thread.
+        '''
+        get_io_loop().cancel(self)
+        if self._transport is not None:
+            self._transport.cancel()
+
+    def resume_io(self):
+        if self._transport is not None:
+            self._transport.resume()
+
+    def release_io(self):
+        '''
+        Stops this instrument's channel thread on the shared IOLoop, after
+        its pending requests.
+        '''
+        get_io_loop().release(self)
+
+    def close(self):
+        '''
+        Releases the I/O channel, and closes the transport, if any.
+        '''
+        self.release_io()
+        if self._transport is not None:
+            self._transport.close()
@@ -24,18 +24,25 @@ import logging
 log = logging.getLogger(__name__)
 
 # third party imports
-import visa
+try:
+    import visa
+except ImportError:
+    visa = None  # only needed to open a real instrument
 import numpy as np
 
 # local imports
+from transport import VisaTransport
+from io_loop import AsyncIO
 
 DEBUG = False
 
 #TODO: read and store R and Theta?
-class Lakeshore330(object):
-    def __init__(self, port='GPIB::12'):
+class Lakeshore330(AsyncIO):
+    def __init__(self, port='GPIB::12', inst=None):
         super(Lakeshore330, self).__init__()
-        self._inst = visa.instrument(port)
+        if inst is None:
+            inst = visa.instrument(port)
+        self._transport = VisaTransport(inst)
         # device identification
         id = self._ask('*IDN?').split(',')
         if len(id) < 1 or id[1] != 'MODEL330':
@@ -48,7 +55,7 @@ class Lakeshore330(object):
         self.set_ramp_rate(10)
 
     def _read(self):
-        r = self._inst.read()
+        r = self._transport.read()
         if DEBUG:
             print "<<", r
         return r
@@ -56,7 +63,7 @@ class Lakeshore330(object):
     def _write(self, s):
         if DEBUG:
             print ">>", s
-        self._inst.write(s)
+        self._transport.write(s)
 
     def _ask(self, s):
         self._write(s)
@@ -0,0 +1,186 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Models of the lock-in's input signal and output filter, for the
+simulated and emulated lock-ins.
+'''
+
+# std lib imports
+import math
+
+# third party imports
+import numpy as np
+
+# The equivalent noise bandwidth of the output filter for each filter
+# slope index (6, 12, 18 and 24 dB/oct), times the time constant
+ENBW_FACTORS = (1. / 4., 1. / 8., 3. / 32., 5. / 64.)
+
+# The filter state is only integrated over this many time constants per
+# stage; older inputs have decayed by more than e ** -20.
+HORIZON = 20.
+
+# The maximum number of integration steps per reading
+MAX_STEPS = 500
+
+
+def gaussianPeak(wavelength, center=1550., fwhm=50., amplitude=1e-4,
+                 background=1e-7):
+    '''
+    Returns a Gaussian photoluminescence peak, in V, at the given
+    wavelength in nm.
+    '''
+    sigma = fwhm / (2. * np.sqrt(2. * np.log(2.)))
+    return (amplitude * np.exp(-(wavelength - center) ** 2 /
+                               (2. * sigma ** 2)) + background)
+
+
+class ModelSpectrum(object):
+    '''
+    The simulated signal, in V, as a function of wavelength in nm.
+
+    Either a gaussianPeak, or a spectrum read from a two column text file
+    of wavelength and signal, which is linearly interpolated. The center
+    of a spectrum read from a file is the wavelength of its maximum.
+    '''
+
+    def __init__(self, center=1550., fwhm=50., amplitude=1e-4,
+                 background=1e-7, wavelengths=None, signals=None):
+        self.center = center
+        self.fwhm = fwhm
+        self.amplitude = amplitude
+        self.background = background
+        self.wavelengths = wavelengths
+        self.signals = signals
+        if wavelengths is not None:
+            self.center = wavelengths[np.argmax(signals)]
+
+    @classmethod
+    def fromFile(cls, filepath):
+        data = np.loadtxt(filepath, ndmin=2)
+        order = np.argsort(data[:, 0])
+        return cls(wavelengths=data[order, 0], signals=data[order, 1])
+
+    @classmethod
+    def fromSettings(cls, settings):
+        '''
+        Reads the model from the 'simulate/model_spectrum' setting (a
+        file path) if set, or the 'simulate/peak_center',
+        'simulate/peak_fwhm', 'simulate/peak_amplitude' and
+        'simulate/background' settings.
+        '''
+        filepath = settings.value('simulate/model_spectrum', None)
+        if filepath:
+            return cls.fromFile(filepath)
+        return cls(
+            center=float(settings.value('simulate/peak_center', 1550.)),
+            fwhm=float(settings.value('simulate/peak_fwhm', 50.)),
+            amplitude=float(settings.value('simulate/peak_amplitude', 1e-4)),
+            background=float(settings.value('simulate/background', 1e-7)))
+
+    def __call__(self, wavelength):
+        if self.wavelengths is not None:
+            return np.interp(wavelength, self.wavelengths, self.signals)
+        return gaussianPeak(wavelength, self.center, self.fwhm,
+                            self.amplitude, self.background)
+
+
+class LockinFilter(object):
+    '''
+    Simulates the lock-in's output low pass filter: a cascade of one to
+    four RC stages (6 to 24 dB/oct) with the selected time constant,
+    driven by source(t), the in-phase input signal at time t.
+
+    Noise is added to X and Y with a standard deviation of
+    noiseDensity * sqrt(ENBW), and is correlated over the time constant,
+    as it is at the output of the real filter.
+
+    Readings must be requested in time order. A reading for an earlier
+    time than the last one returns the last reading's filter state.
+    '''
+
+    def __init__(self, source, noiseDensity=1e-8, seed=None):
+        self.source = source
+        self.noiseDensity = noiseDensity
+        self._random = np.random.RandomState(seed)
+        self._t = None
+        self._stages = np.zeros(4)
+        self._noise = np.zeros(2)
+
+    def getNoise(self, timeConstant, slope):
+        '''
+        Returns the standard deviation of the output noise in V.
+        '''
+        enbw = ENBW_FACTORS[slope] / timeConstant
+        return self.noiseDensity * math.sqrt(enbw)
+
+    def _integrate(self, t, timeConstant, stages):
+        horizon = HORIZON * timeConstant * stages
+        if self._t is None or t - self._t > horizon:
+            # Start from the steady state of the input at the horizon
+            self._t = t - horizon
+            self._stages[:] = self.source(self._t)
+        span = t - self._t
+        if span <= 0.:
+            return
+        steps = int(min(max(span / (timeConstant / 5.), 1), MAX_STEPS))
+        dt = span / steps
+        alpha = 1. - math.exp(-dt / timeConstant)
+        y = self._stages
+        for k in xrange(1, steps + 1):
+            x = self.source(self._t + k * dt)
+            for i in xrange(stages):
+                y[i] += alpha * (x - y[i])
+                x = y[i]
+        self._stages[stages:] = y[stages - 1]
+
+    def getOutputs(self, t, timeConstant, slope):
+        '''
+        Returns X and Y in V at time t, for the given time constant in
+        seconds and filter slope index.
+        '''
+        stages = slope + 1
+        last = self._t
+        self._integrate(t, timeConstant, stages)
+        if last is not None and t > last:
+            # Ornstein-Uhlenbeck noise with a correlation time of one
+            # time constant
+            decay = math.exp(-(t - last) / timeConstant)
+            sigma = self.getNoise(timeConstant, slope)
+            self._noise *= decay
+            self._noise += (sigma * math.sqrt(1. - decay ** 2) *
+                            self._random.randn(2))
+        elif last is None:
+            self._noise = (self.getNoise(timeConstant, slope) *
+                           self._random.randn(2))
+        self._t = max(t, self._t)
+        return (self._stages[stages - 1] + self._noise[0], self._noise[1])
+
+
+def getStepResponse(timeConstant, slope, times):
+    '''
+    Returns the noiseless filter output at the given times (in s, ascending)
+    after a unit step at time 0.
+    '''
+    f = LockinFilter(lambda t: 1. if t >= 0 else 0., noiseDensity=0.)
+    f.getOutputs(-HORIZON * 4 * timeConstant, timeConstant, slope)
+    return np.array([f.getOutputs(t, timeConstant, slope)[0]
+                     for t in times])
+
@@ -28,114 +28,180 @@ log = logging.getLogger(__name__)
 # third party imports
 import serial
 
-SLEEP_TIME = 0.01
-
-
-class TimeoutException(Exception):
-    pass
-
-
-class SpectraPro2500i(object):
-    def __init__(self, port=0, timeout=30.):
-        # First, do a quick check that this is the right instrument
-        self._inst = serial.Serial(port,
-                                   baudrate=9600,
-                                   bytesize=serial.EIGHTBITS,
-                                   parity=serial.PARITY_NONE,
-                                   stopbits=serial.STOPBITS_ONE,
-                                   timeout=5)
-        self.get_id()
-        self._inst.close()
-        # Now use a long timetout so that grating changes
-        # don't cause a timeout
-        self._inst = serial.Serial(port,
-                                   baudrate=9600,
-                                   bytesize=serial.EIGHTBITS,
-                                   parity=serial.PARITY_NONE,
-                                   stopbits=serial.STOPBITS_ONE,
-                                   timeout=30)
-        self.get_id()
-
-    def __read(self):
+# local imports
+from transport import SerialTransport, TimeoutException
+from io_loop import AsyncIO
+
+# The default interval between queries while waiting for a scanto
+POLL_INTERVAL = 0.1
+
+# The wavelength resolution of the position readback in nm
+POSITION_RESOLUTION = 0.0015
+
+
+class SpectraPro2500i(AsyncIO):
+    '''
+    Device driver for the Acton SpectraPro 2500i monochromator.
+
+    Parameters
+    ----------
+    port : serial port name or number
+    timeout : float
+        the default read timeout in seconds. This needs to be long enough
+        for grating changes.
+    inst : serial.Serial or None
+        an already open port (e.g. a FakeSpectraPro) to use instead of
+        opening port
+    '''
+    def __init__(self, port=0, timeout=30., inst=None):
+        self.poll_interval = POLL_INTERVAL
+        self._scan_target = None
+        self._last_position = None
+        self._nm_per_min = None
+        if inst is None:
+            inst = serial.Serial(port,
+                                 baudrate=9600,
+                                 bytesize=serial.EIGHTBITS,
+                                 parity=serial.PARITY_NONE,
+                                 stopbits=serial.STOPBITS_ONE)
+        # Use a long timetout so that grating changes don't cause a
+        # timeout, but do a quick check that this is the right instrument
+        # first
+        self._transport = SerialTransport(inst, timeout=timeout,
+                                          ack='ok\r\n')
+        self._ask('*idn?', timeout=5.)
+
+    def __read(self, timeout=None):
         '''
         Returns a full response from the instrument.
         Raises a TimeoutException if the operation times out.
         '''
-        r = self._inst.readline()
-        if not r:
-            raise TimeoutException()
+        r = self._transport.readline(timeout)
         log.debug("__read: return '%s'", r)
         return r
 
-    def _read(self):
+    def _read(self, timeout=None):
         '''
         Returns an OK-stripped response from the instrument.
         Raises a TimeoutException if the operation times out.
         '''
-        r = self.__read()
+        r = self.__read(timeout)
         r = string.join(r.split()[1:-1]) # strip command echo and "ok"
         log.debug("_read: return '%s'", r)
         return r
 
     def __write(self, s):
         log.debug("__write: write('%s')", s)
-        self._inst.write(s+"\r")
+        self._transport.write(s+"\r")
 
-    def _write(self, s):
-        '''Writes to the instrument, and waits for an OK response'''
+    def _write(self, s, timeout=None):
+        '''
+        Writes to the instrument, and waits for an OK response. Raises a
+        TimeoutException if no line is received within timeout seconds
+        (default: the transport's timeout).
+        '''
         self.__write(s)
         while True:
-            if self.__read()[-4:] == "ok\r\n":
+            if self.__read(timeout)[-4:] == "ok\r\n":
                 log.debug("_write: self.__read()[-4:] == 'ok\r\n'")
                 break
-            log.debug("_write: time.sleep(%g)", SLEEP_TIME)
-            time.sleep(SLEEP_TIME)
 
-    def _ask(self, s):
+    def _ask(self, s, timeout=None):
         '''Writes to the instrument, and returns the OK-stripped response'''
         log.debug("__ask: __write('%s')", s)
         self.__write(s)
-        return self._read()
+        return self._read(timeout)
 
     def get_id(self):
         return self._ask('*idn?')
 
     # Wavelength movement commands
 
-    def wait_until_done(self):
+    def is_done(self):
         '''
-        Waits until the current scanto operation is done
+        Returns True if the current scanto operation is done
         '''
-        while True:
-            if int(self._ask("MONO-?DONE")):
-                break
-            time.sleep(SLEEP_TIME)
+        done = bool(int(self._ask("MONO-?DONE")))
+        if done:
+            self._scan_target = None
+        return done
+
+    def get_scan_progress(self):
+        '''
+        Returns the current wavelength position in nm, and True if the
+        current scanto operation is done.
 
-    def wait_until_above(self, nm):
+        Only the position is read until it reaches the destination (or
+        stops changing), so this takes one query per call instead of two.
+        '''
+        last = self._last_position
+        pos = self.get_position()
+        target = self._scan_target
+        if (target is None or abs(pos - target) < POSITION_RESOLUTION
+                or pos == last):
+            return pos, self.is_done()
+        return pos, False
+
+    def _wait_until(self, condition, timeout, callback, interval):
+        '''
+        Calls condition() every interval seconds (default:
+        self.poll_interval) until it returns True. If callback is not
+        None, the position is read instead, and callback(position) is
+        called each time. Raises a TimeoutException if the condition isn't
+        met within timeout seconds.
+        '''
+        if interval is None:
+            interval = self.poll_interval
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            if condition():
+                return
+            if callback is not None:
+                callback(self._last_position)
+            if timeout is not None and time.time() >= deadline:
+                raise TimeoutException('scan not done within {} s'
+                                       ''.format(timeout))
+            time.sleep(interval)
+
+    def wait_until_done(self, timeout=None, callback=None, interval=None):
+        '''
+        Waits until the current scanto operation is done, checking every
+        interval seconds (default: self.poll_interval). If callback is not
+        None, it is called with the position in nm each time, so that the
+        motion can be shown live.
+        '''
+        if callback is None:
+            condition = self.is_done
+        else:
+            condition = lambda: self.get_scan_progress()[1]
+        self._wait_until(condition, timeout, callback, interval)
+        if callback is not None:
+            callback(self._last_position)
+
+    def wait_until_above(self, nm, timeout=None, callback=None,
+                         interval=None):
         '''
         Waits until the current wavelength position is above the specified
         position in nm. This should only be used during a scanto operation.
         '''
-        while True:
-            pos = self.get_position()
-            if pos > nm:
-                break
-            time.sleep(SLEEP_TIME)
+        self._wait_until(lambda: self.get_position() > nm,
+                         timeout, callback, interval)
 
-    def wait_until_below(self, nm):
+    def wait_until_below(self, nm, timeout=None, callback=None,
+                         interval=None):
         '''
         Waits until the current wavelength position is below the specified
         position in nm. This should only be used during a scanto operation.
         '''
-        while True:
-            pos = self.get_position()
-            if pos < nm:
-                break
-            time.sleep(SLEEP_TIME)
+        self._wait_until(lambda: self.get_position() < nm,
+                         timeout, callback, interval)
 
     def get_position(self):
         '''Returns the current wavelength position in nm'''
-        return float(self._ask("?nm").split()[0])
+        pos = float(self._ask("?nm").split()[0])
+        self._last_position = pos
+        return pos
 
     def get_wavelength(self):
         '''Returns the current wavelength position in nm'''
@@ -146,23 +212,53 @@ class SpectraPro2500i(object):
         Goes to the destination wavelength at maximum motor speed.
         The maximum accepted wavelength precision is 0.001 nm.
         The experimentally acheivable precision will vary.
+
+        Returns when the instrument sends "ok" at the end of the move.
         '''
+        self._scan_target = None
         self._write("%.3f GOTO"%nm)
+        self._last_position = round(nm, 3)
+
+    def get_rate(self):
+        '''Returns the scan rate in nm/min'''
+        if self._nm_per_min is None:
+            self._nm_per_min = float(self._ask("?NM/MIN").split()[0])
+        return self._nm_per_min
 
-    def scanto(self, nm, nm_per_min=None):
+    def set_rate(self, nm_per_min):
+        '''Sets the scan rate in nm/min'''
+        self._write("%.2f NM/MIN"%nm_per_min)
+        self._nm_per_min = round(nm_per_min, 2)
+
+    def scanto(self, nm, nm_per_min=None, wait=False):
         '''
         Scans to the destination wavelength (in nm)
          at the specified rate (in nm/min)
         The maximum accepted wavelength precision is 0.001 nm.
         The maximum accepted rate precision is 0.01 nm/min.
         The experimentally acheivable precisions will vary.
+
+        If wait is False, this returns immediately, and the scan can be
+        followed with get_scan_progress or wait_until_done. Otherwise,
+        this returns when the instrument sends "ok" at the end of the
+        scan, and no other commands can be sent during the scan.
         '''
         if nm_per_min is not None:
-            self._write("%.2f NM/MIN"%nm_per_min)
-        self._write("%.3f >NM"%nm)
+            self.set_rate(nm_per_min)
+        if wait:
+            # Allow for the expected duration of the scan
+            minutes = abs(nm - self.get_position()) / self.get_rate()
+            timeout = minutes * 60. + self._transport.timeout
+            self._scan_target = None
+            self._write("%.3f NM"%nm, timeout)
+            self._last_position = round(nm, 3)
+        else:
+            self._write("%.3f >NM"%nm)
+            self._scan_target = round(nm, 3)
 
     def abort_scan(self):
         self._write("MONO-STOP")
+        self._scan_target = None
 
     # Grating control commands
 
@@ -220,8 +316,9 @@ class SpectraPro2500i(object):
 
     def close(self):
         '''Close the serial connection to the instrument'''
-        log.debug("close: self._inst.close()")
-        self._inst.close()
+        log.debug("close: self._transport.close()")
+        self.release_io()
+        self._transport.close()
 
 if __name__ == "__main__":
     # enable DEBUG output
@@ -28,30 +28,49 @@ log = logging.getLogger(__name__)
 # third party imports
 #import serial
 
+# local imports
+from transport import TimeoutException
+from io_loop import AsyncIO
+
 SLEEP_TIME = 0.01
 
-class TimeoutException(Exception):
-    pass
+# The simulated goto speed in nm/s
+GOTO_RATE = 1000.
+
+# The number of moves remembered for get_position_at
+MOVE_HISTORY = 100
+
+# The default interval between queries while waiting for a scanto
+POLL_INTERVAL = 0.1
 
 #TODO: make sure the asked for nm is available on the given grating?
-class SpectraPro2500i(object):
-    def __init__(self, port=0, timeout=5.):
+class SpectraPro2500i(AsyncIO):
+    def __init__(self, port=0, timeout=5., inst=None):
+        self.poll_interval = POLL_INTERVAL
         self.nm = 0.
+        self.nm_per_min = 100.
         self.grating = 1
+        # simulated scanto state
+        self._scan_start_time = None
+        self._scan_start_nm = None
+        self._scan_stop_nm = None
+        # (start time, stop time, start nm, stop nm) of the recent moves
+        self._moves = []
         time.sleep(SLEEP_TIME * 100)
-        #self._inst = serial.Serial(port,
-        #                           baudrate=9600,
-        #                           bytesize=serial.EIGHTBITS,
-        #                           parity=serial.PARITY_NONE,
-        #                           stopbits=serial.STOPBITS_ONE,
-        #                           timeout=timeout)
+        #inst = serial.Serial(port,
+        #                     baudrate=9600,
+        #                     bytesize=serial.EIGHTBITS,
+        #                     parity=serial.PARITY_NONE,
+        #                     stopbits=serial.STOPBITS_ONE)
+        #self._transport = SerialTransport(inst, timeout=timeout,
+        #                                  ack='ok\r\n')
 
     def __read(self):
         '''
         Returns a full response from the instrument.
         Raises a TimeoutException if the operation times out.
         '''
-        #r = self._inst.readline()
+        #r = self._transport.readline()
         r = 'CMD OK DATA'
         if not r:
             raise TimeoutException()
@@ -70,7 +89,7 @@ class SpectraPro2500i(object):
 
     def __write(self, s):
         log.debug("__write: write('%s')", s)
-        #self._inst.write(s+"\r")
+        #self._transport.write(s+"\r")
 
     def _write(self, s):
         '''Writes to the instrument, and waits for an OK response'''
@@ -79,8 +98,6 @@ class SpectraPro2500i(object):
         #    if self.__read()[-4:] == "ok\r\n":
         #        log.debug("_write: self.__read()[-4:] == 'ok\r\n'")
         #        break
-        #    log.debug("_write: time.sleep(%g)", SLEEP_TIME)
-        #    time.sleep(SLEEP_TIME)
 
     def _ask(self, s):
         '''Writes to the instrument, and returns the OK-stripped response'''
@@ -90,46 +107,128 @@ class SpectraPro2500i(object):
 
     # Wavelength movement commands
 
-    def wait_until_done(self):
+    def _update_scan(self):
         '''
-        Waits until the current scanto operation is done
+        Updates the simulated position of the current scanto operation
         '''
-        raise NotImplementedError()
-        while True:
-            if int(self._ask("MONO-?DONE")):
-                break
-            time.sleep(SLEEP_TIME)
-        #TODO: implement a simulated scan, with timed increments
+        if self._scan_start_time is None:
+            return
+        elapsed = time.time() - self._scan_start_time
+        delta = self.nm_per_min * elapsed / 60.
+        if self._scan_stop_nm >= self._scan_start_nm:
+            self.nm = min(self._scan_start_nm + delta, self._scan_stop_nm)
+        else:
+            self.nm = max(self._scan_start_nm - delta, self._scan_stop_nm)
+        if self.nm == self._scan_stop_nm:
+            self._scan_start_time = None
+
+    def _stop_scan(self):
+        '''
+        Stops the simulated scanto operation, if any, at the current
+        position.
+        '''
+        self._update_scan()
+        if self._scan_start_time is not None and self._moves:
+            start, stop, start_nm, stop_nm = self._moves[-1]
+            self._moves[-1] = (start, time.time(), start_nm, self.nm)
+        self._scan_start_time = None
+
+    def _record_move(self, duration, start_nm, stop_nm):
+        start = time.time()
+        self._moves.append((start, start + duration, start_nm, stop_nm))
+        del self._moves[:-MOVE_HISTORY]
+
+    def get_position_at(self, t):
+        '''
+        Returns the simulated wavelength in nm at time t, which may be in
+        the past, for the simulated lock-in. Unlike get_position, this
+        follows goto moves as well as scans.
+        '''
+        for start, stop, start_nm, stop_nm in reversed(self._moves[:]):
+            if t >= stop:
+                return stop_nm
+            if t >= start:
+                return start_nm + (stop_nm - start_nm) * ((t - start) /
+                                                          (stop - start))
+        if self._moves:
+            return self._moves[0][2]
+        return self.nm
 
-    def wait_until_above(self, nm):
+    def is_done(self):
+        '''
+        Returns True if the current scanto operation is done
+        '''
+        #return bool(int(self._ask("MONO-?DONE")))
+        self._update_scan()
+        return self._scan_start_time is None
+
+    def get_scan_progress(self):
+        '''
+        Returns the current wavelength position in nm, and True if the
+        current scanto operation is done.
+        '''
+        pos = self.get_position()
+        return pos, self._scan_start_time is None
+
+    def _wait_until(self, condition, timeout, callback, interval):
+        '''
+        Calls condition() every interval seconds (default:
+        self.poll_interval) until it returns True. If callback is not
+        None, the position is read instead, and callback(position) is
+        called each time. Raises a TimeoutException if the condition isn't
+        met within timeout seconds.
+        '''
+        if interval is None:
+            interval = self.poll_interval
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            if condition():
+                return
+            if callback is not None:
+                callback(self.nm)
+            if timeout is not None and time.time() >= deadline:
+                raise TimeoutException('scan not done within {} s'
+                                       ''.format(timeout))
+            time.sleep(interval)
+
+    def wait_until_done(self, timeout=None, callback=None, interval=None):
+        '''
+        Waits until the current scanto operation is done, checking every
+        interval seconds (default: self.poll_interval). If callback is not
+        None, it is called with the position in nm each time, so that the
+        motion can be shown live.
+        '''
+        if callback is None:
+            condition = self.is_done
+        else:
+            condition = lambda: self.get_scan_progress()[1]
+        self._wait_until(condition, timeout, callback, interval)
+        if callback is not None:
+            callback(self.nm)
+
+    def wait_until_above(self, nm, timeout=None, callback=None,
+                         interval=None):
         '''
         Waits until the current wavelength position is above the specified
         position in nm. This should only be used during a scanto operation.
         '''
-        raise NotImplementedError()
-        while True:
-            pos = self.get_position()
-            if pos > nm:
-                break
-            time.sleep(SLEEP_TIME)
-        #TODO: implement a simulated scan, with timed increments
+        self._wait_until(lambda: self.get_position() > nm,
+                         timeout, callback, interval)
 
-    def wait_until_below(self, nm):
+    def wait_until_below(self, nm, timeout=None, callback=None,
+                         interval=None):
         '''
         Waits until the current wavelength position is below the specified
         position in nm. This should only be used during a scanto operation.
         '''
-        raise NotImplementedError()
-        while True:
-            pos = self.get_position()
-            if pos < nm:
-                break
-            time.sleep(SLEEP_TIME)
-        #TODO: implement a simulated scan, with timed increments
+        self._wait_until(lambda: self.get_position() < nm,
+                         timeout, callback, interval)
 
     def get_position(self):
         '''Returns the current wavelength position in nm'''
         #return float(self._ask("?nm").split()[0])
+        self._update_scan()
         return self.nm
 
     def get_wavelength(self):
@@ -141,28 +240,55 @@ class SpectraPro2500i(object):
         Goes to the destination wavelength at maximum motor speed.
         The maximum accepted wavelength precision is 0.001 nm.
         The experimentally acheivable precision will vary.
+
+        Returns when the instrument sends "ok" at the end of the move.
         '''
         self._write("%.3f GOTO"%nm)
+        self._stop_scan()
         delta = abs(self.nm - nm)
+        self._record_move(delta / GOTO_RATE, self.nm, nm)
         self.nm = nm
-        time.sleep(delta/1000.)
+        time.sleep(delta / GOTO_RATE)
+
+    def get_rate(self):
+        '''Returns the scan rate in nm/min'''
+        #return float(self._ask("?NM/MIN").split()[0])
+        return self.nm_per_min
 
-    def scanto(self, nm, nm_per_min=None):
+    def set_rate(self, nm_per_min):
+        '''Sets the scan rate in nm/min'''
+        self._write("%.2f NM/MIN"%nm_per_min)
+        self.nm_per_min = nm_per_min
+
+    def scanto(self, nm, nm_per_min=None, wait=False):
         '''
         Scans to the destination wavelength (in nm)
          at the specified rate (in nm/min)
         The maximum accepted wavelength precision is 0.001 nm.
         The maximum accepted rate precision is 0.01 nm/min.
         The experimentally acheivable precisions will vary.
+
+        If wait is False, this returns immediately, and the scan can be
+        followed with get_scan_progress or wait_until_done. Otherwise,
+        this returns when the instrument sends "ok" at the end of the
+        scan, and no other commands can be sent during the scan.
         '''
         if nm_per_min is not None:
-            self._write("%.2f NM/MIN"%nm_per_min)
+            self.set_rate(nm_per_min)
         self._write("%.3f >NM"%nm)
-        self.nm = nm
-        #TODO: implement a simulated scan, with timed increments
+        self._update_scan()
+        self._scan_start_time = time.time()
+        self._scan_start_nm = self.nm
+        self._scan_stop_nm = nm
+        self._record_move(abs(nm - self.nm) / self.nm_per_min * 60.,
+                          self.nm, nm)
+        if wait:
+            time.sleep(abs(nm - self.nm) / self.nm_per_min * 60.)
+            self._update_scan()
 
     def abort_scan(self):
         self._write("MONO-STOP")
+        self._stop_scan()
 
     # Grating control commands
 
@@ -237,8 +363,9 @@ class SpectraPro2500i(object):
 
     def close(self):
         '''Close the serial connection to the instrument'''
-        log.debug("close: self._inst.close()")
-        #self._inst.close()
+        log.debug("close: self._transport.close()")
+        self.release_io()
+        #self._transport.close()
 
 if __name__ == "__main__":
     # enable DEBUG output
@@ -26,7 +26,17 @@ log = logging.getLogger(__name__)
 
 # third party imports
 import numpy as np
-import visa
+try:
+    import visa
+except ImportError:
+    visa = None  # only needed to open a real instrument
+
+# local imports
+from srs_sr830_autorange import (get_target_sensitivity_index,
+                                  is_settled, predict_output,
+                                  SETTLE_TOLERANCE)
+from transport import VisaTransport
+from io_loop import AsyncIO
 
 # Serial Poll Status Byte bits
 # The status bits are set to 1 when the event or state described in the
@@ -59,8 +69,17 @@ STB_MAV = 1 << 4
 STB_ESB = 1 << 4
 STB_SRQ = 1 << 4
 
-# TODO: read and store R and Theta?
-class SR830(object):
+# The number of points in each of the data buffers
+BUFFER_SIZE = 16383
+
+class SR830Base(AsyncIO):
+    '''
+    The SR830 commands, with the settings cache, sensitivity autoranging
+    and settle detection built on them. Subclasses implement the protocol:
+    _write, _ask, _ask_raw and _clear. See SR830 and the simulated SR830
+    in srs_sr830_sim.py.
+    '''
+
     time_constant_labels = (u'10 \u03Bcs', u'30 \u03Bcs',
                             u'100 \u03Bcs', u'300 \u03Bcs',
                             u'1 ms', u'3 ms',
@@ -128,43 +147,76 @@ class SR830(object):
                                      1.e-8, 2.e-8, 5.e-8,
                                      1.e-7, 2.e-7, 5.e-7,
                                      1.e-6))
+    sample_rate_labels = (u'62.5 mHz', u'125 mHz',
+                          u'250 mHz', u'500 mHz',
+                          u'1 Hz', u'2 Hz',
+                          u'4 Hz', u'8 Hz',
+                          u'16 Hz', u'32 Hz',
+                          u'64 Hz', u'128 Hz',
+                          u'256 Hz', u'512 Hz',
+                          u'Trigger')
+    sample_rate_hertz = np.array((0.0625, 0.125,
+                                  0.25, 0.5,
+                                  1., 2.,
+                                  4., 8.,
+                                  16., 32.,
+                                  64., 128.,
+                                  256., 512.))
+    buffer_size = BUFFER_SIZE
+
+    def __init__(self):
+        super(SR830Base, self).__init__()
+        # Write-through cache of the settings that are used during scans
+        self._cache = {}
+        # Number of queries sent to the instrument, for benchmarking
+        self.query_count = 0
+        # Number of settle periods wasted on sensitivity changes
+        self.wasted_settle_count = 0
 
-    def __init__(self, port='GPIB::8'):
-        super(SR830, self).__init__()
-        self._inst = visa.instrument(port)
+    def _write(self, s):
+        raise NotImplementedError()
 
-        self._clear()
-        log.debug('STB: %d' % self._inst.stb)
+    def _ask(self, s):
+        raise NotImplementedError()
 
-        # Check device identification
-        id = self._ask('*IDN?').split(',')
-        if len(id) < 1 or id[1] != 'SR830':
-            log.error('Unexpected instrument ID: %s' % (''.join(id)))
-            raise RuntimeError('Unexpected instrument ID: %s' % (''.join(id)))
+    def _ask_raw(self, s):
+        '''
+        Sends the query, and returns the raw binary response.
+        '''
+        raise NotImplementedError()
 
-    # TODO: add checks for the event and error status bytes to
-    # _read and _write, and handle events appropriately
-    def _read(self):
-        r = self._inst.read()
-        log.debug("_read: return '%s'", r)
-        return r
+    def _clear(self):
+        raise NotImplementedError()
 
-    def _write(self, s):
-        log.debug("_write: write('%s')", s)
-        self._inst.write(s)
+    def _ask_cached(self, command):
+        '''
+        Returns the integer value of the given setting, querying the
+        instrument only if the value is not already cached.
+        '''
+        try:
+            return self._cache[command]
+        except KeyError:
+            value = int(self._ask('%s?' % command))
+            self._cache[command] = value
+            return value
 
-    def _ask(self, s):
-        log.debug("_ask: ask('%s')", s)
-        r = self._inst.ask(s)
-        log.debug("_ask: return '%s'", r)
-        return r
+    def _write_cached(self, command, value):
+        '''
+        Writes the integer value of the given setting to the instrument,
+        and caches it.
+        '''
+        # Forget the old value first, in case the write fails
+        self._cache.pop(command, None)
+        self._write('%s %d' % (command, value))
+        self._cache[command] = value
 
-    def _clear(self):
+    def invalidate_cache(self):
         '''
-        Clears the status registers and output buffers.
+        Forgets the cached settings, so that they are queried from the
+        instrument again. Use this if the settings may have been changed
+        from the front panel.
         '''
-        log.debug("_clear: clearing...")
-        self._inst.clear()
+        self._cache.clear()
 
     def set_output(self, i):
         '''
@@ -276,7 +328,7 @@ class SR830(object):
             i=2 : I (1 MOhm)
             i=3 : I (100 MOhm)
         '''
-        return int(self._ask('ISRC?'))
+        return self._ask_cached('ISRC')
     def set_input_configuration(self, i):
         '''
         Sets the input configuration.
@@ -291,7 +343,7 @@ class SR830(object):
         sensitivities below 20 nA, changing the sensitivity does not change the
         current gain.
         '''
-        self._write('ISRC %d' % i)
+        self._write_cached('ISRC', i)
 
     def get_input_shield_grounding(self):
         '''
@@ -375,7 +427,7 @@ class SR830(object):
             i=25 : 500 mV/nA
             i=26 : 1 V/uA
         '''
-        return int(self._ask('SENS?'))
+        return self._ask_cached('SENS')
 
     def get_sensitivity_voltage(self):
         '''
@@ -423,7 +475,11 @@ class SR830(object):
         i = int(i)
         if i < 0 or i > 26:
             raise ValueError('Invalid sensitivity index: %d' % i)
-        self._write('SENS %d' % i)
+        # At sensitivities between 20 nA and 1 uA, the 1 MOhm current gain
+        # is selected automatically
+        if self._cache.get('ISRC') == 3:
+            self._cache.pop('ISRC')
+        self._write_cached('SENS', i)
 
     def set_sensitivity_voltage(self, V):
         '''
@@ -455,6 +511,7 @@ class SR830(object):
             tchanged = True
         # Run the auto gain adjust, and wait for it to finish
         self._write('AGAN')
+        self._cache.pop('SENS', None)
         # Now wait for it to finish. Simply checking the serial poll
         # status byte seems to have this effect.
         self._ask('*STB?')
@@ -475,7 +532,7 @@ class SR830(object):
             i=1 : Normal
             i=2 : Low Noise (minimum)
         '''
-        return int(self._ask('RMOD?'))
+        return self._ask_cached('RMOD')
     def set_reserve_mode(self, i):
         '''
         Sets the reserve mode.
@@ -483,7 +540,7 @@ class SR830(object):
             i=1 : Normal
             i=2 : Low Noise (minimum)
         '''
-        self._write('RMOD %d' % i)
+        self._write_cached('RMOD', i)
 
     def get_time_constant_index(self):
         '''
@@ -509,7 +566,7 @@ class SR830(object):
             i=18 : 10 ks
             i=19 : 30 ks
         '''
-        return int(self._ask('OFLT?'))
+        return self._ask_cached('OFLT')
     def set_time_constant_index(self, i):
         '''
         Gets the current time constant index.
@@ -537,7 +594,7 @@ class SR830(object):
         i = int(i)
         if i < 0 or i > 19:
             raise ValueError('Invalid time constant index: %d' % i)
-        self._write('OFLT %d' % i)
+        self._write_cached('OFLT', i)
 
     def get_time_constant_seconds(self):
         return self.time_constant_seconds[self.get_time_constant_index()]
@@ -553,7 +610,7 @@ class SR830(object):
             i=2 : 18 dB/oct
             i=3 : 24 dB/oct
         '''
-        return int(self._ask('OFSL?'))
+        return self._ask_cached('OFSL')
     def set_filter_slope(self, i):
         '''
         Sets the low pass filter slope.
@@ -565,19 +622,16 @@ class SR830(object):
         i = int(i)
         if i < 0 or i > 3:
             raise ValueError('Invalid filter slope index: %d' % i)
-        self._write('OFSL %d' % i)
-
-    # TODO: test these to see if 24 db/oct really takes twice
-    # as long to settle. Simply goto the PL peak, block the laser
-    # until the signal compeltely dies, then start plotting and
-    # unblock the laser. Then watch how long it takes to reach a
-    # steady value. Try this for 6 db/oct and 24 db/oct to see if the
-    # settle time is really 2x. If it is, then we know that you really
-    # should wait 10 time constants.
+        self._write_cached('OFSL', i)
+
     def get_suggested_delay(self):
         '''
         Gets the suggested delay to reach 99% of actual value, based on the
-        current time constant and filter slope.
+        current time constant and filter slope. This is the longest that
+        settle_and_get_outputs waits by default.
+
+        For an ideal cascade of RC filters, these delays reach 99.1-99.5%
+        of a step (see benchmarks/lockin_settle.py).
         '''
         t = self.get_time_constant_seconds()
         i = self.get_filter_slope()
@@ -592,15 +646,204 @@ class SR830(object):
         else:
             raise RuntimeError('unexpected execution path')
 
+    # Data Storage commands
+    def get_sample_rate_index(self):
+        '''
+        Gets the data sample rate index.
+            i=0  : 62.5 mHz
+            i=1  : 125 mHz
+            i=2  : 250 mHz
+            i=3  : 500 mHz
+            i=4  : 1 Hz
+            i=5  : 2 Hz
+            i=6  : 4 Hz
+            i=7  : 8 Hz
+            i=8  : 16 Hz
+            i=9  : 32 Hz
+            i=10 : 64 Hz
+            i=11 : 128 Hz
+            i=12 : 256 Hz
+            i=13 : 512 Hz
+            i=14 : Trigger
+        '''
+        return int(self._ask('SRAT?'))
+    def set_sample_rate_index(self, i):
+        '''
+        Sets the data sample rate index.
+            i=0  : 62.5 mHz
+            i=1  : 125 mHz
+            i=2  : 250 mHz
+            i=3  : 500 mHz
+            i=4  : 1 Hz
+            i=5  : 2 Hz
+            i=6  : 4 Hz
+            i=7  : 8 Hz
+            i=8  : 16 Hz
+            i=9  : 32 Hz
+            i=10 : 64 Hz
+            i=11 : 128 Hz
+            i=12 : 256 Hz
+            i=13 : 512 Hz
+            i=14 : Trigger
+        '''
+        i = int(i)
+        if i < 0 or i > 14:
+            raise ValueError('Invalid sample rate index: %d' % i)
+        self._write('SRAT %d' % i)
+
+    def set_sample_rate_hertz(self, f):
+        '''
+        Sets the slowest sample rate that is at least f (in Hz).
+        '''
+        i = np.searchsorted(self.sample_rate_hertz, f)
+        i = min(i, self.sample_rate_hertz.size - 1)
+        self.set_sample_rate_index(i)
+
+    def get_buffer_mode(self):
+        '''
+        Gets the end of buffer mode.
+            i=0 : 1 Shot
+            i=1 : Loop
+        '''
+        return int(self._ask('SEND?'))
+    def set_buffer_mode(self, i):
+        '''
+        Sets the end of buffer mode.
+            i=0 : 1 Shot
+            i=1 : Loop
+        '''
+        if not i in [0, 1]:
+            raise ValueError('i must be 0 for 1 shot, or 1 for loop')
+        self._write('SEND %d' % i)
+
+    def set_display(self, channel, i):
+        '''
+        Sets the display quantity of the given channel, which is also the
+        quantity stored in that channel's data buffer.
+            channel=1 : i=0 : X, i=1 : R, i=2 : X Noise,
+                        i=3 : Aux In 1, i=4 : Aux In 2
+            channel=2 : i=0 : Y, i=1 : Theta, i=2 : Y Noise,
+                        i=3 : Aux In 3, i=4 : Aux In 4
+        '''
+        self._write('DDEF %d,%d,0' % (channel, i))
+
+    def start_buffer(self):
+        '''
+        Starts or resumes data storage.
+        '''
+        self._write('STRT')
+
+    def pause_buffer(self):
+        '''
+        Pauses data storage.
+        '''
+        self._write('PAUS')
+
+    def reset_buffer(self):
+        '''
+        Resets the data buffers, discarding any stored data.
+        '''
+        self._write('REST')
+
+    def get_buffer_count(self):
+        '''
+        Gets the number of points stored in the buffer.
+        '''
+        return int(self._ask('SPTS?'))
+
+    def start_buffered_outputs(self, f):
+        '''
+        Configures the buffer to store R and theta at a sample rate of at
+        least f (in Hz), and starts data storage. Returns the sample rate
+        in Hz.
+        '''
+        self.set_display(1, 1)  # R
+        self.set_display(2, 1)  # theta
+        self.set_sample_rate_hertz(f)
+        self.set_buffer_mode(0)  # 1 shot
+        self.reset_buffer()
+        self.start_buffer()
+        return self.sample_rate_hertz[self.get_sample_rate_index()]
+
+    def read_buffer(self, channel, start=0, count=None):
+        '''
+        Reads count points from the given channel's buffer, starting at
+        the given point, using a binary transfer. If count is None, all
+        of the points stored after start are read.
+
+        Returns a numpy array of floats.
+        '''
+        if count is None:
+            count = self.get_buffer_count() - start
+        if count <= 0:
+            return np.empty(0, dtype=np.float32)
+        # TRCB transfers IEEE floats, which are 4 bytes each
+        r = self._ask_raw('TRCB? %d,%d,%d' % (channel, start, count))
+        return np.frombuffer(r, dtype='<f4', count=count)
+
+    def read_buffer_lia(self, channel, start=0, count=None):
+        '''
+        Same as read_buffer, but uses the faster TRCL transfer of the
+        SR830's internal format.
+        '''
+        if count is None:
+            count = self.get_buffer_count() - start
+        if count <= 0:
+            return np.empty(0, dtype=np.float64)
+        # TRCL transfers a 16 bit mantissa followed by a 16 bit exponent
+        r = self._ask_raw('TRCL? %d,%d,%d' % (channel, start, count))
+        data = np.frombuffer(r, dtype='<i2', count=count * 2)
+        mantissa = data[0::2].astype(np.float64)
+        exponent = data[1::2].astype(np.float64)
+        return mantissa * 2. ** (exponent - 124.)
+
+    def get_buffered_outputs(self, start=0, count=None):
+        '''
+        Returns the R and theta numpy arrays stored in the buffer by
+        start_buffered_outputs.
+        '''
+        if count is None:
+            count = self.get_buffer_count() - start
+        R = self.read_buffer(1, start, count)
+        theta = self.read_buffer(2, start, count)
+        return R, theta
+
     # Data Transfer commands
     def get_outputs(self):
         R, theta = self._ask('SNAP?3,4').split(',')
         return float(R), float(theta)
 
-    def adjust_and_get_outputs(self, delay):
+    def get_sensitivities(self):
+        '''
+        Get the sensitivities array for the current input configuration.
+        '''
+        if self.get_input_configuration() < 2:
+            # voltage mode
+            return self.sensitivity_voltages
+        else:
+            # current mode
+            return self.sensitivity_currents
+
+    def adjust_sensitivity(self, R):
+        '''
+        Changes the sensitivity directly to the best range for R, if R is
+        outside of the current range. Returns True if the sensitivity was
+        changed, or False if not.
+        '''
+        i = self.get_sensitivity_index()
+        j = get_target_sensitivity_index(R, i, self.get_sensitivities())
+        if j == i:
+            return False
+        self.set_sensitivity_index(j)
+        return True
+
+    def adjust_and_get_outputs(self, delay, previous=None):
         '''
         Use this to take care of sensitivity adjustments during a scan.
 
+        If the previous values of R are provided, the sensitivity is
+        preselected for the extrapolated value of R before measuring.
+
         Example usage:
 
             delay = sr830.get_time_constant_seconds()*5
@@ -609,39 +852,135 @@ class SR830(object):
                 R, theta = sr830.adjust_and_get_outputs(delay)
                 output(wavelenth, R, theta)
         '''
-        time.sleep(delay / 5.)  # quick adjust
-        R, theta = self.get_outputs()
-        i = self.get_sensitivity_index()
-        if self.get_input_configuration() < 2:
-            # voltage mode
-            sensitivities = self.sensitivity_voltages
-        else:
-            # current mode
-            sensitivities = self.sensitivity_currents
-
-        if R < sensitivities[i - 1] * .65:
-            if i == 0:
-                raise IOError('lock-in sensitivity cannot be lowered '
-                              'any further')
-            else:
-                self.set_sensitivity_index(i - 1)
-                return self.adjust_and_get_outputs(delay)
-        elif R > sensitivities[i] * .75:
-            if i == 26:
-                raise IOError('lock-in sensitivity cannot be raised '
-                              'any further')
-            else:
-                self.set_sensitivity_index(i + 1)
-                return self.adjust_and_get_outputs(delay)
-        else:
-            # helps remove kinks
-            time.sleep(delay)
+        expected = predict_output(previous)
+        if expected is not None:
+            self.adjust_sensitivity(expected)
+        while True:
+            time.sleep(delay / 5.)  # quick adjust
+            R, theta = self.get_outputs()
+            if not self.adjust_sensitivity(R):
+                break
+            self.wasted_settle_count += 1
+        # helps remove kinks
+        time.sleep(delay)
+        return self.get_outputs()
+
+    def settle_and_get_outputs(self, max_delay=None,
+                               tolerance=SETTLE_TOLERANCE, previous=None,
+                               interval=None):
+        '''
+        Same as adjust_and_get_outputs, but waits only until the lock-in
+        has settled, instead of for a fixed delay. Returns R, theta, and
+        the settle time in seconds.
+
+        After the filter's dead time (one time constant per pole beyond
+        the first), R is read every interval seconds (one time constant by
+        default) until is_settled, with the given tolerance relative to R,
+        or until max_delay seconds have passed (get_suggested_delay() by
+        default). A sensitivity change restarts the settle detection, but
+        not the max_delay deadline, so a signal that keeps changing range
+        can't hold up the scan.
+        '''
+        start = time.time()
+        tau = self.get_time_constant_seconds()
+        if max_delay is None:
+            max_delay = self.get_suggested_delay()
+        if interval is None:
+            interval = tau
+        deadline = start + max_delay
+        expected = predict_output(previous)
+        if expected is not None:
+            self.adjust_sensitivity(expected)
+        time.sleep(min(self.get_filter_slope() * tau, max_delay))
+        readings = []
+        while True:
             R, theta = self.get_outputs()
-            return self.get_outputs()
+            if self.adjust_sensitivity(R):
+                self.wasted_settle_count += 1
+                readings = []
+            else:
+                readings.append(R)
+                if is_settled(readings, tolerance):
+                    break
+            now = time.time()
+            if now >= deadline:
+                if not readings:
+                    # the last reading was out of range, so read once
+                    # more at the new sensitivity
+                    R, theta = self.get_outputs()
+                break
+            time.sleep(max(min(interval, deadline - now), interval / 5.))
+        return R, theta, time.time() - start
 
     def get_noise(self):
         raise NotImplementedError()  # TODO
 
+# TODO: read and store R and Theta?
+class SR830(SR830Base):
+    '''
+    Drives an SRS SR830 lock-in amplifier over GPIB.
+    '''
+
+    def __init__(self, port='GPIB::8', inst=None):
+        super(SR830, self).__init__()
+        if inst is None:
+            inst = visa.instrument(port)
+        self._transport = VisaTransport(inst)
+
+        self._clear()
+        log.debug('STB: %d' % self._transport.stb)
+
+        # Check device identification
+        id = self._ask('*IDN?').split(',')
+        if len(id) < 1 or id[1] != 'SR830':
+            log.error('Unexpected instrument ID: %s' % (''.join(id)))
+            raise RuntimeError('Unexpected instrument ID: %s' % (''.join(id)))
+
+    # TODO: add checks for the event and error status bytes to
+    # _read and _write, and handle events appropriately
+    def _read(self):
+        r = self._transport.read()
+        log.debug("_read: return '%s'", r)
+        return r
+
+    def _write(self, s):
+        log.debug("_write: write('%s')", s)
+        try:
+            self._transport.write(s)
+        except:
+            self.invalidate_cache()
+            raise
+
+    def _ask(self, s):
+        log.debug("_ask: ask('%s')", s)
+        self.query_count += 1
+        try:
+            r = self._transport.ask(s)
+        except:
+            self.invalidate_cache()
+            raise
+        log.debug("_ask: return '%s'", r)
+        return r
+
+    def _ask_raw(self, s):
+        log.debug("_ask_raw: ask('%s')", s)
+        self.query_count += 1
+        try:
+            self._transport.write(s)
+            r = self._transport.read_raw()
+        except:
+            self.invalidate_cache()
+            raise
+        log.debug("_ask_raw: return %d bytes", len(r))
+        return r
+
+    def _clear(self):
+        '''
+        Clears the status registers and output buffers.
+        '''
+        log.debug("_clear: clearing...")
+        self._transport.clear()
+
 if __name__ == "__main__":
     # enable DEBUG output
     logging.basicConfig(level=logging.DEBUG)
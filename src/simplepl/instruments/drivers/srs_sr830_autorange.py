@@ -0,0 +1,102 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Sensitivity autoranging and settle detection logic shared by the real and
+simulated SR830 drivers.
+'''
+
+# third party imports
+import numpy as np
+
+# A reading below this fraction of the next lower sensitivity range
+# selects a more sensitive range.
+LOWER_FRACTION = .65
+
+# A reading above this fraction of the current sensitivity range selects
+# a less sensitive range.
+UPPER_FRACTION = .75
+
+# The default settle tolerance, relative to R
+SETTLE_TOLERANCE = .01
+
+
+def get_target_sensitivity_index(R, i, sensitivities):
+    '''
+    Returns the index of the sensitivity range that R should be measured
+    with, given the current index, i. The current index is kept if R is
+    within its range, so that the range doesn't flip back and forth near
+    a transition. Otherwise, the most sensitive range that can measure R
+    is returned directly, rather than stepping one range at a time.
+
+    Raises an IOError if R is too large for the least sensitive range.
+    '''
+    last = len(sensitivities) - 1
+    if i > 0:
+        lower = sensitivities[i - 1] * LOWER_FRACTION
+    else:
+        lower = 0.
+    upper = sensitivities[i] * UPPER_FRACTION
+    if lower <= R <= upper:
+        return i
+    j = int(np.searchsorted(sensitivities * UPPER_FRACTION, R))
+    if j > last:
+        if i == last:
+            raise IOError('lock-in sensitivity cannot be raised '
+                          'any further')
+        return last
+    return j
+
+
+def predict_output(previous):
+    '''
+    Predicts the next R by linearly extrapolating the previous two values
+    of R. Returns None if there are no previous values.
+    '''
+    if previous is None or len(previous) == 0:
+        return None
+    if len(previous) == 1:
+        return previous[-1]
+    return max(2. * previous[-1] - previous[-2], 0.)
+
+
+def is_settled(readings, tolerance=SETTLE_TOLERANCE):
+    '''
+    Returns True if the readings of R, taken at equal intervals after a
+    move, show that the output filter has settled.
+
+    The step response of the output filter is monotonic, so if the last
+    two changes have opposite signs, the remaining change is within the
+    noise. Otherwise, the changes decay geometrically once the response
+    is past its steepest point, and the remaining change is extrapolated
+    from the last two. It must be within tolerance times the last reading.
+    '''
+    if len(readings) < 3:
+        return False
+    d1 = readings[-2] - readings[-3]
+    d2 = readings[-1] - readings[-2]
+    if d1 * d2 <= 0.:
+        return True
+    ratio = d2 / d1
+    if ratio >= 1.:
+        # still speeding up
+        return False
+    remaining = abs(d2) * ratio / (1. - ratio)
+    return remaining <= tolerance * abs(readings[-1])
@@ -28,34 +28,39 @@ import string
 import serial
 
 # local imports
+from transport import SerialTransport, TimeoutException
+from io_loop import AsyncIO
 
 
 #TODO: make sure the asked for nm is available on the given grating?
-class FW102C(object):
+class FW102C(AsyncIO):
     '''
     Device driver for ThorLabs FW102C Motorized Filter Wheel.
     '''
-    def __init__(self, port, timeout=5.):
-        self._inst = serial.Serial(port,
-                                   baudrate=115200,
-                                   bytesize=serial.EIGHTBITS,
-                                   parity=serial.PARITY_NONE,
-                                   stopbits=serial.STOPBITS_ONE,
-                                   timeout=timeout)
-        while self.__read(): # clear the filter's output buffer
-            pass
+    def __init__(self, port, timeout=5., inst=None):
+        if inst is None:
+            inst = serial.Serial(port,
+                                 baudrate=115200,
+                                 bytesize=serial.EIGHTBITS,
+                                 parity=serial.PARITY_NONE,
+                                 stopbits=serial.STOPBITS_ONE)
+        # Each response ends with a '>' prompt
+        self._transport = SerialTransport(inst, timeout=timeout, eol='>')
+        self._transport.flush() # clear the filter's output buffer
         while True:
             id = self.get_id()
             if id != "Command error":
                 break
-            while self.__read(): # clear the filter's output buffer
-                pass
+            self._transport.flush() # clear the filter's output buffer
         if id != "THORLABS FW102C/FW212C Filter Wheel version 1.01":
             raise RuntimeError('Wrong instrument id: %s'%id)
             
 
     def __read(self):
-        r = self._inst.readline()
+        try:
+            r = self._transport.readline()
+        except TimeoutException as e:
+            r = e.partial
         log.debug('__read: return "%s"', r)
         return r
 
@@ -66,8 +71,8 @@ class FW102C(object):
         return r
 
     def __write(self, s):
-        log.debug('__write: _inst.write("%s")', s)
-        self._inst.write(s+"\r")
+        log.debug('__write: _transport.write("%s")', s)
+        self._transport.write(s+"\r")
 
     def _write(self, s):
         self.__write(s)
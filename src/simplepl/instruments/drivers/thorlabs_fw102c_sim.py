@@ -29,27 +29,33 @@ import string
 #import serial
 
 # local imports
+from transport import TimeoutException
+from io_loop import AsyncIO
 
 
 SLEEP_TIME = 0.01
 
 #TODO: make sure the asked for nm is available on the given grating?
-class FW102C(object):
+class FW102C(AsyncIO):
     '''
     Device driver for ThorLabs FW102C Motorized Filter Wheel.
     '''
-    def __init__(self, port, timeout=5.):
-#        self._inst = serial.Serial(port,
-#                                   baudrate=115200,
-#                                   bytesize=serial.EIGHTBITS,
-#                                   parity=serial.PARITY_NONE,
-#                                   stopbits=serial.STOPBITS_ONE,
-#                                   timeout=timeout)
+    def __init__(self, port, timeout=5., inst=None):
+#        inst = serial.Serial(port,
+#                             baudrate=115200,
+#                             bytesize=serial.EIGHTBITS,
+#                             parity=serial.PARITY_NONE,
+#                             stopbits=serial.STOPBITS_ONE)
+#        # Each response ends with a '>' prompt
+#        self._transport = SerialTransport(inst, timeout=timeout, eol='>')
         self.current_filter = 1
         time.sleep(SLEEP_TIME * 100)
 
     def __read(self):
-        r = self._inst.readline()
+        try:
+            r = self._transport.readline()
+        except TimeoutException as e:
+            r = e.partial
         log.debug("__read: return %s", r)
         return r
 
@@ -59,8 +65,8 @@ class FW102C(object):
         return r
 
     def __write(self, s):
-        log.debug("__write: _inst.write(%s)", s)
-        self._inst.write(s+"\r")
+        log.debug("__write: _transport.write(%s)", s)
+        self._transport.write(s+"\r")
 
     def _write(self, s):
         self.__write(s)
@@ -0,0 +1,209 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Cancellable transports for the instrument drivers.
+
+The transports wrap an open serial port or VISA instrument. Reads have
+real timeouts, and a read in progress can be cancelled from another
+thread, in which case it raises a CancelledError.
+'''
+
+# std lib imports
+import threading
+import time
+import logging
+log = logging.getLogger(__name__)
+
+# The longest time a serial read blocks before checking for cancellation
+POLL_INTERVAL = 0.05
+
+
+class TimeoutException(Exception):
+    '''
+    Raised when the instrument doesn't respond in time. The data that was
+    received before the timeout is stored in the partial attribute.
+    '''
+
+    def __init__(self, message='', partial=''):
+        super(TimeoutException, self).__init__(message)
+        self.partial = partial
+
+
+class CancelledError(Exception):
+    '''
+    Raised when an operation is cancelled from another thread.
+    '''
+    pass
+
+
+class SerialTransport(object):
+    '''
+    Wraps an open serial.Serial port.
+
+    Parameters
+    ----------
+    inst : serial.Serial
+        the open port. Its timeout is set to POLL_INTERVAL, so that
+        cancellation is noticed quickly.
+    timeout : float
+        the default read timeout in seconds
+    ack : str or None
+        the end of the line that completes each command, e.g. 'ok\\r\\n'.
+        If a read is cancelled, the rest of the response is discarded up
+        to and including the next such line before the next write. If
+        None, the input buffer is flushed instead.
+    '''
+
+    def __init__(self, inst, timeout=5., ack=None, eol='\n'):
+        self._inst = inst
+        self._inst.timeout = POLL_INTERVAL
+        self.timeout = timeout
+        self.ack = ack
+        self.eol = eol
+        self._buffer = ''  # received data that hasn't been returned yet
+        self._cancelled = threading.Event()
+        self._owed = False  # True if a cancelled response is still owed
+
+    def write(self, s):
+        self._check()
+        if self._owed:
+            self._discard()
+        log.debug("write: '%s'", s)
+        self._inst.write(s)
+
+    def readline(self, timeout=None):
+        '''
+        Returns the next line, including the end of line.
+
+        Raises a TimeoutException if no full line is received within
+        timeout seconds (default: self.timeout), or a CancelledError if
+        cancel() is called.
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+        while True:
+            i = self._buffer.find(self.eol)
+            if i >= 0:
+                i += len(self.eol)
+                line, self._buffer = self._buffer[:i], self._buffer[i:]
+                log.debug("readline: return '%s'", line)
+                return line
+            if self._cancelled.isSet():
+                self._buffer = ''
+                self._owed = True
+                raise CancelledError()
+            if time.time() >= deadline:
+                line, self._buffer = self._buffer, ''
+                raise TimeoutException('no response within {} s'
+                                       ''.format(timeout), line)
+            # Wait up to POLL_INTERVAL for the first byte, and then take
+            # whatever else has arrived
+            self._buffer += self._inst.read(max(self._inst.inWaiting(), 1))
+
+    def flush(self):
+        '''
+        Discards any pending input, waiting until the instrument has been
+        quiet for POLL_INTERVAL.
+        '''
+        self._buffer = ''
+        while self._inst.read(max(self._inst.inWaiting(), 1)):
+            pass
+
+    def _discard(self):
+        if self.ack is None:
+            self.flush()
+        else:
+            while not self.readline().endswith(self.ack):
+                pass
+        self._owed = False
+
+    def _check(self):
+        if self._cancelled.isSet():
+            raise CancelledError()
+
+    def cancel(self):
+        '''
+        Cancels the current read, and any reads or writes until resume()
+        is called. This is safe to call from any thread.
+        '''
+        self._cancelled.set()
+
+    def resume(self):
+        self._cancelled.clear()
+
+    def close(self):
+        self._inst.close()
+
+
+class VisaTransport(object):
+    '''
+    Wraps an open VISA instrument, with the same interface.
+
+    VISA calls can't be interrupted, but they are short and have their own
+    timeout, so cancellation is checked before each call.
+    '''
+
+    def __init__(self, inst):
+        self._inst = inst
+        self._cancelled = threading.Event()
+
+    def _check(self):
+        if self._cancelled.isSet():
+            raise CancelledError()
+
+    @property
+    def stb(self):
+        self._check()
+        return self._inst.stb
+
+    def read(self):
+        self._check()
+        return self._inst.read()
+
+    def read_raw(self):
+        self._check()
+        return self._inst.read_raw()
+
+    def write(self, s):
+        self._check()
+        self._inst.write(s)
+
+    def ask(self, s):
+        self._check()
+        return self._inst.ask(s)
+
+    def clear(self):
+        self._check()
+        self._inst.clear()
+
+    def cancel(self):
+        '''
+        Cancels any reads or writes until resume() is called. This is safe
+        to call from any thread.
+        '''
+        self._cancelled.set()
+
+    def resume(self):
+        self._cancelled.clear()
+
+    def close(self):
+        self._inst.close()
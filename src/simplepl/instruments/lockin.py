@@ -25,6 +25,7 @@
 from PySide import QtCore
 
 # local imports
+from .core import openLockin
 
 
 class Lockin(QtCore.QObject):
@@ -33,7 +34,8 @@ class Lockin(QtCore.QObject):
 
     Under the hood, this class uses Signals to call functions in another
     thread. The results are emitted in other Signals, which are specified
-    in the doc strings.
+    in the doc strings. The instrument itself is accessed through a
+    LockinCore.
     '''
 
     sigException = QtCore.Signal(Exception)
@@ -47,8 +49,7 @@ class Lockin(QtCore.QObject):
 
     def __init__(self):
         super(Lockin, self).__init__()
-        self._instLock = QtCore.QMutex()
-        self._inst = None
+        self._core = None
 
         # Start the thread
         self.thread = QtCore.QThread()
@@ -57,34 +58,52 @@ class Lockin(QtCore.QObject):
         self.thread.start()
 
     def _init(self):
-        settings = QtCore.QSettings()
-        simulate = int(settings.value('simulate', False))
-        if simulate:
-            print "Simulating lock-in..."
-            from drivers.srs_sr830_sim import SR830
-        else:
-            from drivers.srs_sr830 import SR830
-
-        lockinPort = settings.value('lockin/port', 'GPIB::8')
-        with QtCore.QMutexLocker(self._instLock):
-            try:
-                self._inst = SR830(port=lockinPort)
-            except:
-                e = IOError('Unable to connect to lock-in at port {}'
-                            ''.format(lockinPort))
-                self.sigException.emit(e)
-                return
+        try:
+            core = openLockin(QtCore.QSettings())
+        except IOError as e:
+            self.sigException.emit(e)
+            return
+        core.onRawSignal = self.sigRawSignal.emit
+        core.onPhase = self.sigPhase.emit
+        core.onTimeConstantIndex = self.sigTimeConstantIndex.emit
+        core.onTimeConstantSeconds = self.sigTimeConstantSeconds.emit
+        self._core = core
 
         # Notify the gui that initialization went fine
         self.sigInitialized.emit()
 
+    def getCore(self):
+        '''
+        Returns the underlying LockinCore.
+        '''
+        return self._core
+
+    def cancelIO(self):
+        '''
+        Cancels the operations in progress. This is safe to call from any
+        thread. See LockinCore.cancelIO.
+        '''
+        if self._core is not None:
+            self._core.cancelIO()
+
+    def resumeIO(self):
+        if self._core is not None:
+            self._core.resumeIO()
+
+    def close(self):
+        '''
+        Closes the instruments. Call this after the thread has finished.
+        See LockinCore.close.
+        '''
+        if self._core is not None:
+            self._core.close()
+            self._core = None
+
     def getTimeConstantLabelsList(self):
-        with QtCore.QMutexLocker(self._instLock):
-            return self._inst.time_constant_labels
+        return self._core.getTimeConstantLabelsList()
 
     def getTimeConstantSecondsList(self):
-        with QtCore.QMutexLocker(self._instLock):
-            return self._inst.time_constant_seconds
+        return self._core.getTimeConstantSecondsList()
 
     @QtCore.Slot()
     def getTimeConstantIndex(self):
@@ -95,10 +114,7 @@ class Lockin(QtCore.QObject):
         -----
         sigTimeConstantIndex
         '''
-        with QtCore.QMutexLocker(self._instLock):
-            i = self._inst.get_time_constant_index()
-        self.sigTimeConstantIndex.emit(i)
-        return i
+        return self._core.getTimeConstantIndex()
 
     @QtCore.Slot()
     def getTimeConstantSeconds(self):
@@ -109,28 +125,44 @@ class Lockin(QtCore.QObject):
         -----
         sigTimeConstantSeconds
         '''
-        i = self.getTimeConstantIndex()
-        seconds = self.getTimeConstantSecondsList()[i]
-        self.sigTimeConstantSeconds.emit(seconds)
-        return seconds
+        return self._core.getTimeConstantSeconds()
 
     @QtCore.Slot(int)
     def setTimeConstantIndex(self, i):
-        with QtCore.QMutexLocker(self._instLock):
-            self._inst.set_time_constant_index(i)
+        self._core.setTimeConstantIndex(i)
 
     @QtCore.Slot(int)
     def setReserveModeIndex(self, i):
-        with QtCore.QMutexLocker(self._instLock):
-            self._inst.set_reserve_mode(i)
+        self._core.setReserveModeIndex(i)
 
     @QtCore.Slot(int)
     def setInputLineFilterIndex(self, i):
-        with QtCore.QMutexLocker(self._instLock):
-            self._inst.set_input_line_filter(i)
+        self._core.setInputLineFilterIndex(i)
+
+    @QtCore.Slot()
+    def invalidateCache(self):
+        '''
+        Forgets the cached lock-in settings, so that they are read from the
+        lock-in again. Use this if the settings may have been changed
+        from the front panel.
+        '''
+        self._core.invalidateCache()
+
+    def getWastedSettleCount(self):
+        '''
+        Returns the number of settle periods wasted on sensitivity changes
+        so far.
+        '''
+        return self._core.getWastedSettleCount()
+
+    def getQueryCount(self):
+        '''
+        Returns the number of queries sent to the lock-in so far.
+        '''
+        return self._core.getQueryCount()
 
     @QtCore.Slot(float)
-    def adjustAndGetOutputs(self, delay):
+    def adjustAndGetOutputs(self, delay, previous=None):
         '''
         Adjust the sensitivity and returns the rawSignal and phase.
 
@@ -139,14 +171,91 @@ class Lockin(QtCore.QObject):
         delay : float
             The delay time in seconds. A delay of 5x the time constant is
             recommended.
+        previous : numpy.array
+            The previous rawSignal values of the scan, if any. These are
+            used to preselect the sensitivity before measuring.
+
+        Emits
+        -----
+        sigRawSignal(float)
+        sigPhase(float)
+        '''
+        return self._core.adjustAndGetOutputs(delay, previous)
+
+    def settleAndGetOutputs(self, maxDelay=None, previous=None):
+        '''
+        Adjusts the sensitivity and returns the rawSignal, phase, and
+        settle time, waiting only until the lock-in settles. See
+        LockinCore.settleAndGetOutputs.
+
+        Emits
+        -----
+        sigRawSignal(float)
+        sigPhase(float)
+        '''
+        return self._core.settleAndGetOutputs(maxDelay, previous)
+
+    @QtCore.Slot()
+    def getOutputs(self):
+        '''
+        Returns the rawSignal and phase without adjusting the sensitivity
+        or waiting.
+
+        Emits
+        -----
+        sigRawSignal(float)
+        sigPhase(float)
+        '''
+        return self._core.getOutputs()
+
+    @QtCore.Slot(float)
+    def adjustSensitivity(self, rawSignal):
+        '''
+        Changes the sensitivity if rawSignal is outside of the current
+        range. Returns True if the sensitivity was changed.
+        '''
+        return self._core.adjustSensitivity(rawSignal)
+
+    def getSensitivity(self):
+        '''
+        Returns the full scale of the current sensitivity range.
+        '''
+        return self._core.getSensitivity()
+
+    @QtCore.Slot(float)
+    def startBufferedOutputs(self, sampleRate):
+        '''
+        Starts storing the rawSignal and phase in the lock-in's internal
+        buffer at a sample rate of at least sampleRate (in Hz). Returns the
+        actual sample rate in Hz.
+        '''
+        return self._core.startBufferedOutputs(sampleRate)
+
+    @QtCore.Slot()
+    def pauseBufferedOutputs(self):
+        self._core.pauseBufferedOutputs()
+
+    def getBufferCount(self):
+        '''
+        Returns the number of points stored in the lock-in's buffer.
+        '''
+        return self._core.getBufferCount()
+
+    def getBufferSize(self):
+        '''
+        Returns the maximum number of points the lock-in's buffer can hold.
+        '''
+        return self._core.getBufferSize()
+
+    def getBufferedOutputs(self, start=0, count=None):
+        '''
+        Returns the rawSignal and phase numpy arrays stored in the lock-in's
+        buffer, starting at point start.
 
         Emits
         -----
         sigRawSignal(float)
         sigPhase(float)
+            the last point read, if any
         '''
-        with QtCore.QMutexLocker(self._instLock):
-            rawSignal, phase = self._inst.adjust_and_get_outputs(delay)
-        self.sigRawSignal.emit(rawSignal)
-        self.sigPhase.emit(phase)
-        return rawSignal, phase
+        return self._core.getBufferedOutputs(start, count)
@@ -25,29 +25,8 @@
 from PySide import QtCore
 
 # local imports
-
-
-class FilterChanger(QtCore.QObject):
-    def __init__(self, targetFilter, filterWheel, lock):
-        super(FilterChanger, self).__init__()
-        self._targetFilter = targetFilter
-        self._filterWheelLock = lock
-        self._filterWheel = filterWheel
-        self.thread = QtCore.QThread()
-        self.thread.started.connect(self._init)
-        self.moveToThread(self.thread)
-
-    def _init(self):
-        with QtCore.QMutexLocker(self._filterWheelLock):
-            self._filterWheel.set_filter(self._targetFilter)
-            self.result = self._filterWheel.get_filter()
-        self.thread.quit()
-
-    def start(self):
-        self.thread.start()
-
-    def wait(self):
-        self.thread.wait()
+from .config_table import ConfigTable
+from .core import openSpectrometer
 
 
 class Spectrometer(QtCore.QObject):
@@ -56,7 +35,8 @@ class Spectrometer(QtCore.QObject):
 
     Under the hood, this class uses Signals to call functions in another
     thread. The results are emitted in other Signals, which are specified
-    in the doc strings.
+    in the doc strings. The instruments themselves are accessed through a
+    SpectrometerCore.
     '''
 
     sigException = QtCore.Signal(Exception)
@@ -73,17 +53,9 @@ class Spectrometer(QtCore.QObject):
     def __init__(self):
         super(Spectrometer, self).__init__()
         # Initialize variables
-        self._spectrometerLock = QtCore.QMutex()
-        self._spectrometer = None
-        self._filterWheelLock = QtCore.QMutex()
-        self._filterWheel = None
+        self._core = None
         self._settings = None
 
-        # Initialized cached values
-        self._grating = None
-        self._filter = None
-        self._wavelength = None
-
         # Start the thread
         self.thread = QtCore.QThread()
         self.moveToThread(self.thread)
@@ -93,36 +65,19 @@ class Spectrometer(QtCore.QObject):
         # Initialize QSettings object
         self._settings = QtCore.QSettings()
 
-        simulate = int(self._settings.value('simulate', False))
-        if simulate:
-            print "Simulating spectrometer and filter wheel..."
-            from drivers.spectra_pro_2500i_sim import SpectraPro2500i
-            from drivers.thorlabs_fw102c_sim import FW102C
-        else:
-            from drivers.spectra_pro_2500i import SpectraPro2500i
-            from drivers.thorlabs_fw102c import FW102C
-
-        # Initialize the spectrometer
-        spectrometerPort = int(self._settings.value('spectrometer/port', 3))
-        with QtCore.QMutexLocker(self._spectrometerLock):
-            try:
-                self._spectrometer = SpectraPro2500i(port=spectrometerPort)
-            except:
-                e = IOError('unable to connect to spectrometer at '
-                            'port {}'.format(spectrometerPort))
-                self.sigException.emit(e)
-                return
-
-        # Initialize the filter wheel
-        filterWheelPort = int(self._settings.value('filterWheel/port', 3))
-        with QtCore.QMutexLocker(self._filterWheelLock):
-            try:
-                self._filterWheel = FW102C(port=filterWheelPort)
-            except:
-                e = IOError('unable to connect to filter wheel at '
-                            'port {}'.format(filterWheelPort))
-                self.sigException.emit(e)
-                return
+        # Initialize the spectrometer and filter wheel
+        try:
+            core = openSpectrometer(self._settings)
+        except IOError as e:
+            self.sigException.emit(e)
+            return
+        core.onChangingGrating = self.sigChangingGrating.emit
+        core.onChangingFilter = self.sigChangingFilter.emit
+        core.onChangingWavelength = self.sigChangingWavelength.emit
+        core.onGrating = self.sigGrating.emit
+        core.onFilter = self.sigFilter.emit
+        core.onWavelength = self.sigWavelength.emit
+        self._core = core
 
         # Notify the gui that initialization went fine
         self.sigInitialized.emit()
@@ -132,6 +87,33 @@ class Spectrometer(QtCore.QObject):
         self.getFilter()
         self.getWavelength()
 
+    def getCore(self):
+        '''
+        Returns the underlying SpectrometerCore.
+        '''
+        return self._core
+
+    def cancelIO(self):
+        '''
+        Cancels the operations in progress. This is safe to call from any
+        thread. See SpectrometerCore.cancelIO.
+        '''
+        if self._core is not None:
+            self._core.cancelIO()
+
+    def resumeIO(self):
+        if self._core is not None:
+            self._core.resumeIO()
+
+    def close(self):
+        '''
+        Closes the instruments. Call this after the thread has finished.
+        See SpectrometerCore.close.
+        '''
+        if self._core is not None:
+            self._core.close()
+            self._core = None
+
     def getGratingCount(self):
         return 9
 
@@ -140,56 +122,37 @@ class Spectrometer(QtCore.QObject):
 
     @QtCore.Slot()
     def getGrating(self):
-        if self._spectrometer is None:
+        '''
+        Emits
+        -----
+            sigGrating(int), if not cached
+        '''
+        if self._core is None:
             return
-        if self._grating is not None:
-            return self._grating
-        with QtCore.QMutexLocker(self._spectrometerLock):
-            result = self._spectrometer.get_grating()
-        self._grating = result
-        self.sigGrating.emit(result)
-        return result
+        return self._core.getGrating()
 
     @QtCore.Slot(int)
     def setGrating(self, i):
-        self._grating = None
-        self.sigChangingGrating.emit()
-        with QtCore.QMutexLocker(self._spectrometerLock):
-            self._spectrometer.set_grating(i)
-        self.getGrating()  # read and emit the resulting grating
+        self._core.setGrating(i)
 
     @QtCore.Slot()
     def getFilter(self):
-        if self._spectrometer is None:
+        '''
+        Emits
+        -----
+            sigFilter(int), if not cached
+        '''
+        if self._core is None:
             return
-        if self._filter is not None:
-            return self._filter
-        with QtCore.QMutexLocker(self._filterWheelLock):
-            result = self._filterWheel.get_filter()
-        self._filter = result
-        self.sigFilter.emit(result)
-        return result
+        return self._core.getFilter()
 
     @QtCore.Slot(int)
     def setFilter(self, i):
-        self._filter = None
-        self.sigChangingFilter.emit()
-        with QtCore.QMutexLocker(self._filterWheelLock):
-            self._filterWheel.set_filter(i)
-        self.getFilter()  # read and emit the resulting filter
+        self._core.setFilter(i)
 
     @QtCore.Slot(int, int)
     def setGratingAndFilter(self, grating, filter):
-        self._filter = None
-        filterChanger = FilterChanger(filter,
-                                      self._filterWheel,
-                                      self._filterWheelLock)
-        self.sigChangingFilter.emit()
-        filterChanger.start()
-        self.setGrating(grating)
-        filterChanger.wait()
-        self._filter = filterChanger.result
-        self.sigFilter.emit(filterChanger.result)
+        self._core.setGratingAndFilter(grating, filter)
 
     @QtCore.Slot()
     def getWavelength(self):
@@ -200,52 +163,109 @@ class Spectrometer(QtCore.QObject):
         -----
             sigWavelength(float)
         '''
-        if self._spectrometer is None:
+        if self._core is None:
             return
-        if self._wavelength is not None:
-            return self._wavelength
-        with QtCore.QMutexLocker(self._spectrometerLock):
-            result = self._spectrometer.get_wavelength()
-        self._wavelength = result
-        self.sigWavelength.emit(result)
-        return result
+        return self._core.getWavelength()
 
     @QtCore.Slot(float)
     def setWavelength(self, wavelength):
-        self._wavelength = None
-        self.sigChangingWavelength.emit()
-
-        # Change the grating and/or filter, if needed
-        targetGrating, targetFilter = self._getTargetGratingAndFilter(
-                                                                wavelength)
-        if self.getGrating() != targetGrating:
-            if self.getFilter() != targetFilter:
-                self.setGratingAndFilter(targetGrating, targetFilter)
-            else:
-                self.setGrating(targetGrating)
-        elif self.getFilter() != targetFilter:
-            self.setFilter(targetFilter)
-
-        # Go to the specified target wavelength
-        with QtCore.QMutexLocker(self._spectrometerLock):
-            self._spectrometer.goto(wavelength)
-        self.getWavelength()  # read and emit the resulting wavelength
-
-    def _getTargetGratingAndFilter(self, wavelength):
-        '''
-        Gets the target grating and filter for a given wavelength from
-        the config.
-        '''
-        wavelengths, gratings, filters = self.getConfigs()
-        if wavelength < wavelengths[0]:
-            raise ValueError('wavelengths shorter than {} are not supported'
-                             ''.format(wavelengths[0]))
-        for i in xrange(len(gratings)):
-            if wavelength <= wavelengths[i + 1]:
-                return gratings[i], filters[i]
-        else:
-            raise ValueError('wavelengths longer than {} are not supported'
-                             ''.format(wavelengths[i + 1]))
+        self._core.setWavelength(wavelength)
+
+    def setGratingAndFilterFor(self, wavelength):
+        '''
+        Changes the grating and/or filter to those configured for the
+        given wavelength, if needed. Returns True if either was changed.
+        '''
+        return self._core.setGratingAndFilterFor(wavelength)
+
+    def changeGratingAndFilter(self, grating, filter):
+        '''
+        Changes the grating and/or filter, if needed. If both need to be
+        changed, they are changed in parallel. Returns True if either was
+        changed.
+        '''
+        return self._core.changeGratingAndFilter(grating, filter)
+
+    @QtCore.Slot(float)
+    def moveTo(self, wavelength):
+        '''
+        Goes to the given wavelength without changing the grating or
+        filter.
+        '''
+        self._core.moveTo(wavelength)
+
+    def startMoveTo(self, wavelength):
+        '''
+        Starts moving to the given wavelength without changing the grating
+        or filter, and returns immediately. Call the returned object's
+        wait() method before using the spectrometer again.
+        '''
+        return self._core.startMoveTo(wavelength)
+
+    @QtCore.Slot(float, float)
+    def scanTo(self, wavelength, rate):
+        '''
+        Starts a continuous scan to the given wavelength (in nm) at the
+        given rate (in nm/min), and returns immediately. The grating and
+        filter are not changed, so the scan should not cross a grating or
+        filter boundary.
+        '''
+        self._core.scanTo(wavelength, rate)
+
+    @QtCore.Slot()
+    def getPosition(self):
+        '''
+        Reads the current wavelength in nm from the spectrometer, even
+        while scanning.
+
+        Emits
+        -----
+            sigWavelength(float)
+        '''
+        return self._core.getPosition()
+
+    def getScanProgress(self):
+        '''
+        Reads the current wavelength in nm, and whether the current scanTo
+        operation is done.
+
+        Emits
+        -----
+            sigWavelength(float)
+        '''
+        return self._core.getScanProgress()
+
+    def waitForScan(self, interval=None):
+        '''
+        Waits until the current scanTo operation is done, emitting the
+        position every interval seconds.
+
+        Emits
+        -----
+            sigWavelength(float)
+        '''
+        self._core.waitForScan(interval)
+
+    def isScanDone(self):
+        '''
+        Returns True if the current scanTo operation is done.
+        '''
+        return self._core.isScanDone()
+
+    @QtCore.Slot()
+    def abortScan(self):
+        '''
+        Stops the current scanTo operation.
+        '''
+        self._core.abortScan()
+
+    def getConfigTable(self):
+        '''
+        Returns the compiled ConfigTable of the current configs.
+        '''
+        if self._core is None:
+            return ConfigTable([], [], [])
+        return self._core.getConfigTable()
 
     def getConfigs(self):
         '''
@@ -255,19 +275,7 @@ class Spectrometer(QtCore.QObject):
         gratings : list of ints of length (N - 1)
         filters : list of ints of length (N - 1)
         '''
-        wavelengths = []
-        gratings = []
-        filters = []
-        size = self._settings.beginReadArray('spectrometer/configs')
-        for i in xrange(size - 1):
-            self._settings.setArrayIndex(i)
-            wavelengths.append(float(self._settings.value('wavelength')))
-            gratings.append(int(self._settings.value('grating')))
-            filters.append(int(self._settings.value('filter')))
-        self._settings.setArrayIndex(size - 1)
-        wavelengths.append(self._settings.value('wavelength'))
-        self._settings.endArray()
-        return wavelengths, gratings, filters
+        return self.getConfigTable().getConfigs()
 
     def setConfigs(self, wavelengths, gratings, filters):
         '''
@@ -277,50 +285,16 @@ class Spectrometer(QtCore.QObject):
         gratings : list of ints of length (N - 1)
         filters : list of ints of length (N - 1)
         '''
-        assert wavelengths == sorted(wavelengths)
-        size = len(wavelengths)
-        self._settings.beginWriteArray('spectrometer/configs', size=size)
-        for i in xrange(size - 1):
-            self._settings.setArrayIndex(i)
-            self._settings.setValue('wavelength', wavelengths[i])
-            self._settings.setValue('grating', gratings[i])
-            self._settings.setValue('filter', filters[i])
-        self._settings.setArrayIndex(size - 1)
-        self._settings.setValue('wavelength', wavelengths[size - 1])
-        self._settings.endArray()
-        self._settings.sync()
-        return wavelengths, gratings, filters
+        return self._core.setConfigs(wavelengths, gratings, filters)
 
     def getMinWavelength(self):
-        _size = self._settings.beginReadArray('spectrometer/configs')
-        self._settings.setArrayIndex(0)
-        wavelength = float(self._settings.value('wavelength', 0.))
-        self._settings.endArray()
-        return wavelength
+        return self.getConfigTable().getMinWavelength()
 
     def getMaxWavelength(self):
-        size = self._settings.beginReadArray('spectrometer/configs')
-        self._settings.setArrayIndex(size - 1)
-        wavelength = float(self._settings.value('wavelength', 10000.))
-        self._settings.endArray()
-        return wavelength
+        return self.getConfigTable().getMaxWavelength()
 
     def setEntranceMirror(self, s):
-        if s == 'Front':
-            with QtCore.QMutexLocker(self._spectrometerLock):
-                self._spectrometer.set_entrance_mirror_front()
-        elif s == 'Side':
-            with QtCore.QMutexLocker(self._spectrometerLock):
-                self._spectrometer.set_entrance_mirror_side()
-        else:
-            raise ValueError('Unkown entrance mirror position: {}'.format(s))
+        self._core.setEntranceMirror(s)
 
     def setExitMirror(self, s):
-        if s == 'Front':
-            with QtCore.QMutexLocker(self._spectrometerLock):
-                self._spectrometer.set_exit_mirror_front()
-        elif s == 'Side':
-            with QtCore.QMutexLocker(self._spectrometerLock):
-                self._spectrometer.set_exit_mirror_side()
-        else:
-            raise ValueError('Unkown exit mirror position: {}'.format(s))
+        self._core.setExitMirror(s)
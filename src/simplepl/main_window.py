@@ -21,17 +21,25 @@
 
 # std lib imports
 import os.path
+import logging
+log = logging.getLogger(__name__)
 
 # third party imports
 from PySide import QtGui, QtCore
+import numpy as np
 import pyqtgraph as pg
 
 # local imports
-from .scanners import Scanner, GoToer
-from .simple_pl_parser import SimplePLParser
+from .scanners import (Scanner, SweepScanner, AdaptiveScanner, QueueRunner,
+                       GoToer, getInstrumentConfig, formatDuration)
+from .scan_queue import ScanJob, ScanQueue
+from .system_response import loadSystemResponse
 from .spectra_plot_item import SpectraPlotItem
 from .measured_spectrum import MeasuredSpectrum
 from .expanding_spectrum import ExpandingSpectrum
+from .averaged_spectrum import AveragedSpectrum
+from .spectrum_data import BINARY_EXTENSION
+from .scan_planner import getTargetWavelengths
 from .instruments.spectrometer import Spectrometer
 from .instruments.lockin import Lockin
 from .dialogs.start_scan_dialog import StartScanDialog
@@ -45,6 +53,9 @@ from .dialogs.generate_veusz_file_dialog import GenerateVeuszFileDialog
 from .dialogs.about_dialog import AboutDialog
 
 
+SAVE_FILTERS = ('Tab Delimited Text (*.txt)',
+                'SimplePL Binary (*{})'.format(BINARY_EXTENSION))
+
 class MainWindow(QtGui.QMainWindow):
 
     def __init__(self):
@@ -53,6 +64,7 @@ class MainWindow(QtGui.QMainWindow):
         # Initialize private variables
         self.plot = None
         self.spectrum = None
+        self._queueSpectrum = None
         self._grating = None
         self._filter = None
         self._wavelength = None
@@ -69,6 +81,13 @@ class MainWindow(QtGui.QMainWindow):
         # Initialize QSettings object
         self._settings = QtCore.QSettings()
 
+        # Load the scan queue, which may have pending jobs left over from
+        # a crash
+        defaultQueuePath = os.path.join(os.path.expanduser('~'),
+                                        'simplepl_queue.json')
+        self.queue = ScanQueue.load(self._settings.value('queue/path',
+                                                         defaultQueuePath))
+
         # Initialize GUI stuff
         self.initUI()
 
@@ -85,7 +104,7 @@ class MainWindow(QtGui.QMainWindow):
 
         # Initialize the current instrument values
         sysResPath = self._settings.value('sysResPath')
-        self._sysresParser = SimplePLParser(None, sysResPath)
+        self._sysres = loadSystemResponse(sysResPath)
 
     def initSpectrometer(self):
         self.spectrometer = Spectrometer()
@@ -152,6 +171,10 @@ class MainWindow(QtGui.QMainWindow):
     @QtCore.Slot(str)
     def updateStatus(self, status):
         self.statusLabel.setText(status)
+        if self.plot is not None:
+            # Show the live plot latency when hovering over the status
+            self.statusLabel.setToolTip(
+                            self.plot.getRedrawStats().describe())
 
     @QtCore.Slot(float)
     def updateGrating(self, grating):
@@ -191,7 +214,10 @@ class MainWindow(QtGui.QMainWindow):
 
         # Calculate the signal by dividing by the system response,
         # and update that too
-        sysres = self._sysresParser.getSysRes(self._wavelength)
+        if self._sysres is None or self._wavelength is None:
+            sysres = np.nan
+        else:
+            sysres = self._sysres(self._wavelength)
         self.updateSignal(rawSignal / sysres)
 
     @QtCore.Slot(float)
@@ -318,6 +344,21 @@ class MainWindow(QtGui.QMainWindow):
         self.abortScanAction.triggered.connect(self.abortScan)
         self.abortScanAction.setEnabled(False)
 
+        self.queueScanAction = QtGui.QAction('Add Scan to &Queue', self)
+        self.queueScanAction.setStatusTip('Add a scan to the queue')
+        self.queueScanAction.setToolTip('Add a scan to the queue')
+        self.queueScanAction.triggered.connect(self.queueScan)
+
+        self.runQueueAction = QtGui.QAction('&Run Queue', self)
+        self.runQueueAction.setStatusTip('Run the queued scans')
+        self.runQueueAction.setToolTip('Run the queued scans')
+        self.runQueueAction.triggered.connect(self.runQueue)
+
+        self.clearQueueAction = QtGui.QAction('&Clear Queue', self)
+        self.clearQueueAction.setStatusTip('Remove all queued scans')
+        self.clearQueueAction.setToolTip('Remove all queued scans')
+        self.clearQueueAction.triggered.connect(self.clearQueue)
+
         self.configInstrumentsAction = QtGui.QAction('&Instruments', self)
         self.configInstrumentsAction.setStatusTip('Configure the instruments')
         self.configInstrumentsAction.setToolTip('Configure the instruments')
@@ -385,6 +426,10 @@ class MainWindow(QtGui.QMainWindow):
         scanMenu.addAction(self.gotoWavelengthAction)
         scanMenu.addAction(self.startScanAction)
         scanMenu.addAction(self.abortScanAction)
+        scanMenu.addSeparator().setText("Queue")
+        scanMenu.addAction(self.queueScanAction)
+        scanMenu.addAction(self.runQueueAction)
+        scanMenu.addAction(self.clearQueueAction)
         configMenu = menubar.addMenu('&Config')
         configMenu.addAction(self.configInstrumentsAction)
         configMenu.addAction(self.configSysResAction)
@@ -482,6 +527,10 @@ class MainWindow(QtGui.QMainWindow):
         self.gotoWavelengthAction.setEnabled(spec and notScanning)
         self.startScanAction.setEnabled(all)
         self.abortScanAction.setEnabled(scanning)
+        pending = bool(self.queue.getPendingJobs())
+        self.queueScanAction.setEnabled(spec and notScanning)
+        self.runQueueAction.setEnabled(all and pending)
+        self.clearQueueAction.setEnabled(notScanning and bool(self.queue))
         self.configInstrumentsAction.setEnabled(not both or notScanning)
         self.configSysResAction.setEnabled(notScanning)
         self.configLockinAction.setEnabled(lockin and notScanning)
@@ -503,7 +552,8 @@ class MainWindow(QtGui.QMainWindow):
         if params is None:
             return  # cancel
 
-        start, stop, step, delay = params
+        (mode, start, stop, step, delay, rate, maxPoints, threshold,
+         passes, alternate, sampleId) = params
 
         # Remove the old spectrum from the plot, and add a new one
         if self.spectrum:
@@ -515,17 +565,122 @@ class MainWindow(QtGui.QMainWindow):
                                                 QtGui.QMessageBox.No)
             if result == QtGui.QMessageBox.Yes:
                 self.clearPlot()
-        self.spectrum = ExpandingSpectrum(self._sysresParser)
+        if mode == 'step' and passes > 1:
+            self.spectrum = AveragedSpectrum(
+                                    getTargetWavelengths(start, stop, step),
+                                    self._sysres)
+        else:
+            self.spectrum = ExpandingSpectrum(self._sysres)
+        # Snapshot the settings now, since they may change before saving
+        self.spectrum.metadata = self.getMetadata(sampleId)
         self.plot.addSpectrum(self.spectrum)
 
-        self.scanner = Scanner(self.spectrometer, self.lockin, self.spectrum,
-                               start, stop, step, delay)
+        if mode == 'sweep':
+            self.scanner = SweepScanner(self.spectrometer, self.lockin,
+                                        self.spectrum, start, stop, rate)
+        elif mode == 'adaptive':
+            self.scanner = AdaptiveScanner(self.spectrometer, self.lockin,
+                                           self.spectrum, start, stop, step,
+                                           delay, maxPoints, threshold)
+        else:
+            self.scanner = Scanner(self.spectrometer, self.lockin,
+                                   self.spectrum, start, stop, step, delay,
+                                   passes, alternate)
         self.scanner.statusChanged.connect(self.updateStatus)
         self.scanner.started.connect(self.updateActions)
         self.scanner.finished.connect(self.updateActions)
         self.scanner.sigException.connect(self.scannerException)
         self.scanner.start()
 
+    def queueScan(self):
+        # Get the scan parameters from the user
+        params = StartScanDialog.getScanParameters(
+                                        spectrometer=self.spectrometer,
+                                        parent=self)
+        if params is None:
+            return  # cancel
+        (mode, start, stop, step, delay, _rate, _maxPoints, _threshold,
+         passes, _alternate, sampleId) = params
+        if mode != 'step' or passes != 1:
+            QtGui.QMessageBox.warning(self, 'Unsupported scan',
+                                      'Only single pass step scans can be '
+                                      'queued.')
+            return
+
+        # Get the output path
+        dirpath = self._settings.value('last_directory', '')
+        filepath, filter = QtGui.QFileDialog.getSaveFileName(parent=self,
+                                caption='Save the queued spectrum as',
+                                dir=dirpath,
+                                filter=';;'.join(SAVE_FILTERS))
+        if not filepath:
+            return
+        if (filter == SAVE_FILTERS[1] and
+                not filepath.lower().endswith(BINARY_EXTENSION)):
+            filepath += BINARY_EXTENSION
+        dirpath, _filename = os.path.split(filepath)
+        self._settings.setValue('last_directory', dirpath)
+
+        metadata = self.getMetadata(sampleId)
+        job = ScanJob(start, stop, step, delay, metadata.pop('config'),
+                      filepath, metadata=metadata)
+        self.queue.add(job)
+        pending = self.queue.getPendingJobs()
+        self.updateStatus('{} queued scans, {} total.'.format(
+                    len(pending),
+                    formatDuration(self.queue.getRemainingDuration())))
+        self.updateActions()
+
+    def runQueue(self):
+        if self.scanner and self.scanner.isScanning():
+            return  # a scan is already running
+
+        if not self._scanSaved:
+            self.savePrompt()  # Prompt the user to save the scan
+
+        self._queueSpectrum = None
+        self.scanner = QueueRunner(self.spectrometer, self.lockin,
+                                   self.queue, self._sysres)
+        self.scanner.sigSpectrumStarted.connect(self.queueSpectrumStarted)
+        self.scanner.statusChanged.connect(self.updateStatus)
+        self.scanner.started.connect(self.updateActions)
+        self.scanner.finished.connect(self.updateActions)
+        self.scanner.sigException.connect(self.queueException)
+        self.scanner.start()
+
+    def clearQueue(self):
+        result = QtGui.QMessageBox.question(self,
+                                            'Clear queue?',
+                                            'Do you want to remove all '
+                                            'queued scans?',
+                                            QtGui.QMessageBox.Yes,
+                                            QtGui.QMessageBox.No)
+        if result == QtGui.QMessageBox.Yes:
+            self.queue.clear()
+        self.updateActions()
+
+    @QtCore.Slot(object)
+    def queueSpectrumStarted(self, spectrum):
+        # Queued spectra are saved automatically, so only the running
+        # job's spectrum is kept on the plot
+        if self._queueSpectrum is not None:
+            try:
+                self.plot.removeSpectrum(self._queueSpectrum)
+            except ValueError:
+                pass  # the plot was cleared
+        self._queueSpectrum = spectrum
+        self.spectrum = spectrum
+        self._scanSaved = True
+        self.plot.addSpectrum(spectrum)
+
+    @QtCore.Slot(Exception)
+    def queueException(self, e):
+        # The queue runner has marked the job failed, and carries on with
+        # the next one, so don't raise it into the excepthook dialog,
+        # which would block the unattended queue
+        log.error('Queued scan failed: %r', e)
+        self.updateStatus('Queued scan failed: {}'.format(e))
+
     def abortScan(self):
         if not self.scanner.isScanning():
             self.updateActions()
@@ -563,8 +718,10 @@ class MainWindow(QtGui.QMainWindow):
 
         if self.lockin:
             self.lockin.thread.wait()
+            self.lockin.close()
         if self.spectrometer:
             self.spectrometer.thread.wait()
+            self.spectrometer.close()
 
         self.initSpectrometer()
         self.initLockin()
@@ -577,7 +734,7 @@ class MainWindow(QtGui.QMainWindow):
         if not sysResPath:
             return
         self._settings.setValue('sysResPath', sysResPath)
-        self._sysresParser = SimplePLParser(None, sysResPath)
+        self._sysres = loadSystemResponse(sysResPath)
 
     def configLockin(self):
         # Get the config parameters
@@ -658,17 +815,30 @@ class MainWindow(QtGui.QMainWindow):
 
     def saveFile(self):
         dirpath = self._settings.value('last_directory', '')
-        filepath, _filter = QtGui.QFileDialog.getSaveFileName(parent=self,
+        filepath, filter = QtGui.QFileDialog.getSaveFileName(parent=self,
                                 caption='Save the current spectrum',
                                 dir=dirpath,
-                                filter='Tab Delimited Text (*.txt)')
+                                filter=';;'.join(SAVE_FILTERS))
         if not filepath:
             return
+        if (filter == SAVE_FILTERS[1] and
+                not filepath.lower().endswith(BINARY_EXTENSION)):
+            filepath += BINARY_EXTENSION
         dirpath, _filename = os.path.split(filepath)
         self._settings.setValue('last_directory', dirpath)
+        # The metadata was snapshotted when the scan started
         self.spectrum.save(filepath)
         self._scanSaved = True
 
+    def getMetadata(self, sampleId=None):
+        '''
+        Returns the metadata saved with a spectrum in the binary format,
+        from the current settings.
+        '''
+        return dict(config=getInstrumentConfig(self._settings),
+                    sysres_path=self._settings.value('sysResPath', None),
+                    sample_id=sampleId or None)
+
     def saveAsFile(self):
         self.saveFile()
 
@@ -701,8 +871,10 @@ class MainWindow(QtGui.QMainWindow):
                 self.lockin.thread.quit()
             if self.spectrometer:
                 self.spectrometer.thread.wait()
+                self.spectrometer.close()
             if self.lockin:
                 self.lockin.thread.wait()
+                self.lockin.close()
             self.writeWindowSettings()
             event.accept()
         else:
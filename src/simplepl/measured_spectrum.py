@@ -23,23 +23,29 @@
 
 # third party imports
 from PySide import QtCore
-import numpy as np
 
 # local imports
 from abstract_spectrum import AbstractSpectrum
 from simple_pl_parser import SimplePLParser
+from spectrum_data import writeSpectrum
 
 
 class MeasuredSpectrum(AbstractSpectrum):
 
     def __init__(self,
                  wavelength=None, signal=None, rawSignal=None, phase=None,
-                 **kwargs):
+                 signalError=None, rawSignalError=None, settleTime=None,
+                 metadata=None, **kwargs):
         super(MeasuredSpectrum, self).__init__(**kwargs)
         self._wavelength = wavelength
         self._signal = signal
         self._rawSignal = rawSignal
         self._phase = phase
+        self._signalError = signalError
+        self._rawSignalError = rawSignalError
+        self._settleTime = settleTime
+        # e.g. the sample ID and time constant, from a binary file
+        self.metadata = metadata or {}
 
     def getWavelength(self):
         return self._wavelength
@@ -54,7 +60,17 @@ class MeasuredSpectrum(AbstractSpectrum):
         return self._phase
 
     def getEnergy(self):
-        return 1239.842 / self.getWavelength()
+        return self._derived.get('energy',
+                                 lambda: 1239.842 / self.getWavelength())
+
+    def getSignalError(self):
+        return self._signalError
+
+    def getRawSignalError(self):
+        return self._rawSignalError
+
+    def getSettleTime(self):
+        return self._settleTime
 
     @classmethod
     def open(cls, filepath, sysres_filepath=None):
@@ -63,33 +79,18 @@ class MeasuredSpectrum(AbstractSpectrum):
         return cls(wavelength=parser.wavelength,
                    signal=parser.signal,
                    rawSignal=parser.rawSignal,
-                   phase=parser.phase)
-
-    def save(self, filepath):
-        wavelengths = self.getWavelength()
-        signals = self.getSignal()
-        rawSignals = self.getRawSignal()
-        phases = self.getPhase()
-        with open(filepath, 'w') as f:
-            f.write('Wavelength\tSignal\tRaw_Signal\tPhase\n')
-            for i in xrange(wavelengths.size):
-                if wavelengths is not None:
-                    wavelength = wavelengths[i]
-                else:
-                    wavelength = np.nan
-                if signals is not None:
-                    signal = signals[i]
-                else:
-                    signal = np.nan
-                if rawSignals is not None:
-                    rawSignal = rawSignals[i]
-                else:
-                    rawSignal = np.nan
-                if phases is not None:
-                    phase = phases[i]
-                else:
-                    phase = np.nan
-                f.write('%.1f\t%E\t%E\t%.1f\n' % (wavelength,
-                                                  signal,
-                                                  rawSignal,
-                                                  phase))
+                   phase=parser.phase,
+                   signalError=parser.signalError,
+                   rawSignalError=parser.rawSignalError,
+                   settleTime=parser.settleTime,
+                   metadata=parser.metadata)
+
+    def save(self, filepath, metadata=None):
+        '''
+        Saves the spectrum as text, or in the binary format if filepath
+        ends with spectrum_data.BINARY_EXTENSION, with the spectrum's
+        metadata updated by the given metadata.
+        '''
+        merged = dict(self.metadata)
+        merged.update(metadata or {})
+        writeSpectrum(self, filepath, merged)
@@ -0,0 +1,186 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Runs a scan without the GUI, using the settings in an ini file:
+
+    python -m simplepl.scan scan.ini -o spectrum.txt
+
+If the output file ends with .splb, the spectrum is saved in the binary
+format, along with the instrument settings used.
+
+Use --simulate to run with the simulated drivers, or --emulate to run the
+real drivers against emulated instruments.
+
+An example settings file:
+
+    [General]
+    simulate = 0
+    sysResPath = /path/to/system_response.txt
+
+    [scan]
+    ; step, adaptive or sweep
+    mode = step
+    start = 800
+    stop = 1600
+    step = 1
+    ; in seconds, or 0 to wait only until the lock-in settles
+    delay = 0.3
+    ; adaptive scans only
+    max_points = 500
+    threshold = 0
+    ; sweep scans only, in nm/min
+    rate = 100
+    output = spectrum.txt
+    ; saved in the metadata of binary (.splb) spectra
+    sample_id = A1234
+
+    [spectrometer]
+    port = COM4
+    entrance_mirror = Front
+    exit_mirror = Side
+    configs/size = 2
+    configs/1/wavelength = 800
+    configs/1/grating = 2
+    configs/1/filter = 2
+    configs/2/wavelength = 1600
+
+    [filterWheel]
+    port = COM5
+
+    [lockin]
+    port = COM6
+    time_constant_index = 9
+
+The scan can be aborted with Ctrl-C, in which case the points measured so
+far are still saved. Neither PySide nor pyqtgraph are imported.
+'''
+
+# std lib imports
+import argparse
+import sys
+
+# third party imports
+
+# local imports
+from .settings import Settings
+from .spectrum_data import SpectrumBuffer
+from .system_response import loadSystemResponse
+from .instruments.core import (openSpectrometer, openLockin,
+                               SIMULATE_DRIVERS, SIMULATE_PROTOCOL)
+from .scan_core import (StepScanEngine, AdaptiveScanEngine, SweepScanEngine,
+                        getInstrumentConfig)
+
+
+def makeEngine(spectrometer, lockin, spectrum, settings, onStatus=None):
+    '''
+    Returns the scan engine for the 'scan/mode' setting.
+    '''
+    mode = settings.value('scan/mode', 'step')
+    start = float(settings.value('scan/start'))
+    stop = float(settings.value('scan/stop'))
+    kwargs = dict(settings=settings, onStatus=onStatus)
+    if mode == 'sweep':
+        rate = float(settings.value('scan/rate'))
+        return SweepScanEngine(spectrometer, lockin, spectrum,
+                               start, stop, rate, **kwargs)
+    step = float(settings.value('scan/step'))
+    delay = float(settings.value('scan/delay'))
+    if mode == 'adaptive':
+        maxPoints = int(settings.value('scan/max_points'))
+        threshold = float(settings.value('scan/threshold', 0))
+        return AdaptiveScanEngine(spectrometer, lockin, spectrum,
+                                  start, stop, step, delay,
+                                  maxPoints, threshold, **kwargs)
+    if mode == 'step':
+        return StepScanEngine(spectrometer, lockin, spectrum,
+                              start, stop, step, delay, **kwargs)
+    raise ValueError('unknown scan mode: {}'.format(mode))
+
+
+def printStatus(status):
+    print status
+    sys.stdout.flush()
+
+
+def run(settings, output):
+    '''
+    Runs the scan described by settings, and saves the spectrum to
+    output. Returns the exit status.
+    '''
+    sysres = loadSystemResponse(settings.value('sysResPath', None))
+    spectrum = SpectrumBuffer(sysres)
+    spectrometer = openSpectrometer(settings)
+    lockin = openLockin(settings)
+    engine = makeEngine(spectrometer, lockin, spectrum, settings,
+                        onStatus=printStatus)
+    metadata = dict(config=getInstrumentConfig(settings),
+                    sysres_path=settings.value('sysResPath', None),
+                    sample_id=settings.value('scan/sample_id', None))
+
+    status = 0
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        engine.abort()
+        printStatus('Scan aborted')
+        status = 1
+    finally:
+        spectrometer.close()
+        lockin.close()
+    if len(spectrum):
+        spectrum.save(output, metadata)
+        printStatus('Saved {} points to {}'.format(len(spectrum), output))
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m simplepl.scan',
+                                     description='Runs a scan without the '
+                                                 'GUI.')
+    parser.add_argument('config',
+                        help='the settings (ini) file describing the scan')
+    parser.add_argument('-o', '--output',
+                        help='the file to save the spectrum to '
+                             '(default: the scan/output setting)')
+    parser.add_argument('--simulate', action='store_true',
+                        help='simulate the instruments')
+    parser.add_argument('--emulate', action='store_true',
+                        help='run the real drivers against emulated '
+                             'instruments')
+    args = parser.parse_args(argv)
+
+    try:
+        settings = Settings.fromFile(args.config)
+        if args.emulate:
+            settings.setValue('simulate', SIMULATE_PROTOCOL)
+        elif args.simulate:
+            settings.setValue('simulate', SIMULATE_DRIVERS)
+        output = args.output or settings.value('scan/output', None)
+        if output is None:
+            parser.error('no output file given')
+        return run(settings, output)
+    except (IOError, ValueError) as e:
+        sys.stderr.write('error: {}\n'.format(e))
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
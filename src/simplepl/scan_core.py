@@ -0,0 +1,848 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+The Qt-free scan engines. Each engine runs a scan in the calling thread,
+and reports its progress through callbacks. The Qt scanners in
+scanners.py run these engines in a QThread, and headless scripts (see
+scan.py) run them directly.
+'''
+
+# std lib imports
+import threading
+import time
+
+# third party imports
+import numpy as np
+
+# local imports
+from scan_planner import planScan, getTargetWavelengths
+from instruments.drivers.transport import CancelledError
+
+# The shortest interval (in seconds) between lock-in reads during a sweep
+MIN_SWEEP_INTERVAL = 0.01
+
+# The narrowest interval (in nm) that an adaptive scan will split
+MIN_ADAPTIVE_STEP = 0.1
+
+# The shortest interval (in seconds) between reads of the lock-in's
+# internal buffer during a buffered sweep
+MIN_BUFFER_POLL_INTERVAL = 0.1
+
+# A step scan delay of AUTO_DELAY waits at each point only until the
+# lock-in settles
+AUTO_DELAY = 0.
+
+# The number of time constants that sweep samples are discarded for after
+# the lock-in sensitivity is changed, while the output settles.
+RANGE_SETTLE_TIME_CONSTANTS = 5
+
+
+def getInstrumentConfig(settings):
+    '''
+    Returns a dict of the diverter and lock-in settings that are applied
+    at the start of a scan.
+    '''
+    return dict(
+        entrance_mirror=settings.value('spectrometer/entrance_mirror',
+                                       'Front'),
+        exit_mirror=settings.value('spectrometer/exit_mirror', 'Side'),
+        time_constant_index=int(settings.value(
+                                        'lockin/time_constant_index',
+                                        9)),  # 300 ms default
+        reserve_mode_index=int(settings.value(
+                                        'lockin/reserve_mode_index',
+                                        0)),  # High reserve default
+        input_line_filter_index=int(settings.value(
+                                        'lockin/input_line_filter_index',
+                                        3)),  # both filters default
+        )
+
+
+class StageTimings(object):
+    '''
+    Accumulates the wall time spent in each stage of a scan.
+    '''
+
+    def __init__(self):
+        self._stages = []
+        self._totals = {}
+        self._counts = {}
+
+    def add(self, stage, seconds):
+        if stage not in self._totals:
+            self._stages.append(stage)
+            self._totals[stage] = 0.
+            self._counts[stage] = 0
+        self._totals[stage] += seconds
+        self._counts[stage] += 1
+
+    def getTotals(self):
+        '''
+        Returns a list of (stage, total seconds, count) tuples, in the
+        order the stages were first seen.
+        '''
+        return [(stage, self._totals[stage], self._counts[stage])
+                for stage in self._stages]
+
+    def describe(self):
+        return ', '.join('{} {:.1f} s'.format(stage, total)
+                         for stage, total, _count in self.getTotals())
+
+
+
+class ScanEngine(object):
+    '''
+    The Qt-free base of the scan engines. The spectrometer and lock-in can
+    be the Qt Spectrometer and Lockin, or a SpectrometerCore and
+    LockinCore.
+
+    Parameters
+    ----------
+    settings : QSettings or Settings
+        the settings that the scan config is read from
+    wantsAbort : threading.Event
+        set to abort the scan. A new Event is created if None.
+    onStatus : callable
+        called with a status string as the scan progresses
+    '''
+
+    abortedStatus = 'Scan aborted.'
+
+    def __init__(self, spectrometer, lockin, spectrum, settings,
+                 wantsAbort=None, onStatus=None):
+        self.spectrometer = spectrometer
+        self.lockin = lockin
+        self.spectrum = spectrum
+        self.settings = settings
+        if wantsAbort is None:
+            wantsAbort = threading.Event()
+        self.wantsAbort = wantsAbort
+        self.onStatus = onStatus
+        self._lastGrating = None
+        self._lastFilter = None
+        self._runningLock = threading.Lock()
+        self._running = False
+
+    def _status(self, status):
+        if self.onStatus is not None:
+            self.onStatus(status)
+
+    def abort(self):
+        '''
+        Aborts the scan. If an instrument operation is in progress, it is
+        cancelled, so the scan stops without waiting for it to finish.
+        This is safe to call from any thread.
+        '''
+        self.wantsAbort.set()
+        with self._runningLock:
+            if self._running:
+                self.spectrometer.cancelIO()
+                self.lockin.cancelIO()
+
+    def _resumeIO(self):
+        self.spectrometer.resumeIO()
+        self.lockin.resumeIO()
+
+    def run(self):
+        '''
+        Runs the scan in the calling thread.
+        '''
+        with self._runningLock:
+            self._running = True
+        try:
+            self._run()
+        except CancelledError:
+            self._resumeIO()
+            self._cancelled()
+            self._status(self.abortedStatus)
+        finally:
+            with self._runningLock:
+                self._running = False
+                self._resumeIO()
+
+    def _run(self):
+        raise NotImplementedError()
+
+    def _cancelled(self):
+        '''
+        Called after an instrument operation is cancelled by abort(), to
+        leave the instruments in a usable state.
+        '''
+        pass
+
+    def _configure(self, config=None):
+        '''
+        Applies the diverter and lock-in config, which defaults to the
+        current settings.
+        '''
+        if config is None:
+            config = getInstrumentConfig(self.settings)
+        self._status('Configuring Diverters...')
+        self._applyDivertersConfig(config)
+        self._status('Configuring Lock-in...')
+        self._applyLockinConfig(config)
+        self._lastGrating = self.spectrometer.getGrating()
+        self._lastFilter = self.spectrometer.getFilter()
+
+    def _applyDivertersConfig(self, config):
+        self.spectrometer.setEntranceMirror(config['entrance_mirror'])
+        self.spectrometer.setExitMirror(config['exit_mirror'])
+
+    def _applyLockinConfig(self, config):
+        self.lockin.setTimeConstantIndex(config['time_constant_index'])
+        self.lockin.setReserveModeIndex(config['reserve_mode_index'])
+        self.lockin.setInputLineFilterIndex(
+                                        config['input_line_filter_index'])
+
+
+class StepScanEngine(ScanEngine):
+    '''
+    Steps from start to stop, waiting delay seconds at each point before
+    reading the lock-in. If delay is AUTO_DELAY, the lock-in is read
+    repeatedly until it settles instead. The time waited at each point is
+    stored in the spectrum as the settle time.
+
+    If passes is greater than one, the scan is repeated, alternating
+    direction each pass if alternate is True, and spectrum must be an
+    AveragedSpectrum of the target wavelengths.
+    '''
+
+    def __init__(self, spectrometer, lockin, spectrum,
+                 start, stop, step, delay, passes=1, alternate=False,
+                 **kwargs):
+        super(StepScanEngine, self).__init__(spectrometer, lockin, spectrum,
+                                             **kwargs)
+        self._start = start
+        self._stop = stop
+        self._step = step
+        self._delay = delay
+        self._passes = passes
+        self._alternate = alternate
+        self.timings = StageTimings()
+
+    def _run(self):
+        # Apply the spectrometer and lockin config's
+        self._configure()
+
+        # Start the scan
+        targets = getTargetWavelengths(self._start, self._stop, self._step)
+        for n in xrange(self._passes):
+            if self._passes > 1:
+                status = 'Scanning pass {} of {}'.format(n + 1, self._passes)
+            else:
+                status = 'Scanning'
+            if self._alternate and n % 2:
+                aborted = not self._stepScan(targets[-1], targets[0],
+                                             -self._step, status)
+            else:
+                aborted = not self._stepScan(targets[0], targets[-1],
+                                             self._step, status)
+            if aborted:
+                # Abort the scan
+                self._status('Scan aborted.')
+                return
+
+        # The scan is finished.
+        self._status('Scan finished ({}).'.format(self.timings.describe()))
+
+    def _stepScan(self, start, stop, step, status='Scanning'):
+        '''
+        Steps from start to stop, adding each measurement to the
+        spectrum. The grating and filter are changed at most once per
+        segment of the scan plan. Returns False if aborted, or True if not.
+
+        The scan is pipelined: as soon as the lock-in has been read for one
+        point, the spectrometer starts moving to the next point while the
+        measurement is added to the spectrum. The time spent in each stage
+        is accumulated in self.timings.
+        '''
+        plan = planScan(self.spectrometer.getConfigTable(),
+                        start, stop, step,
+                        self._lastGrating, self._lastFilter)
+        self._status('{} ({})...'.format(status, plan.describe()))
+        timings = self.timings
+        for segment in plan.segments:
+            # Check for abort
+            if self.wantsAbort.isSet():
+                return False
+
+            # Change the grating and filter before the segment
+            t0 = time.time()
+            self.spectrometer.changeGratingAndFilter(segment.grating,
+                                                     segment.filter)
+            t1 = time.time()
+            self.spectrometer.moveTo(segment.wavelengths[0])
+            t2 = time.time()
+            self._settleIfChanged()
+            timings.add('grating/filter', t1 - t0)
+            timings.add('move', t2 - t1)
+            timings.add('settle', time.time() - t2)
+
+            previous = []
+            for i, target_wavelength in enumerate(segment.wavelengths):
+                # Check for abort
+                if self.wantsAbort.isSet():
+                    return False
+
+                # Take a measurement
+                t0 = time.time()
+                wavelength = self.spectrometer.getWavelength()
+                rawSignal, phase, settleTime = self._readLockin(
+                                                        previous[-2:])
+                previous.append(rawSignal)
+                timings.add('measure', time.time() - t0)
+
+                # Start moving to the next point
+                if i + 1 < len(segment):
+                    mover = self.spectrometer.startMoveTo(
+                                                segment.wavelengths[i + 1])
+                else:
+                    mover = None
+
+                # Add it to the spectrum during the move, keeping the
+                # wavelengths in order
+                t0 = time.time()
+                if self._passes > 1:
+                    self.spectrum.add(target_wavelength, wavelength,
+                                      rawSignal, phase, settleTime)
+                elif plan.isReordered():
+                    self.spectrum.insert(wavelength, rawSignal, phase,
+                                         settleTime=settleTime)
+                else:
+                    self.spectrum.append(wavelength, rawSignal, phase,
+                                         settleTime=settleTime)
+                timings.add('bookkeeping', time.time() - t0)
+
+                # Wait for the move to finish
+                if mover is not None:
+                    t0 = time.time()
+                    mover.wait()
+                    timings.add('wait for move', time.time() - t0)
+                    timings.add('move', mover.elapsed)
+        return True
+
+    def _settleIfChanged(self):
+        '''
+        Waits for the lock-in to settle if the grating or filter changed
+        since the last call.
+        '''
+        # Check if the grating or filter changed
+        new_grating = self.spectrometer.getGrating()
+        new_filter = self.spectrometer.getFilter()
+        if (new_grating != self._lastGrating or
+                new_filter != self._lastFilter):
+            # Grating or filter switched. Wait 5 time constants
+            # before continuing the scan.
+            self.wantsAbort.wait(self.lockin.getTimeConstantSeconds() * 5)
+        self._lastGrating = new_grating
+        self._lastFilter = new_filter
+
+    def _readLockin(self, previous=None):
+        '''
+        Reads the lock-in after a move, waiting the delay, or until the
+        lock-in settles if the delay is AUTO_DELAY. Returns (rawSignal,
+        phase, settleTime).
+        '''
+        if self._delay <= AUTO_DELAY:
+            return self.lockin.settleAndGetOutputs(previous=previous)
+        t0 = time.time()
+        rawSignal, phase = self.lockin.adjustAndGetOutputs(self._delay,
+                                                           previous)
+        return rawSignal, phase, time.time() - t0
+
+    def _measure(self, target_wavelength, previous=None):
+        '''
+        Moves the spectrometer to the target wavelength, and takes a
+        measurement. Returns (wavelength, rawSignal, phase, settleTime).
+        '''
+        # Move the spectrometer
+        self.spectrometer.setWavelength(target_wavelength)
+        self._settleIfChanged()
+
+        # Take a measurement
+        wavelength = self.spectrometer.getWavelength()
+        rawSignal, phase, settleTime = self._readLockin(previous)
+        return wavelength, rawSignal, phase, settleTime
+
+
+class QueueEngine(StepScanEngine):
+    '''
+    Runs the pending jobs of a ScanQueue back to back, saving each
+    spectrum to the job's output path when it finishes. The diverters and
+    lock-in are only reconfigured when a job's config differs from the
+    previous job's.
+
+    Parameters
+    ----------
+    spectrumFactory : callable
+        returns a new, empty spectrum for each job
+    onSpectrumStarted : callable
+        called with the new spectrum when a job starts
+    onProgress : callable
+        called with the number of finished jobs, the total number of jobs,
+        and the estimated remaining time in seconds, or NaN if unknown.
+        Auto delay jobs are estimated from the time per point of the last
+        auto delay job, so the estimate is unknown until one finishes.
+    onException : callable
+        called with the exception if a job fails. The failed job is
+        skipped. If None, the exception is raised.
+    '''
+
+    abortedStatus = 'Queue aborted.'
+
+    def __init__(self, spectrometer, lockin, queue, spectrumFactory,
+                 onSpectrumStarted=None, onProgress=None, onException=None,
+                 **kwargs):
+        super(QueueEngine, self).__init__(spectrometer, lockin, None,
+                                          None, None, None, None, **kwargs)
+        self.queue = queue
+        self._spectrumFactory = spectrumFactory
+        self._onSpectrumStarted = onSpectrumStarted
+        self._onProgress = onProgress
+        self._onException = onException
+
+    def onSpectrumStarted(self, spectrum):
+        if self._onSpectrumStarted is not None:
+            self._onSpectrumStarted(spectrum)
+
+    def onProgress(self, finished, total, eta):
+        if self._onProgress is not None:
+            self._onProgress(finished, total, eta)
+
+    def onException(self, e):
+        if self._onException is None:
+            raise e
+        self._onException(e)
+
+    def _run(self):
+        lastConfig = None
+        pointTime = None  # measured time per point of auto delay jobs
+        total = len(self.queue.getPendingJobs())
+        finished = 0
+        failed = 0
+        while True:
+            job = self.queue.getNextJob()
+            if job is None:
+                break
+
+            # Check for abort
+            if self.wantsAbort.isSet():
+                self._status('Queue aborted.')
+                return
+
+            eta = self.queue.getRemainingDuration(pointTime)
+            self.onProgress(finished, total, eta)
+            self.queue.setStatus(job, 'running')
+            self._start = job.start
+            self._stop = job.stop
+            self._step = job.step
+            self._delay = job.delay
+            # Time each job separately
+            self.timings = StageTimings()
+            self.spectrum = self._spectrumFactory()
+            metadata = dict(job.metadata, config=job.config)
+            self.spectrum.metadata = metadata
+            self.onSpectrumStarted(self.spectrum)
+            try:
+                if job.config != lastConfig:
+                    self._configure(job.config)
+                    lastConfig = job.config
+                status = 'Job {} of {}, {} remaining'.format(
+                                finished + 1, total, formatDuration(eta))
+                t0 = time.time()
+                if not self._stepScan(job.start, job.stop, job.step,
+                                      status):
+                    # Abort the queue, and run the job again next time
+                    self.queue.setStatus(job, 'pending')
+                    self._status('Queue aborted.')
+                    return
+                if job.delay <= AUTO_DELAY:
+                    pointTime = (time.time() - t0) / job.getPointCount()
+                self.spectrum.save(job.outputPath, metadata)
+                self._status('Job {} of {} finished ({}).'.format(
+                                finished + 1, total, self.timings.describe()))
+            except CancelledError:
+                # Aborted, so run the job again next time
+                self.queue.setStatus(job, 'pending')
+                raise
+            except Exception as e:
+                # Keep going, so that one bad job doesn't waste the night
+                self.queue.setStatus(job, 'failed')
+                lastConfig = None
+                finished += 1
+                failed += 1
+                self.onException(e)
+                continue
+            self.queue.setStatus(job, 'done')
+            finished += 1
+
+        # The queue is finished.
+        self.onProgress(finished, total, 0.)
+        if failed:
+            self._status('Queue finished ({} of {} jobs failed).'.format(
+                                                            failed, total))
+        else:
+            self._status('Queue finished.')
+
+
+def formatDuration(t):
+    '''
+    Formats a duration in seconds as 'h h m m s s', or 'unknown' if it
+    is NaN.
+    '''
+    if not np.isfinite(t):
+        return 'unknown'
+    t = int(t)
+    h = t / 3600
+    m = (t - h * 3600) / 60
+    s = t - h * 3600 - m * 60
+    return '%d h %d m %d s' % (h, m, s)
+
+
+class AdaptiveScanEngine(StepScanEngine):
+    '''
+    Takes a coarse step scan from start to stop, and then refines it by
+    measuring the midpoints of the intervals where the signal changes
+    faster than a straight line can follow, relative to the noise. The
+    refinement stops once the estimated error of every interval is below
+    the threshold (in units of the noise), or after maxPoints points.
+    '''
+
+    def __init__(self, spectrometer, lockin, spectrum,
+                 start, stop, step, delay, maxPoints, threshold, **kwargs):
+        super(AdaptiveScanEngine, self).__init__(spectrometer, lockin,
+                                                 spectrum, start, stop,
+                                                 step, delay, **kwargs)
+        self._maxPoints = maxPoints
+        self._threshold = threshold
+
+    def _run(self):
+        # Apply the spectrometer and lockin config's
+        self._configure()
+
+        # Start with a coarse scan
+        if not self._stepScan(self._start, self._stop, self._step):
+            # Abort the scan
+            self._status('Scan aborted.')
+            return
+
+        # Refine it
+        self._status('Refining...')
+        while len(self.spectrum.getWavelength()) < self._maxPoints:
+            # Check for abort
+            if self.wantsAbort.isSet():
+                # Abort the scan
+                self._status('Scan aborted.')
+                return
+
+            # Find the interval with the largest estimated error
+            wavelengths = self.spectrum.getWavelength()
+            rawSignals = self.spectrum.getRawSignal()
+            if len(wavelengths) < 2:
+                break  # no interval to refine
+            # Re-estimate the noise as points are added
+            noise = estimateNoise(rawSignals, wavelengths)
+            errors = getIntervalErrors(wavelengths, rawSignals) / noise
+            widths = np.abs(np.diff(wavelengths))
+            errors[widths < MIN_ADAPTIVE_STEP * 2] = 0.
+            i = np.argmax(errors)
+            if errors[i] < self._threshold:
+                break
+
+            # Measure the midpoint of the interval
+            target_wavelength = (wavelengths[i] + wavelengths[i + 1]) / 2.
+            expected = (rawSignals[i] + rawSignals[i + 1]) / 2.
+            wavelength, rawSignal, phase, settleTime = self._measure(
+                                                target_wavelength, [expected])
+            self.spectrum.insert(wavelength, rawSignal, phase,
+                                 settleTime=settleTime)
+
+        # The scan is finished.
+        self._status('Scan finished.')
+
+
+def estimateNoise(y, x=None):
+    '''
+    Estimates the standard deviation of the noise in y from the median
+    absolute deviation of each point from the straight line through its
+    neighbours, which is insensitive to the few points near a peak. If x
+    is None, the points are assumed to be evenly spaced.
+    '''
+    if len(y) < 3:
+        return np.inf
+    if x is None:
+        x = np.arange(len(y), dtype=np.float64)
+    # the weights of the left and right neighbours in the interpolation
+    right = (x[1:-1] - x[:-2]) / (x[2:] - x[:-2])
+    left = 1. - right
+    residuals = y[1:-1] - (left * y[:-2] + right * y[2:])
+    # the residual of white noise has a standard deviation of
+    # sqrt(1 + left**2 + right**2) times that of the noise
+    residuals /= np.sqrt(1. + left ** 2 + right ** 2)
+    noise = np.median(np.abs(residuals)) / 0.6745
+    if noise == 0.:
+        return np.finfo(np.float64).tiny
+    return noise
+
+
+def getIntervalErrors(x, y):
+    '''
+    Returns the estimated error of linear interpolation at the midpoint of
+    each interval between adjacent points, from the curvature at either
+    end. Intervals where the signal changes linearly have no error, no
+    matter how steep they are.
+    '''
+    dx = np.diff(x)
+    dy = np.diff(y)
+    slopes = dy / dx
+    curvatures = np.zeros(len(x))
+    if len(x) > 2:
+        curvatures[1:-1] = np.abs(2. * np.diff(slopes) / (x[2:] - x[:-2]))
+        curvatures[0] = curvatures[1]
+        curvatures[-1] = curvatures[-2]
+    curvature = np.maximum(curvatures[:-1], curvatures[1:])
+    return dx ** 2 * curvature / 8.
+
+
+class SweepScanEngine(ScanEngine):
+    '''
+    Scans the spectrometer continuously at a fixed rate (in nm/min),
+    while polling the lock-in once per time constant. Each sample is
+    tagged with the measured spectrometer position and a timestamp.
+    Samples taken while the lock-in was over range, or while it settled
+    after a sensitivity change, are discarded.
+
+    If the 'scan/buffered' setting is enabled, the lock-in outputs are
+    instead stored in the lock-in's internal buffer and read in bulk, so
+    that the GPIB bus doesn't limit the sample rate.
+    '''
+
+    def __init__(self, spectrometer, lockin, spectrum,
+                 start, stop, rate, **kwargs):
+        super(SweepScanEngine, self).__init__(spectrometer, lockin, spectrum,
+                                              **kwargs)
+        self._start = start
+        self._stop = stop
+        self._rate = rate
+        self._buffered = bool(int(self.settings.value('scan/buffered', 0)))
+        self._settleTime = 0.
+        self._rangeTimes = []
+        self._fullScales = []
+        self._discarded = 0
+
+    def _run(self):
+        # Apply the spectrometer and lockin config's
+        self._configure()
+
+        timeConstant = self.lockin.getTimeConstantSeconds()
+        interval = max(timeConstant, MIN_SWEEP_INTERVAL)
+        self._settleTime = timeConstant * RANGE_SETTLE_TIME_CONSTANTS
+        self._discarded = 0
+
+        for segmentStart, segmentStop in self._getSegments():
+            # Move to the start of the segment, and autorange the lock-in,
+            # waiting 5 time constants for it to settle.
+            self._status('Moving to start...')
+            self.spectrometer.setGratingAndFilterFor(
+                                        (segmentStart + segmentStop) / 2.)
+            self.spectrometer.moveTo(segmentStart)
+            self.lockin.adjustAndGetOutputs(timeConstant * 5)
+            if self.wantsAbort.isSet():
+                self._status('Scan aborted.')
+                return
+            self._resetRange()
+
+            # Start the sweep, and read the lock-in until it's done
+            self._status('Sweeping...')
+            self.spectrometer.scanTo(segmentStop, self._rate)
+            if self._buffered:
+                aborted = self._sweepBuffered(interval)
+            else:
+                aborted = self._sweepPolled(interval)
+            if aborted:
+                # Abort the scan
+                self.spectrometer.abortScan()
+                self._status('Scan aborted.')
+                return
+
+        # The scan is finished.
+        if self._discarded:
+            self._status('Scan finished (%d samples discarded while the '
+                         'lock-in was over range or settling).'
+                         % self._discarded)
+        else:
+            self._status('Scan finished.')
+
+    def _cancelled(self):
+        # Stop the sweep that was in progress
+        self.spectrometer.abortScan()
+
+    def _resetRange(self):
+        '''
+        Starts a new sensitivity history, assuming the lock-in has settled
+        at its current sensitivity.
+        '''
+        self._rangeTimes = [-np.inf]
+        self._fullScales = [self.lockin.getSensitivity()]
+
+    def _adjustRange(self, rawSignal):
+        '''
+        Changes the sensitivity if rawSignal is outside of the current
+        range, and records the time of the change so that the samples
+        taken while the lock-in settles can be discarded.
+        '''
+        changeTime = time.time()
+        if self.lockin.adjustSensitivity(rawSignal):
+            self._rangeTimes.append(changeTime)
+            self._fullScales.append(self.lockin.getSensitivity())
+
+    def _getValid(self, timestamps, rawSignals):
+        '''
+        Returns a boolean array that is False for the samples that were
+        over the full scale of the sensitivity in use at the time, or that
+        were taken while the lock-in settled after a sensitivity change.
+        '''
+        timestamps = np.asarray(timestamps, dtype=float)
+        rawSignals = np.asarray(rawSignals, dtype=float)
+        i = np.searchsorted(self._rangeTimes, timestamps, 'right') - 1
+        fullScales = np.asarray(self._fullScales)[i]
+        settledTimes = np.asarray(self._rangeTimes)[i] + self._settleTime
+        valid = (timestamps >= settledTimes) & (np.abs(rawSignals) <=
+                                                fullScales)
+        self._discarded += np.count_nonzero(~valid)
+        return valid
+
+    def _sweepPolled(self, interval):
+        '''
+        Polls the lock-in outputs and spectrometer position every interval
+        seconds until the current sweep is done. Returns True if aborted.
+        '''
+        nextTime = time.time()
+        while True:
+            # Check for abort
+            if self.wantsAbort.isSet():
+                return True
+
+            # Take a measurement
+            wavelength, done = self.spectrometer.getScanProgress()
+            timestamp = time.time()
+            rawSignal, phase = self.lockin.getOutputs()
+
+            # Append to the spectrum, unless the lock-in was over range or
+            # still settling after a sensitivity change
+            if self._getValid([timestamp], [rawSignal])[0]:
+                self.spectrum.append(wavelength, rawSignal, phase, timestamp)
+
+            # Keep the signal in range for the next measurement
+            self._adjustRange(rawSignal)
+
+            # Check if we're done with this segment
+            if done:
+                return False
+
+            # Wait for the next measurement
+            nextTime += interval
+            remaining = nextTime - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def _sweepBuffered(self, interval):
+        '''
+        Stores the lock-in outputs in the lock-in's internal buffer, while
+        polling the spectrometer position, until the current sweep is done.
+        The buffered points are tagged with the position interpolated to
+        their sample times, and the points that were over range or taken
+        while the lock-in settled are dropped. Returns True if aborted.
+        '''
+        pollInterval = max(interval, MIN_BUFFER_POLL_INTERVAL)
+        bufferSize = self.lockin.getBufferSize()
+        sampleRate = self.lockin.startBufferedOutputs(1. / interval)
+        startTime = time.time()
+        times = []
+        positions = []
+        read = 0  # the number of buffered points already read
+        while True:
+            # Check for abort
+            if self.wantsAbort.isSet():
+                self.lockin.pauseBufferedOutputs()
+                return True
+
+            # Record the position
+            position, done = self.spectrometer.getScanProgress()
+            positions.append(position)
+            times.append(time.time())
+
+            # Read the new points from the buffer
+            count = self.lockin.getBufferCount()
+            full = (count >= bufferSize)
+            if done or full:
+                self.lockin.pauseBufferedOutputs()
+                count = self.lockin.getBufferCount()
+            if count > read:
+                rawSignals, phases = self.lockin.getBufferedOutputs(
+                                                        read, count - read)
+                timestamps = startTime + (np.arange(read, count) /
+                                          sampleRate)
+                wavelengths = np.interp(timestamps, times, positions)
+
+                # Drop the points that were over range, or taken while the
+                # lock-in settled after a sensitivity change
+                valid = self._getValid(timestamps, rawSignals)
+                for i in np.flatnonzero(valid):
+                    self.spectrum.append(wavelengths[i], rawSignals[i],
+                                         phases[i], timestamps[i])
+                read = count
+
+                # Keep the signal in range for the next measurement, using
+                # the largest point so that peaks within the block are not
+                # clipped
+                self._adjustRange(np.max(rawSignals))
+
+            # Check if we're done with this segment
+            if done:
+                return False
+
+            # Restart the buffer if it's full
+            if full:
+                sampleRate = self.lockin.startBufferedOutputs(1. / interval)
+                startTime = time.time()
+                read = 0
+
+            time.sleep(pollInterval)
+
+    def _getSegments(self):
+        '''
+        Returns a list of (start, stop) tuples, splitting the scan at the
+        configured grating and filter boundaries, since the grating and
+        filter cannot be changed during a sweep.
+        '''
+        wavelengths = self.spectrometer.getConfigTable().wavelengths
+        lower = min(self._start, self._stop)
+        upper = max(self._start, self._stop)
+        edges = [lower]
+        for wavelength in wavelengths:
+            wavelength = float(wavelength)
+            if lower < wavelength < upper:
+                edges.append(wavelength)
+        edges.append(upper)
+        if self._start > self._stop:
+            edges.reverse()
+        return zip(edges[:-1], edges[1:])
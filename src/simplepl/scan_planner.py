@@ -0,0 +1,186 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Plans step scans ahead of time, so that the grating and filter are
+changed as few times as possible.
+'''
+
+# third party imports
+import numpy as np
+
+
+class ScanSegment(object):
+    '''
+    A run of target wavelengths that share the same grating and filter.
+    '''
+
+    def __init__(self, grating, filter, wavelengths):
+        self.grating = grating
+        self.filter = filter
+        self.wavelengths = wavelengths
+
+    def __len__(self):
+        return len(self.wavelengths)
+
+    def __repr__(self):
+        return ('ScanSegment(grating={}, filter={}, {} points)'
+                ''.format(self.grating, self.filter, len(self)))
+
+
+class ScanPlan(object):
+    '''
+    The target wavelengths of a step scan, grouped into segments so that
+    each grating and filter combination is visited once. If the configs
+    reuse a combination in non-adjacent wavelength ranges, the wavelengths
+    are measured out of order (see isReordered).
+    '''
+
+    def __init__(self, segments, grating=None, filter=None):
+        self.segments = segments
+        self._grating = grating
+        self._filter = filter
+
+    def getWavelengths(self):
+        '''
+        Returns the target wavelengths in the order they will be measured.
+        '''
+        if not self.segments:
+            return np.array([])
+        return np.concatenate([s.wavelengths for s in self.segments])
+
+    def getPointCount(self):
+        return sum(len(s) for s in self.segments)
+
+    def isReordered(self):
+        '''
+        Returns True if the wavelengths are not measured in scan order.
+        '''
+        wavelengths = self.getWavelengths()
+        steps = np.diff(wavelengths)
+        return not (np.all(steps > 0) or np.all(steps < 0))
+
+    def _getChanges(self):
+        '''
+        Returns a list of (gratingChanged, filterChanged) tuples, one
+        for each segment.
+        '''
+        changes = []
+        grating = self._grating
+        filter = self._filter
+        for segment in self.segments:
+            changes.append((grating is not None and
+                            segment.grating != grating,
+                            filter is not None and
+                            segment.filter != filter))
+            grating = segment.grating
+            filter = segment.filter
+        return changes
+
+    def getGratingMoves(self):
+        '''
+        Returns the expected number of grating changes.
+        '''
+        return sum(g for g, f in self._getChanges())
+
+    def getFilterMoves(self):
+        '''
+        Returns the expected number of filter changes.
+        '''
+        return sum(f for g, f in self._getChanges())
+
+    def getSettleCount(self):
+        '''
+        Returns the expected number of times the scan has to wait for the
+        lock-in to settle after a grating and/or filter change. The
+        grating and filter are changed in parallel, so a segment that
+        changes both only has to settle once.
+        '''
+        return sum(g or f for g, f in self._getChanges())
+
+    def getDuration(self, delay, settleTime=0.):
+        '''
+        Returns the expected duration of the scan in seconds.
+
+        Parameters
+        ----------
+        delay : float
+            the delay before each measurement in seconds
+        settleTime : float
+            the time to wait after a grating and/or filter change in
+            seconds
+        '''
+        return (self.getPointCount() * delay +
+                self.getSettleCount() * settleTime)
+
+    def describe(self):
+        '''
+        Returns a short description of the plan for display.
+        '''
+        return ('{} points in {} segments, {} grating and {} filter moves'
+                ''.format(self.getPointCount(), len(self.segments),
+                          self.getGratingMoves(), self.getFilterMoves()))
+
+
+def getTargetWavelengths(start, stop, step):
+    '''
+    Returns the target wavelengths of a step scan from start to stop,
+    including stop if it falls on a step.
+    '''
+    if step == 0:
+        raise ValueError('step must not be zero')
+    count = int(np.floor((stop - start) / float(step) + 1e-9)) + 1
+    return float(start) + step * np.arange(max(count, 1))
+
+
+def planScan(configTable, start, stop, step, grating=None, filter=None):
+    '''
+    Plans a step scan.
+
+    Parameters
+    ----------
+    configTable : ConfigTable
+        the compiled grating and filter configs, as returned by
+        Spectrometer.getConfigTable
+    start, stop, step : float
+        the scan parameters in nm
+    grating, filter : int
+        the current grating and filter, if known, so that the first
+        segment is counted as a move if needed
+
+    Returns
+    -------
+    plan : ScanPlan
+    '''
+    targets = getTargetWavelengths(start, stop, step)
+    gratings, filters = configTable.targetsFor(targets)
+
+    # Group the targets by (grating, filter), in order of first appearance
+    keys = []
+    groups = {}
+    for target, g, f in zip(targets, gratings, filters):
+        key = (int(g), int(f))
+        if key not in groups:
+            keys.append(key)
+            groups[key] = []
+        groups[key].append(target)
+    segments = [ScanSegment(key[0], key[1], np.array(groups[key]))
+                for key in keys]
+    return ScanPlan(segments, grating, filter)
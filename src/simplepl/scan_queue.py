@@ -0,0 +1,192 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Defines the ScanJob and ScanQueue classes, which describe a series of
+scans to run unattended, and persist it to disk so that it can be resumed
+after a crash.
+'''
+
+# std lib imports
+import json
+import os
+
+# third party imports
+import numpy as np
+
+# local imports
+from scan_planner import getTargetWavelengths
+from scan_core import AUTO_DELAY
+
+
+class ScanJob(object):
+    '''
+    A single step scan in a ScanQueue.
+
+    Parameters
+    ----------
+    start, stop, step : float
+        the scan range in nm
+    delay : float
+        the delay before each measurement in seconds
+    config : dict
+        the lock-in and diverter settings, as returned by
+        scan_core.getInstrumentConfig
+    outputPath : str
+        where to save the spectrum when the scan finishes
+    status : str
+        'pending', 'running', 'done' or 'failed'
+    metadata : dict
+        saved with the spectrum in the binary format, e.g. the sample ID
+        and system response path when the scan was queued
+    '''
+
+    def __init__(self, start, stop, step, delay, config, outputPath,
+                 status='pending', metadata=None):
+        self.start = start
+        self.stop = stop
+        self.step = step
+        self.delay = delay
+        self.config = config
+        self.outputPath = outputPath
+        self.status = status
+        self.metadata = metadata or {}
+
+    def getPointCount(self):
+        return getTargetWavelengths(self.start, self.stop, self.step).size
+
+    def getDuration(self, pointTime=None):
+        '''
+        Returns the estimated duration of the scan in seconds: at least
+        the delay per point, or for an auto delay scan, pointTime per
+        point (e.g. as measured in an earlier scan). The duration of an
+        auto delay scan is NaN (unknown) if pointTime is None.
+        '''
+        if self.delay > AUTO_DELAY:
+            return self.getPointCount() * self.delay
+        if pointTime is None:
+            return np.nan
+        return self.getPointCount() * pointTime
+
+    def toDict(self):
+        return dict(start=self.start, stop=self.stop, step=self.step,
+                    delay=self.delay, config=self.config,
+                    outputPath=self.outputPath, status=self.status,
+                    metadata=self.metadata)
+
+    @classmethod
+    def fromDict(cls, d):
+        return cls(float(d['start']), float(d['stop']), float(d['step']),
+                   float(d['delay']), dict(d['config']), d['outputPath'],
+                   d.get('status', 'pending'), dict(d.get('metadata', {})))
+
+    def __repr__(self):
+        return ('ScanJob({}, {}, {}, {}, {!r}, status={!r})'
+                ''.format(self.start, self.stop, self.step, self.delay,
+                          self.outputPath, self.status))
+
+
+class ScanQueue(object):
+    '''
+    An ordered list of ScanJobs. If a filepath is given, the queue is
+    saved to it after every change.
+    '''
+
+    def __init__(self, filepath=None):
+        self.filepath = filepath
+        self.jobs = []
+
+    @classmethod
+    def load(cls, filepath):
+        '''
+        Loads the queue from filepath, or returns an empty queue if the
+        file does not exist. Jobs that were running when the queue was
+        last saved (e.g. because of a crash) are reset to pending, so that
+        they are run again.
+        '''
+        queue = cls(filepath)
+        if not os.path.exists(filepath):
+            return queue
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+        for d in data['jobs']:
+            job = ScanJob.fromDict(d)
+            if job.status == 'running':
+                job.status = 'pending'
+            queue.jobs.append(job)
+        return queue
+
+    def save(self):
+        '''
+        Saves the queue to its filepath, if it has one. The file is
+        replaced atomically where possible, so a crash while saving leaves
+        the old queue intact.
+        '''
+        if self.filepath is None:
+            return
+        tmppath = self.filepath + '.tmp'
+        with open(tmppath, 'w') as f:
+            json.dump({'jobs': [job.toDict() for job in self.jobs]}, f,
+                      indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.name == 'nt' and os.path.exists(self.filepath):
+            # os.rename doesn't replace existing files on Windows
+            os.remove(self.filepath)
+        os.rename(tmppath, self.filepath)
+
+    def add(self, job):
+        self.jobs.append(job)
+        self.save()
+
+    def remove(self, job):
+        self.jobs.remove(job)
+        self.save()
+
+    def clear(self):
+        self.jobs = []
+        self.save()
+
+    def setStatus(self, job, status):
+        job.status = status
+        self.save()
+
+    def getPendingJobs(self):
+        return [job for job in self.jobs if job.status == 'pending']
+
+    def getNextJob(self):
+        '''
+        Returns the first pending job, or None if there are none.
+        '''
+        for job in self.jobs:
+            if job.status == 'pending':
+                return job
+        return None
+
+    def getRemainingDuration(self, pointTime=None):
+        '''
+        Returns the estimated duration of the pending jobs in seconds, or
+        NaN if it is unknown. See ScanJob.getDuration.
+        '''
+        return float(np.sum([job.getDuration(pointTime)
+                             for job in self.getPendingJobs()]))
+
+    def __len__(self):
+        return len(self.jobs)
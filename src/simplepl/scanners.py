@@ -25,6 +25,11 @@ import threading
 # third party imports
 from PySide import QtCore
 
+# local imports
+from .expanding_spectrum import ExpandingSpectrum
+from .scan_core import (StepScanEngine, AdaptiveScanEngine, QueueEngine,
+                        SweepScanEngine, getInstrumentConfig, formatDuration)
+
 
 class BaseScanner(QtCore.QObject):
 
@@ -77,86 +82,104 @@ class GoToer(BaseScanner):
         self.statusChanged.emit('Idle.')
 
 
-class Scanner(BaseScanner):
 
-    def __init__(self, spectrometer, lockin, spectrum,
-                 start, stop, step, delay):
-        super(Scanner, self).__init__()
-        self.spectrometer = spectrometer
-        self.lockin = lockin
-        self.spectrum = spectrum
-        self._start = start
-        self._stop = stop
-        self._step = step
-        self._delay = delay
+class EngineScanner(BaseScanner):
+    '''
+    Runs a Qt-free scan engine (see scan_core.py) in a QThread, and turns
+    its callbacks into Signals.
+    '''
 
+    def __init__(self):
+        super(EngineScanner, self).__init__()
         self.settings = QtCore.QSettings()
+        self.engine = None
+
+    def _engineKwargs(self):
+        return dict(settings=self.settings,
+                    wantsAbort=self.wantsAbort,
+                    onStatus=self.statusChanged.emit)
+
+    def abort(self):
+        # The engine also cancels the instrument operation in progress
+        self.engine.abort()
 
     def _scan(self):
-        # Apply the spectrometer and lockin config's
-        self.statusChanged.emit('Configuring Diverters...')
-        self._applyDivertersConfig()
-        self.statusChanged.emit('Configuring Lock-in...')
-        self._applyLockinConfig()
-
-        # Start the scan
-        self.statusChanged.emit('Scanning...')
-        target_wavelength = self._start
-        last_grating = self.spectrometer.getGrating()
-        last_filter = self.spectrometer.getFilter()
-        while True:
-            # Check for abort
-            if self.wantsAbort.isSet():
-                # Abort the scan
-                self.statusChanged.emit('Scan aborted.')
-                return
-
-            # Move the spectrometer
-            self.spectrometer.setWavelength(target_wavelength)
-
-            # Check if the grating or filter changed
-            new_grating = self.spectrometer.getGrating()
-            new_filter = self.spectrometer.getFilter()
-            if new_grating != last_grating or new_filter != last_filter:
-                # Grating or filter switched. Wait 5 time constants
-                # before continuing the scan.
-                self.thread.sleep(self.lockin.getTimeConstantSeconds() * 5)
-            last_grating = new_grating
-            last_filter = new_filter
-
-            # Take a measurement
-            wavelength = self.spectrometer.getWavelength()
-            rawSignal, phase = self.lockin.adjustAndGetOutputs(self._delay)
-
-            # Append to the spectrum
-            self.spectrum.append(wavelength, rawSignal, phase)
-
-            # Check if we're done
-            target_wavelength += self._step
-            if target_wavelength > self._stop:
-                break
-
-        # The scan is finished.
-        self.statusChanged.emit('Scan finished.')
-
-    def _applyDivertersConfig(self):
-        entranceMirror = self.settings.value('spectrometer/entrance_mirror',
-                                             'Front')
-        exitMirror = self.settings.value('spectrometer/exit_mirror',
-                                         'Side')
-        self.spectrometer.setEntranceMirror(entranceMirror)
-        self.spectrometer.setExitMirror(exitMirror)
-
-    def _applyLockinConfig(self):
-        timeConstantIndex = int(self.settings.value(
-                                            'lockin/time_constant_index',
-                                            9))  # 300 ms default
-        reserveModeIndex = int(self.settings.value(
-                                            'lockin/reserve_mode_index',
-                                            0))  # High reserve default
-        inputLineFilterIndex = int(self.settings.value(
-                                            'lockin/input_line_filter_index',
-                                            3))  # both filters default
-        self.lockin.setTimeConstantIndex(timeConstantIndex)
-        self.lockin.setReserveModeIndex(reserveModeIndex)
-        self.lockin.setInputLineFilterIndex(inputLineFilterIndex)
+        self.engine.run()
+
+
+class Scanner(EngineScanner):
+    '''
+    Steps from start to stop, waiting delay seconds at each point before
+    reading the lock-in.
+
+    If passes is greater than one, the scan is repeated, alternating
+    direction each pass if alternate is True, and spectrum must be an
+    AveragedSpectrum of the target wavelengths.
+    '''
+
+    def __init__(self, spectrometer, lockin, spectrum,
+                 start, stop, step, delay, passes=1, alternate=False):
+        super(Scanner, self).__init__()
+        self.engine = StepScanEngine(spectrometer, lockin, spectrum,
+                                     start, stop, step, delay,
+                                     passes, alternate,
+                                     **self._engineKwargs())
+
+    @property
+    def timings(self):
+        return self.engine.timings
+
+
+class AdaptiveScanner(EngineScanner):
+    '''
+    Takes a coarse step scan from start to stop, and then refines it
+    around the spectral features. See AdaptiveScanEngine.
+    '''
+
+    def __init__(self, spectrometer, lockin, spectrum,
+                 start, stop, step, delay, maxPoints, threshold):
+        super(AdaptiveScanner, self).__init__()
+        self.engine = AdaptiveScanEngine(spectrometer, lockin, spectrum,
+                                         start, stop, step, delay,
+                                         maxPoints, threshold,
+                                         **self._engineKwargs())
+
+
+class SweepScanner(EngineScanner):
+    '''
+    Scans the spectrometer continuously at a fixed rate (in nm/min). See
+    SweepScanEngine.
+    '''
+
+    def __init__(self, spectrometer, lockin, spectrum,
+                 start, stop, rate):
+        super(SweepScanner, self).__init__()
+        self.engine = SweepScanEngine(spectrometer, lockin, spectrum,
+                                      start, stop, rate,
+                                      **self._engineKwargs())
+
+
+class QueueRunner(EngineScanner):
+    '''
+    Runs the pending jobs of a ScanQueue back to back. See QueueEngine.
+
+    Emits
+    -----
+        sigSpectrumStarted(ExpandingSpectrum) when a job starts
+        sigProgress(int, int, float) with the number of finished jobs,
+            the total number of jobs, and the estimated remaining time in
+            seconds, or NaN if unknown
+    '''
+
+    sigSpectrumStarted = QtCore.Signal(object)
+    sigProgress = QtCore.Signal(int, int, float)
+
+    def __init__(self, spectrometer, lockin, queue, sysres=None):
+        super(QueueRunner, self).__init__()
+        self.engine = QueueEngine(
+                        spectrometer, lockin, queue,
+                        spectrumFactory=lambda: ExpandingSpectrum(sysres),
+                        onSpectrumStarted=self.sigSpectrumStarted.emit,
+                        onProgress=self.sigProgress.emit,
+                        onException=self.sigException.emit,
+                        **self._engineKwargs())
@@ -0,0 +1,114 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Defines the Settings class--a Qt-free stand-in for QtCore.QSettings,
+used by headless scans.
+'''
+
+# std lib imports
+import ConfigParser
+
+
+class Settings(object):
+    '''
+    A dict based settings object with the subset of the QSettings
+    interface that the instruments and scans use, including arrays.
+
+    Keys are '/' separated, e.g. 'lockin/port'. Like QSettings in ini
+    format, values read from a file are strings, so callers should convert
+    them, e.g. int(settings.value('simulate', 0)).
+    '''
+
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+        self._array = None
+        self._arrayIndex = None
+        self.filepath = None
+
+    @classmethod
+    def fromFile(cls, filepath):
+        '''
+        Reads the settings from an ini file. Each option is stored under
+        the key 'section/option', except for options in the [General]
+        section, which are stored under 'option'. Arrays are stored with
+        1-based indices, as QSettings does, e.g.
+
+            [spectrometer]
+            configs/size = 2
+            configs/1/wavelength = 800
+            configs/1/grating = 1
+            configs/1/filter = 2
+            configs/2/wavelength = 1600
+
+        Backslashes in option names are treated as '/', so ini files saved
+        by QSettings can be read directly.
+        '''
+        parser = ConfigParser.RawConfigParser()
+        parser.optionxform = str  # keep the case of option names
+        if not parser.read(filepath):
+            raise IOError('unable to read settings file: {}'
+                          ''.format(filepath))
+        settings = cls()
+        for section in parser.sections():
+            for option, value in parser.items(section):
+                option = option.replace('\\', '/')
+                if section == 'General':
+                    key = option
+                else:
+                    key = '{}/{}'.format(section, option)
+                settings._values[key] = value
+        settings.filepath = filepath
+        return settings
+
+    def _key(self, key):
+        if self._array is None:
+            return key
+        return '{}/{}/{}'.format(self._array, self._arrayIndex + 1, key)
+
+    def value(self, key, defaultValue=None):
+        return self._values.get(self._key(key), defaultValue)
+
+    def setValue(self, key, value):
+        self._values[self._key(key)] = value
+
+    def contains(self, key):
+        return self._key(key) in self._values
+
+    def beginReadArray(self, prefix):
+        self._array = prefix
+        self._arrayIndex = 0
+        return int(self._values.get(prefix + '/size', 0))
+
+    def beginWriteArray(self, prefix, size=-1):
+        self._array = prefix
+        self._arrayIndex = 0
+        if size >= 0:
+            self._values[prefix + '/size'] = size
+
+    def setArrayIndex(self, i):
+        self._arrayIndex = i
+
+    def endArray(self):
+        self._array = None
+        self._arrayIndex = None
+
+    def sync(self):
+        pass
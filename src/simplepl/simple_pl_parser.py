@@ -20,12 +20,65 @@
 #######################################################################
 
 # std lib imports
+import itertools
 import logging
 log = logging.getLogger(__name__)
 
 # third party imports
 import numpy as np
 
+# local imports
+from spectrum_data import isBinarySpectrum, readSpectrumBinary
+from system_response import loadSystemResponse
+
+# The attribute that each known column header is read into. Unknown
+# columns are ignored.
+COLUMN_ATTRIBUTES = {'Wavelength': 'wavelength',
+                     'RawSignal': 'rawSignal',
+                     'Raw_Signal': 'rawSignal',
+                     'Phase': 'phase',
+                     'Signal': 'signal',
+                     'SysResRem': 'signal',
+                     'Signal_Error': 'signalError',
+                     'Raw_Signal_Error': 'rawSignalError',
+                     'Settle_Time': 'settleTime'}
+
+# The columns of the old LabVIEW format
+LABVIEW_ATTRIBUTES = ('wavelength', 'rawSignal', 'signal')
+
+# The array attributes set by parse
+ARRAY_ATTRIBUTES = ('wavelength', 'signal', 'rawSignal', 'phase',
+                    'signalError', 'rawSignalError', 'settleTime', 'time')
+
+# The default number of rows per chunk for iterChunks
+CHUNK_ROWS = 65536
+
+
+def parseTable(text, columnCount=None):
+    '''
+    Parses whitespace separated floats into a 2D array with columnCount
+    columns, or as many columns as the first line has if columnCount is
+    None. Raises a ValueError if the text is not a complete table of
+    floats.
+    '''
+    if columnCount is None:
+        for line in text.splitlines():
+            if line.strip():
+                columnCount = len(line.split())
+                break
+        else:
+            return np.empty((0, 0))
+    values = np.fromstring(text, sep=' ')
+    # fromstring stops at the first value that isn't a float, so check
+    # that every line was read. Counting the lines is much faster than
+    # counting the values, which is only needed if there are blank lines.
+    text = text.strip()
+    if values.size != (text.count('\n') + 1) * columnCount:
+        if values.size % columnCount or values.size != len(text.split()):
+            raise ValueError('invalid table of {} columns'
+                             ''.format(columnCount))
+    return values.reshape(-1, columnCount)
+
 
 class SimplePLParser(object):
     def __init__(self, filepath=None, sysresFilepath=None):
@@ -34,157 +87,150 @@ class SimplePLParser(object):
             the PL filepath
         sysresFilepath : string
             the system response filepath. If this is provided it overrides
-            the system response used in the saved file (if possible).
+            the system response used in the saved file (if possible). The
+            system response is shared with other parsers of the same file
+            (see system_response.getSystemResponse).
         '''
         self.filepath = filepath
         self.sysresFilepath = sysresFilepath
-        self._sysresParser = None
-        if sysresFilepath is not None:
-            self._sysresParser = SimplePLParser(sysresFilepath)
-            try:
-                self._sysresParser.parse()
-                log.debug('Opened system response file: {}'
-                          ''.format(sysresFilepath))
-            except:
-                log.debug('Unable to open system response file: {}'
-                          ''.format(sysresFilepath))
-                self._sysresParser = None
+        self.sysres = loadSystemResponse(sysresFilepath)
 
     def getSysRes(self, wavelength):
-        if self._sysresParser is None:
-            return np.nan
-        i = np.searchsorted(self._sysresParser.wavelength, wavelength)
-        return self._sysresParser.rawSignal[i]
-
-    def parse(self):
-        self.wavelength = []
-        self.rawSignal = []
-        self.phase = []
-        self.signal = []
+        '''
+        Returns the system response at the given wavelength, or array of
+        wavelengths, or NaN if there is no system response.
+        '''
+        if self.sysres is None:
+            return np.nan * np.ones_like(wavelength, dtype=np.double)
+        return self.sysres(wavelength)
+
+    def parse(self, mmap=False):
+        '''
+        Reads the whole file, setting the wavelength, energy, signal,
+        rawSignal, phase, signalError, rawSignalError, settleTime and time
+        arrays, or None for those that are not in the file, and the
+        metadata dict.
+
+        Binary files (see spectrum_data.saveSpectrumBinary) are read into
+        memory, unless mmap is True. Memory-mapped arrays are read-only,
+        and keep the file open until they are deleted, so it can't be
+        overwritten on Windows.
+        '''
+        self.metadata = {}
+        if isBinarySpectrum(self.filepath):
+            columns, self.metadata = readSpectrumBinary(self.filepath,
+                                                        mmap=mmap)
+            self._checkSysRes(columns.keys())
+            self._setColumns(self._applySysRes(columns))
+            return
         with open(self.filepath, 'rU') as f:
-            first_line = f.readline()
-            if first_line.startswith('**\tSample ID:'):
-                self._parseLabVIEW(first_line, f)
-            elif first_line.startswith('Wavelength\tRawSignal'):
-                self._parseWavelengthRawSignal(first_line, f)
-            elif first_line.startswith('Wavelength\tRaw_Signal'):
-                self._parseWavelengthRawSignal(first_line, f)
-            elif first_line.startswith('Wavelength\tRawSignal\tPhase'):
-                self._parseWavelengthRawSignalPhase(first_line, f)
-            elif first_line.startswith('Wavelength\tRaw_Signal\tPhase'):
-                self._parseWavelengthRawSignalPhase(first_line, f)
-            elif first_line.startswith('Wavelength\tSysResRem'):
-                self._parseWavelengthSysResRem(first_line, f)
-            elif first_line.startswith('Wavelength\tSignal\tRawSignal\tPhase'):
-                self._parseWavelengthSignalRawSignalPhase(first_line, f)
-            elif first_line.startswith(
-                                    'Wavelength\tSignal\tRaw_Signal\tPhase'):
-                self._parseWavelengthSignalRawSignalPhase(first_line, f)
-            else:
-                raise NotImplementedError()
-        if self.wavelength:
-            self.wavelength = np.array(self.wavelength, dtype=np.double)
-            self.energy = 1239.842 / self.wavelength
-        else:
-            self.wavelength = None
-            self.energy = None
-        if self.signal:
-            self.signal = np.array(self.signal, dtype=np.double)
-        else:
-            self.signal = None
-        if self.rawSignal:
-            self.rawSignal = np.array(self.rawSignal, dtype=np.double)
-        else:
-            self.rawSignal = None
-        if self.phase:
-            self.phase = np.array(self.phase, dtype=np.double)
-        else:
-            self.phase = None
+            attributes = self._parseHeader(f)
+            table = parseTable(f.read())
+        self._setColumns(self._getColumns(attributes, table))
+
+    def iterChunks(self, rows=CHUNK_ROWS):
+        '''
+        Reads the file rows at a time, for files that are too large to
+        read at once. Yields a dict of the arrays that parse would set for
+        each chunk. The header attributes (e.g. sample_id) are set before
+        the first chunk is yielded. Binary files are memory-mapped, so only
+        the chunks that are used are read from disk.
+        '''
+        self.metadata = {}
+        if isBinarySpectrum(self.filepath):
+            columns, self.metadata = readSpectrumBinary(self.filepath)
+            self._checkSysRes(columns.keys())
+            length = len(columns.get('wavelength', ()))
+            for start in xrange(0, length, rows):
+                yield self._applySysRes(dict(
+                            (name, values[start:start + rows])
+                            for name, values in columns.iteritems()))
+            return
+        with open(self.filepath, 'rU') as f:
+            attributes = self._parseHeader(f)
+            columnCount = None
+            while True:
+                lines = list(itertools.islice(f, rows))
+                if not lines:
+                    break
+                text = ''.join(lines)
+                if columnCount is None:
+                    table = parseTable(text)
+                    columnCount = table.shape[1] or None
+                else:
+                    table = parseTable(text, columnCount)
+                if table.size:
+                    yield self._getColumns(attributes, table)
+
+    def _parseHeader(self, f):
+        '''
+        Reads the header lines, and returns the attribute that each
+        column is read into (None for unknown columns).
+        '''
+        first_line = f.readline()
+        if first_line.startswith('**\tSample ID:'):
+            self._parseLabVIEW(first_line, f)
+            return LABVIEW_ATTRIBUTES
+        headers = first_line.split()
+        if not headers or headers[0] != 'Wavelength':
+            raise NotImplementedError()
+        attributes = tuple(COLUMN_ATTRIBUTES.get(h) for h in headers)
+        self._checkSysRes(attributes)
+        return attributes
+
+    def _checkSysRes(self, attributes):
+        if self.sysresFilepath is not None:
+            if 'rawSignal' not in attributes:
+                log.warn("Ignoring the provided system response file")
+            elif 'signal' in attributes:
+                log.warn("Ignoring the signal column")
 
     def _parseLabVIEW(self, first_line, f):
-        self.sample_id = first_line[len('**\tSample ID:')].strip()
-        self.laser_power = f.readline()[len('**\tLaser Power:')].strip()
+        self.sample_id = first_line[len('**\tSample ID:'):].strip()
+        self.laser_power = f.readline()[len('**\tLaser Power:'):].strip()
         self.measurement_type = f.readline()[
-                                        len('**\tMeasurement Type:')].strip()
-        self.datetime_str = f.readline()[len('**\t')].strip()
+                                        len('**\tMeasurement Type:'):].strip()
+        self.datetime_str = f.readline()[len('**\t'):].strip()
         f.readline()  # grating (doesn't work properly)
-        self.time_constant = f.readline()[len('**\tTime Constant:')].strip()
-        self.notes = f.readline()[len('**\tNotes:')].strip()
+        self.time_constant = f.readline()[len('**\tTime Constant:'):].strip()
+        self.notes = f.readline()[len('**\tNotes:'):].strip()
+        self.metadata = dict(sample_id=self.sample_id,
+                             laser_power=self.laser_power,
+                             measurement_type=self.measurement_type,
+                             datetime=self.datetime_str,
+                             time_constant=self.time_constant,
+                             notes=self.notes)
         f.readline()  # blank
         f.readline()  # column headers
         f.readline()  # astrisks
-        while True:
-            line = f.readline()
-            if not line:
-                break  # end of file
-            values = line.split()
-            self.wavelength.append(float(values[0]))
-            self.rawSignal.append(float(values[1]))
-            self.signal.append(float(values[2]))
-
-    def _parseWavelengthRawSignal(self, first_line, f):
-        # first_line is the column headers
-        while True:
-            line = f.readline()
-            if not line:
-                break  # end of file
-            values = line.split()
-            wavelength = float(values[0])
-            raw = float(values[1])
-            self.wavelength.append(wavelength)
-            self.rawSignal.append(raw)
-            if self.sysresFilepath is not None:
-                sysres = self.getSysRes(wavelength)
-                sysresrem = raw / sysres
-                self.signal.append(sysresrem)
-
-    def _parseWavelengthRawSignalPhase(self, first_line, f):
-        # first_line is the column headers
-        while True:
-            line = f.readline()
-            if not line:
-                break  # end of file
-            values = line.split()
-            wavelength = float(values[0])
-            raw = float(values[1])
-            phase = float(values[2])
-            self.wavelength.append(wavelength)
-            self.rawSignal.append(raw)
-            self.phase.append(phase)
-            if self.sysresFilepath is not None:
-                sysres = self.getSysRes(wavelength)
-                signal = raw / sysres
-                self.signal.append(signal)
-
-    def _parseWavelengthSysResRem(self, first_line, f):
-        if self.sysresFilepath is not None:
-            log.warn("Ignoring the provided system response file")
-        # first_line is the column headers
-        while True:
-            line = f.readline()
-            if not line:
-                break  # end of file
-            values = line.split()
-            wavelength = float(values[0])
-            signal = float(values[1])
-            self.wavelength.append(wavelength)
-            self.signal.append(signal)
-
-    def _parseWavelengthSignalRawSignalPhase(self, first_line, f):
-        if self.sysresFilepath is not None:
-            log.warn("Ignoring the signal column")
-        # first_line is the column headers
-        while True:
-            line = f.readline()
-            if not line:
-                break  # end of file
-            values = line.split()
-            self.wavelength.append(float(values[0]))
-            self.rawSignal.append(float(values[2]))
-            self.phase.append(float(values[3]))
-            if self.sysresFilepath is not None:
-                sysres = self.getSysRes(self.wavelength[-1])
-                signal = self.rawSignal[-1] / sysres
-                self.signal.append(signal)
-            else:
-                self.signal.append(float(values[1]))
+
+    def _getColumns(self, attributes, table):
+        '''
+        Returns a dict of the arrays in the table's columns. If a system
+        response file was provided, the signal (and signal error) are
+        calculated from the raw signal.
+        '''
+        columns = {}
+        for i, attribute in enumerate(attributes[:table.shape[1]]):
+            if attribute is not None:
+                columns[attribute] = table[:, i]
+        return self._applySysRes(columns)
+
+    def _applySysRes(self, columns):
+        if self.sysresFilepath is not None and 'rawSignal' in columns:
+            sysres = self.getSysRes(columns['wavelength'])
+            columns['signal'] = columns['rawSignal'] / sysres
+            if 'rawSignalError' in columns:
+                columns['signalError'] = columns['rawSignalError'] / sysres
+        return columns
+
+    def _setColumns(self, columns):
+        for attribute in ARRAY_ATTRIBUTES:
+            values = columns.get(attribute)
+            if values is not None and not values.size:
+                values = None
+            setattr(self, attribute, values)
+        if self.wavelength is not None:
+            self.energy = 1239.842 / self.wavelength
+        else:
+            self.energy = None
@@ -20,6 +20,7 @@
 #######################################################################
 
 # std lib imports
+import time
 
 # third party imports
 from PySide import QtCore
@@ -27,9 +28,12 @@ import pyqtgraph as pg
 from pyqtgraph.graphicsItems.PlotItem import PlotItem
 from pyqtgraph.graphicsItems.ViewBox import ViewBox
 from pyqtgraph.graphicsItems.PlotDataItem import PlotDataItem
+from pyqtgraph.graphicsItems.ErrorBarItem import ErrorBarItem
+import numpy as np
 
 # local imports
 from abstract_spectrum import AbstractSpectrum
+from decimation import LineDecimator
 
 # Use black text on white background
 pg.setConfigOption('background', 'w')
@@ -37,6 +41,48 @@ pg.setConfigOption('foreground', 'k')
 # Enable antialiasing for prettier plots
 pg.setConfigOptions(antialias=True)
 
+# The maximum rate of the live redraws, in frames per second
+FRAME_RATE = 20.
+
+
+class RedrawStats(object):
+    '''
+    Accumulates the latency of the live redraws, i.e. how long after the
+    first change notification each redraw finished, and how long the
+    redraws took, in seconds.
+    '''
+
+    def __init__(self):
+        self.frames = 0
+        self.notifications = 0
+        self.totalLatency = 0.
+        self.maxLatency = 0.
+        self.totalDrawTime = 0.
+
+    def add(self, notifications, latency, drawTime):
+        self.frames += 1
+        self.notifications += notifications
+        self.totalLatency += latency
+        self.maxLatency = max(self.maxLatency, latency)
+        self.totalDrawTime += drawTime
+
+    def getMeanLatency(self):
+        if not self.frames:
+            return 0.
+        return self.totalLatency / self.frames
+
+    def getMeanDrawTime(self):
+        if not self.frames:
+            return 0.
+        return self.totalDrawTime / self.frames
+
+    def describe(self):
+        return ('{} redraws for {} changes, latency {:.0f} ms mean, '
+                '{:.0f} ms max, draw time {:.0f} ms mean'
+                ''.format(self.frames, self.notifications,
+                          self.getMeanLatency() * 1e3, self.maxLatency * 1e3,
+                          self.getMeanDrawTime() * 1e3))
+
 
 class SpectraPlotItem(PlotItem):
 
@@ -59,9 +105,25 @@ class SpectraPlotItem(PlotItem):
 
         self._spectra = []
         self._signalLines = []
+        self._signalErrorBars = []
         self._rawSignalLines = []
         self._phaseLines = []
 
+        # The spectra changed since the last redraw, and when the first
+        # change notification for each was received. sigChanged is
+        # coalesced, so that each spectrum is redrawn at most FRAME_RATE
+        # times per second.
+        self._changed = {}
+        self._changeCount = 0
+        self._lastRedraw = 0.
+        self._redrawStats = RedrawStats()
+        self._redrawTimer = QtCore.QTimer(self)
+        self._redrawTimer.setSingleShot(True)
+        self._redrawTimer.timeout.connect(self._redrawChanged)
+
+        # Long lines are drawn at about screen resolution
+        self._decimator = LineDecimator(self)
+
         # Define the color sequence
         self._colors = [(24, 90, 169),  # blue
                         (220, 40, 40),  # red
@@ -86,22 +148,22 @@ class SpectraPlotItem(PlotItem):
 
     def setSignalEnabled(self, b):
         self._signalEnabled = bool(b)
-        self.updateEnabled()
+        self.updateLines()
 
     def setRawSignalEnabled(self, b):
         self._rawSignalEnabled = bool(b)
-        self.updateEnabled()
+        self.updateLines()
 
     def setPhaseEnabled(self, b):
         self._phaseEnabled = bool(b)
-        self.updateEnabled()
+        self.updateLines()
 
     def updateEnabled(self):
         if self._signalEnabled:
-            for line in self._signalLines:
+            for line in self._signalLines + self._signalErrorBars:
                 line.show()
         else:
-            for line in self._signalLines:
+            for line in self._signalLines + self._signalErrorBars:
                 line.hide()
         if self._rawSignalEnabled:
             for line in self._rawSignalLines:
@@ -176,10 +238,15 @@ class SpectraPlotItem(PlotItem):
     def removeSpectrum(self, spectrum):
         if spectrum not in self._spectra:
             raise ValueError('spectrum not in plot')
-        spectrum.sigChanged.disconnect(self.updateLines())
+        spectrum.sigChanged.disconnect(self._handleSpectrumChanged)
+        self._changed.pop(spectrum, None)
         i = self._spectra.index(spectrum)
         self._spectra.pop(i)
+        for line in (self._signalLines[i], self._rawSignalLines[i],
+                     self._phaseLines[i]):
+            self._decimator.remove(line)
         self.removeItem(self._signalLines.pop(i))
+        self.removeItem(self._signalErrorBars.pop(i))
         self.removeItem(self._rawSignalLines.pop(i))
         self._getPhaseViewBox().removeItem(self._phaseLines.pop(i))
 
@@ -208,34 +275,104 @@ class SpectraPlotItem(PlotItem):
         rawSignalColor = signalColor.lighter()
         phaseColor = rawSignalColor.lighter(120)
 
-        signalLine = self.plot(x=self.getX(spectrum),
-                               y=spectrum.getSignal(),
-                                  pen=pg.mkPen(signalColor))
-        rawSignalLine = self.plot(x=self.getX(spectrum),
-                                  y=spectrum.getRawSignal(),
-                                  pen=pg.mkPen(rawSignalColor,
+        signalLine = self.plot(pen=pg.mkPen(signalColor))
+        signalErrorBar = ErrorBarItem(x=np.array([]), y=np.array([]),
+                                      pen=pg.mkPen(signalColor))
+        self.addItem(signalErrorBar)
+        rawSignalLine = self.plot(pen=pg.mkPen(rawSignalColor,
                                                style=QtCore.Qt.DashLine))
-        phaseLine = PlotDataItem(x=self.getX(spectrum),
-                                 y=spectrum.getPhase(),
-                                 pen=pg.mkPen(phaseColor,
+        phaseLine = PlotDataItem(pen=pg.mkPen(phaseColor,
                                               style=QtCore.Qt.DotLine))
         self._getPhaseViewBox().addItem(phaseLine)
-        self.updateEnabled()
 
         self._signalLines.append(signalLine)
+        self._signalErrorBars.append(signalErrorBar)
         self._rawSignalLines.append(rawSignalLine)
         self._phaseLines.append(phaseLine)
         self._spectra.append(spectrum)
-        spectrum.sigChanged.connect(self.updateLines)
+        self._updateSpectrumLines(spectrum)
+        self.updateEnabled()
+        spectrum.sigChanged.connect(self._handleSpectrumChanged)
 
     def updateLines(self):
-        for spectrum, line in zip(self._spectra, self._signalLines):
-            line.setData(x=self.getX(spectrum),
-                         y=spectrum.getSignal())
-        for spectrum, line in zip(self._spectra, self._rawSignalLines):
-            line.setData(x=self.getX(spectrum),
-                         y=spectrum.getRawSignal())
-        for spectrum, line in zip(self._spectra, self._phaseLines):
-            line.setData(x=self.getX(spectrum),
-                         y=spectrum.getPhase())
+        '''
+        Redraws all of the spectra now.
+        '''
+        self._changed.clear()
+        for spectrum in self._spectra:
+            self._updateSpectrumLines(spectrum)
         self.updateEnabled()
+
+    @QtCore.Slot()
+    def _handleSpectrumChanged(self):
+        '''
+        Schedules a redraw of the changed spectrum, so that it happens at
+        most FRAME_RATE times per second, and only after the pending change
+        notifications have been handled.
+        '''
+        now = time.time()
+        spectrum = self.sender()
+        if spectrum in self._spectra:
+            self._changed.setdefault(spectrum, now)
+        else:
+            # The sender is unknown, so redraw all of the spectra
+            for spectrum in self._spectra:
+                self._changed.setdefault(spectrum, now)
+        self._changeCount += 1
+        if not self._redrawTimer.isActive():
+            wait = self._lastRedraw + 1. / FRAME_RATE - now
+            self._redrawTimer.start(max(0, int(wait * 1000)))
+
+    def _redrawChanged(self):
+        if not self._changed:
+            return
+        start = time.time()
+        changed = self._changed
+        self._changed = {}
+        for spectrum in changed:
+            self._updateSpectrumLines(spectrum)
+        end = time.time()
+        self._lastRedraw = end
+        self._redrawStats.add(self._changeCount, end - min(changed.values()),
+                              end - start)
+        self._changeCount = 0
+
+    def getRedrawStats(self):
+        '''
+        Returns the RedrawStats of the live redraws.
+        '''
+        return self._redrawStats
+
+    def _updateSpectrumLines(self, spectrum):
+        '''
+        Updates the lines of one spectrum. Hidden lines are not updated,
+        since they are redrawn by updateLines when they are enabled.
+        '''
+        i = self._spectra.index(spectrum)
+        x = self.getX(spectrum)
+        # Points that were only appended are added to the lines without
+        # comparing the whole arrays
+        rewrites = spectrum.getRewriteCount()
+        key = None if rewrites is None else (self._xAxisView, rewrites)
+        setData = self._decimator.setData
+        if self._signalEnabled:
+            setData(self._signalLines[i], x, spectrum.getSignal(), key)
+            self._updateErrorBar(spectrum, self._signalErrorBars[i], x)
+        if self._rawSignalEnabled:
+            setData(self._rawSignalLines[i], x, spectrum.getRawSignal(), key)
+        if self._phaseEnabled:
+            setData(self._phaseLines[i], x, spectrum.getPhase(), key)
+
+    def _updateErrorBar(self, spectrum, bar, x=None):
+        '''
+        Shows the signal +/- its standard error, if known.
+        '''
+        error = spectrum.getSignalError()
+        if error is None:
+            empty = np.array([])
+            bar.setData(x=empty, y=empty, top=empty, bottom=empty)
+            return
+        if x is None:
+            x = self.getX(spectrum)
+        error = np.nan_to_num(error)  # no bar where the error is unknown
+        bar.setData(x=x, y=spectrum.getSignal(), top=error, bottom=error)
@@ -0,0 +1,315 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Qt-free spectrum storage and saving, shared by the Qt spectrum classes
+and headless scans.
+'''
+
+# std lib imports
+import json
+import os
+import time
+
+# third party imports
+import logging
+log = logging.getLogger(__name__)
+import numpy as np
+
+# local imports
+from expanding_buffer import ExpandingBuffer
+from version import __version__
+
+# The number of rows formatted at once by writeTable
+WRITE_CHUNK_ROWS = 1024
+
+# The first line of a binary spectrum file
+BINARY_MAGIC = 'SimplePL binary spectrum\n'
+
+# The extension that selects the binary format when saving
+BINARY_EXTENSION = '.splb'
+
+# The version of the binary format
+BINARY_VERSION = 1
+
+# The columns of a binary spectrum file are aligned to this many bytes
+BINARY_ALIGNMENT = 64
+
+# The spectrum getters, and the binary file column each is saved to
+BINARY_COLUMNS = (('getWavelength', 'wavelength'),
+                  ('getSignal', 'signal'),
+                  ('getRawSignal', 'rawSignal'),
+                  ('getPhase', 'phase'),
+                  ('getSignalError', 'signalError'),
+                  ('getRawSignalError', 'rawSignalError'),
+                  ('getSettleTime', 'settleTime'),
+                  ('getTime', 'time'))
+
+
+def writeTable(f, rowFormat, columns, chunkRows=WRITE_CHUNK_ROWS):
+    '''
+    Writes the columns to the file f, formatting each row with rowFormat,
+    e.g. '%.1f\t%E\n'. A block of chunkRows rows is formatted at once with
+    a single % operation, which gives the same text as formatting each
+    row, without the per-value Python overhead.
+    '''
+    if not columns:
+        return
+    data = np.column_stack(columns)
+    for start in xrange(0, len(data), chunkRows):
+        chunk = data[start:start + chunkRows]
+        f.write((rowFormat * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
+def saveSpectrum(spectrum, filepath):
+    '''
+    Saves a spectrum to a tab delimited text file that SimplePLParser can
+    read. The spectrum can be any object with the AbstractSpectrum getters.
+    The settle times, if known, are saved in a last Settle_Time column.
+    '''
+    wavelengths = spectrum.getWavelength()
+    signalErrors = spectrum.getSignalError()
+    rawSignalErrors = spectrum.getRawSignalError()
+    settleTimes = spectrum.getSettleTime()
+    hasErrors = (signalErrors is not None or rawSignalErrors is not None)
+    hasSettleTimes = (settleTimes is not None and
+                      np.isfinite(settleTimes).any())
+    nans = np.full(wavelengths.size, np.nan)
+
+    def orNans(values):
+        return nans if values is None else values
+
+    columns = [wavelengths, orNans(spectrum.getSignal()),
+               orNans(spectrum.getRawSignal()), orNans(spectrum.getPhase())]
+    rowFormat = '%.1f\t%E\t%E\t%.1f'
+    with open(filepath, 'w') as f:
+        if hasErrors:
+            f.write('Wavelength\tSignal\tRaw_Signal\tPhase'
+                    '\tSignal_Error\tRaw_Signal_Error')
+            columns += [orNans(signalErrors), orNans(rawSignalErrors)]
+            rowFormat += '\t%E\t%E'
+        else:
+            f.write('Wavelength\tSignal\tRaw_Signal\tPhase')
+        if hasSettleTimes:
+            f.write('\tSettle_Time')
+            columns.append(settleTimes)
+            rowFormat += '\t%.3f'
+        f.write('\n')
+        writeTable(f, rowFormat + '\n', columns)
+
+
+def saveSpectrumBinary(spectrum, filepath, metadata=None):
+    '''
+    Saves a spectrum to a binary file, which keeps the full precision of
+    the data, and can be memory-mapped by readSpectrumBinary. The spectrum
+    can be any object with the AbstractSpectrum getters, and the per-point
+    timestamps (getTime) are saved too, if available.
+
+    The file is the BINARY_MAGIC line, a line of JSON with the column
+    names, length and metadata, padded to BINARY_ALIGNMENT bytes, and then
+    the columns as contiguous little-endian float64 arrays.
+
+    metadata is a dict of JSON serializable values, e.g. the sample ID,
+    time constant and system response path. The save time, the software
+    version, and the first and last timestamps are added to it.
+    '''
+    wavelengths = spectrum.getWavelength()
+    length = wavelengths.size
+    names = []
+    columns = []
+    for getter, name in BINARY_COLUMNS:
+        getter = getattr(spectrum, getter, None)
+        values = getter() if getter is not None else None
+        if values is None or len(values) != length:
+            continue
+        names.append(name)
+        # copy, in case the values are memory-mapped from filepath
+        columns.append(np.array(values, dtype='<f8'))
+    metadata = dict(metadata or {})
+    metadata['saved'] = time.time()
+    metadata['version'] = __version__
+    if 'time' in names and length:
+        timestamps = columns[names.index('time')]
+        metadata.setdefault('start_time', float(timestamps[0]))
+        metadata.setdefault('end_time', float(timestamps[-1]))
+    header = json.dumps(dict(format=BINARY_VERSION, columns=names,
+                             length=length, metadata=metadata))
+    size = len(BINARY_MAGIC) + len(header) + 1
+    padding = -size % BINARY_ALIGNMENT
+    with open(filepath, 'wb') as f:
+        f.write(BINARY_MAGIC)
+        f.write(header + ' ' * padding + '\n')
+        for values in columns:
+            values.tofile(f)
+
+
+def isBinarySpectrum(filepath):
+    '''
+    Returns True if the file is a binary spectrum file.
+    '''
+    with open(filepath, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def readSpectrumBinary(filepath, mmap=True):
+    '''
+    Reads a binary spectrum file saved by saveSpectrumBinary. Returns a
+    dict of the column arrays, and the metadata dict. If mmap is True,
+    the columns are read-only memory-mapped arrays, so only the parts that
+    are used are read from disk.
+    '''
+    with open(filepath, 'rb') as f:
+        if f.readline() != BINARY_MAGIC:
+            raise ValueError('not a binary spectrum file: {}'
+                             ''.format(filepath))
+        header = json.loads(f.readline())
+        offset = f.tell()
+        if header['format'] > BINARY_VERSION:
+            raise ValueError('unsupported binary spectrum format: {}'
+                             ''.format(header['format']))
+        names = header['columns']
+        length = header['length']
+        shape = (len(names), length)
+        expected = offset + len(names) * length * 8
+        if os.path.getsize(filepath) < expected:
+            raise ValueError('truncated binary spectrum file: {}'
+                             ''.format(filepath))
+        if not length or not names:
+            data = np.empty(shape)
+        elif mmap:
+            data = np.memmap(f, dtype='<f8', mode='r', offset=offset,
+                             shape=shape)
+        else:
+            data = np.fromfile(f, dtype='<f8', count=shape[0] * shape[1]
+                               ).reshape(shape)
+    columns = dict((name, data[i]) for i, name in enumerate(names))
+    return columns, header['metadata']
+
+
+def writeSpectrum(spectrum, filepath, metadata=None):
+    '''
+    Saves a spectrum with saveSpectrumBinary if the filepath ends with
+    BINARY_EXTENSION, or as text with saveSpectrum otherwise. The text
+    format doesn't include the metadata.
+    '''
+    if filepath.lower().endswith(BINARY_EXTENSION):
+        saveSpectrumBinary(spectrum, filepath, metadata)
+    else:
+        saveSpectrum(spectrum, filepath)
+
+
+class SpectrumBuffer(object):
+    '''
+    A growing spectrum, stored in ExpandingBuffers. The signal is the raw
+    signal divided by the system response, if a SystemResponse is
+    provided.
+    '''
+
+    def __init__(self, sysres=None):
+        self.sysres = sysres
+        self._wavelength = ExpandingBuffer()
+        self._energy = ExpandingBuffer()
+        self._rawSignal = ExpandingBuffer()
+        self._phase = ExpandingBuffer()
+        self._signal = ExpandingBuffer()
+        self._time = ExpandingBuffer()
+        self._settleTime = ExpandingBuffer()
+
+    def append(self, wavelength, rawSignal, phase, timestamp=None,
+               settleTime=np.nan):
+        if timestamp is None:
+            timestamp = time.time()
+        signal = self._getSignal(wavelength, rawSignal)
+        self._wavelength.append(wavelength)
+        self._signal.append(signal)
+        self._rawSignal.append(rawSignal)
+        self._phase.append(phase)
+        self._energy.append(1239.842 / wavelength)
+        self._time.append(timestamp)
+        self._settleTime.append(settleTime)
+
+    def insert(self, wavelength, rawSignal, phase, timestamp=None,
+               settleTime=np.nan):
+        '''
+        Inserts a point so that the wavelengths stay in the same
+        (ascending or descending) order as the existing points.
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        signal = self._getSignal(wavelength, rawSignal)
+        wavelengths = self._wavelength.get()
+        if len(wavelengths) > 1 and wavelengths[0] > wavelengths[-1]:
+            i = len(wavelengths) - np.searchsorted(wavelengths[::-1],
+                                                   wavelength)
+        else:
+            i = np.searchsorted(wavelengths, wavelength)
+        self._wavelength.insert(i, wavelength)
+        self._signal.insert(i, signal)
+        self._rawSignal.insert(i, rawSignal)
+        self._phase.insert(i, phase)
+        self._energy.insert(i, 1239.842 / wavelength)
+        self._time.insert(i, timestamp)
+        self._settleTime.insert(i, settleTime)
+
+    def _getSignal(self, wavelength, rawSignal):
+        if self.sysres is None:
+            log.warning("No sysrem response provided. Using raw value.")
+            return rawSignal
+        return rawSignal / self.sysres(wavelength)
+
+    def getWavelength(self):
+        return self._wavelength.get()
+
+    def getSignal(self):
+        return self._signal.get()
+
+    def getRawSignal(self):
+        return self._rawSignal.get()
+
+    def getPhase(self):
+        return self._phase.get()
+
+    def getEnergy(self):
+        return self._energy.get()
+
+    def getTime(self):
+        '''
+        Returns the time.time() timestamp of each point.
+        '''
+        return self._time.get()
+
+    def getSettleTime(self):
+        '''
+        Returns the time waited for the lock-in to settle at each point,
+        in seconds, or NaN where unknown.
+        '''
+        return self._settleTime.get()
+
+    def getSignalError(self):
+        return None
+
+    def getRawSignalError(self):
+        return None
+
+    def save(self, filepath, metadata=None):
+        writeSpectrum(self, filepath, metadata)
+
+    def __len__(self):
+        return len(self._wavelength)
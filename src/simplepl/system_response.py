@@ -0,0 +1,156 @@
+#
+#   Copyright (c) 2013-2014, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with SimplePL.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Defines the SystemResponse class, and getSystemResponse, which caches the
+system responses read from files so that each file is only parsed once.
+'''
+
+# std lib imports
+import collections
+import logging
+log = logging.getLogger(__name__)
+import os
+import threading
+
+# third party imports
+import numpy as np
+
+# Interpolation methods
+LINEAR = 'linear'
+SPLINE = 'spline'  # cubic spline, which requires scipy
+
+# Extrapolation policies, for wavelengths outside of the measured range
+EXTRAPOLATE_NEAREST = 'nearest'  # use the nearest measured value
+EXTRAPOLATE_LINEAR = 'linear'    # extend the first and last intervals
+EXTRAPOLATE_NAN = 'nan'          # return NaN
+
+# The number of system responses kept by getSystemResponse
+CACHE_SIZE = 8
+
+
+class SystemResponse(object):
+    '''
+    The system response, i.e. the raw signal measured from a source with
+    a flat spectrum, as a function of wavelength. Calling it with a
+    wavelength, or an array of wavelengths (in nm), returns the
+    interpolated system response.
+    '''
+
+    def __init__(self, wavelength, rawSignal, interpolation=LINEAR,
+                 extrapolation=EXTRAPOLATE_NEAREST):
+        if interpolation not in (LINEAR, SPLINE):
+            raise ValueError('unknown interpolation: {}'
+                             ''.format(interpolation))
+        if extrapolation not in (EXTRAPOLATE_NEAREST, EXTRAPOLATE_LINEAR,
+                                 EXTRAPOLATE_NAN):
+            raise ValueError('unknown extrapolation: {}'
+                             ''.format(extrapolation))
+        wavelength = np.asarray(wavelength, dtype=np.double)
+        rawSignal = np.asarray(rawSignal, dtype=np.double)
+        if wavelength.size < 2:
+            raise ValueError('a system response needs at least 2 points')
+        order = np.argsort(wavelength)
+        self.wavelength = wavelength[order]
+        self.rawSignal = rawSignal[order]
+        self.interpolation = interpolation
+        self.extrapolation = extrapolation
+        self._tck = None
+        if interpolation == SPLINE:
+            from scipy.interpolate import splrep
+            self._tck = splrep(self.wavelength, self.rawSignal, s=0)
+
+    @classmethod
+    def fromFile(cls, filepath, **kwargs):
+        '''
+        Reads the system response from the raw signal column of a file
+        that SimplePLParser can read.
+        '''
+        from simple_pl_parser import SimplePLParser
+        parser = SimplePLParser(filepath)
+        parser.parse()
+        if parser.wavelength is None or parser.rawSignal is None:
+            raise ValueError('not a system response file: {}'
+                             ''.format(filepath))
+        return cls(parser.wavelength, parser.rawSignal, **kwargs)
+
+    def __call__(self, wavelength):
+        x = np.asarray(wavelength, dtype=np.double)
+        w = self.wavelength
+        r = self.rawSignal
+        if self._tck is not None:
+            from scipy.interpolate import splev
+            y = splev(np.clip(x, w[0], w[-1]), self._tck)
+        else:
+            y = np.interp(x, w, r)
+        if self.extrapolation == EXTRAPOLATE_NAN:
+            y = np.where((x < w[0]) | (x > w[-1]), np.nan, y)
+        elif self.extrapolation == EXTRAPOLATE_LINEAR:
+            below = r[0] + (x - w[0]) * (r[1] - r[0]) / (w[1] - w[0])
+            above = r[-1] + (x - w[-1]) * (r[-1] - r[-2]) / (w[-1] - w[-2])
+            y = np.where(x < w[0], below, np.where(x > w[-1], above, y))
+        if y.ndim == 0:
+            return float(y)
+        return y
+
+
+_cache = collections.OrderedDict()
+_cacheLock = threading.Lock()
+
+
+def getSystemResponse(filepath, interpolation=LINEAR,
+                      extrapolation=EXTRAPOLATE_NEAREST):
+    '''
+    Returns the SystemResponse read from the given file. The most recently
+    used CACHE_SIZE system responses are cached by path and modification
+    time, so a file is only parsed again if it has changed.
+
+    Raises an IOError or ValueError if the file cannot be read.
+    '''
+    filepath = os.path.abspath(filepath)
+    key = (filepath, os.path.getmtime(filepath), interpolation,
+           extrapolation)
+    with _cacheLock:
+        sysres = _cache.pop(key, None)
+        if sysres is None:
+            sysres = SystemResponse.fromFile(filepath,
+                                             interpolation=interpolation,
+                                             extrapolation=extrapolation)
+            log.debug('Opened system response file: {}'.format(filepath))
+        _cache[key] = sysres
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+        return sysres
+
+
+def loadSystemResponse(filepath):
+    '''
+    Returns the system response read from the given file with
+    getSystemResponse, or None if filepath is empty or the file cannot be
+    read.
+    '''
+    if not filepath:
+        return None
+    try:
+        return getSystemResponse(filepath)
+    except (IOError, OSError, ValueError, NotImplementedError):
+        log.debug('Unable to open system response file: {}'
+                  ''.format(filepath))
+        return None
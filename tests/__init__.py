@@ -0,0 +1,38 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Tests for simplepl and simplefit. Run them from the top directory with
+
+    python -m unittest discover -s tests -t .
+
+The tests that need PySide or scipy are skipped if they are not
+installed.
+'''
+
+# std lib imports
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                                            os.path.abspath(__file__))),
+                       'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,144 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Checks the array functions and analytic jacobians of the simplefit
+models against scalar references and central differences. See
+benchmarks/simplefit_models.py for their speed.
+'''
+
+# std lib imports
+import math
+import unittest
+
+# third party imports
+import numpy as np
+
+try:
+    from simplefit.simulated_spectrum import (ConstantSpectrum,
+            GaussianSpectrum, LorentzianSpectrum, AsymmetricGaussianSpectrum,
+            WaveVectorConservingPLSpectrum, WaveVectorNonConservingPLSpectrum,
+            kB)
+except ImportError as e:
+    IMPORT_ERROR = str(e)
+else:
+    IMPORT_ERROR = None
+
+
+def constant(e, c):
+    return c
+
+
+def gaussian(e, a, c, w):
+    return a * math.exp(-(e - c) ** 2 / (2. * (w / 2.35482) ** 2))
+
+
+def lorentzian(e, a, c, w):
+    return a / (1. + (2. * (e - c) / w) ** 2)
+
+
+def asymmetricGaussian(e, a, c, w1, w2):
+    w = w1 if e < c else w2
+    return a * math.exp(-(e - c) ** 2 / (2. * (2. * w / 2.35482) ** 2))
+
+
+def waveVectorConservingPL(e, A, Eg, T):
+    if T <= 0 or e <= Eg:
+        return 0.
+    scale = A / (math.sqrt(.5 * kB * T) * math.exp(-.5))
+    return scale * math.sqrt(e - Eg) * math.exp(-(e - Eg) / (kB * T))
+
+
+def waveVectorNonConservingPL(e, A, Eg, T):
+    if T <= 0 or e <= Eg:
+        return 0.
+    scale = A / ((2. * kB * T) ** 2 * math.exp(-2.))
+    return scale * (e - Eg) ** 2 * math.exp(-(e - Eg) / (kB * T))
+
+
+# (model class, scalar reference, parameters). The energies avoid the
+# centers and bandgaps, where the models are not differentiable.
+ENERGY = np.linspace(0.9, 1.3, 401)
+CASES = [
+    ('ConstantSpectrum', constant, (0.3,)),
+    ('GaussianSpectrum', gaussian, (2., 1.1003, 0.05)),
+    ('LorentzianSpectrum', lorentzian, (2., 1.1003, 0.05)),
+    ('AsymmetricGaussianSpectrum', asymmetricGaussian,
+     (2., 1.1003, 0.03, 0.06)),
+    ('WaveVectorConservingPLSpectrum', waveVectorConservingPL,
+     (3., 1.0003, 300.)),
+    ('WaveVectorNonConservingPLSpectrum', waveVectorNonConservingPL,
+     (3., 1.0003, 300.)),
+]
+
+
+def scalarEvaluate(reference, energy, parameters):
+    return np.array([reference(e, *parameters) for e in energy])
+
+
+def centralDifferences(function, energy, parameters):
+    columns = []
+    for i, p in enumerate(parameters):
+        h = 1e-6 * max(abs(p), 1e-3)
+        upper = list(parameters)
+        lower = list(parameters)
+        upper[i] += h
+        lower[i] -= h
+        columns.append((function(energy, *upper) -
+                        function(energy, *lower)) / (2. * h))
+    return np.column_stack(columns)
+
+
+@unittest.skipIf(IMPORT_ERROR, IMPORT_ERROR)
+class TestSimulatedSpectra(unittest.TestCase):
+
+    def getCases(self):
+        for name, reference, parameters in CASES:
+            yield globals()[name], reference, parameters
+
+    def testFunctionMatchesScalarReference(self):
+        for cls, reference, parameters in self.getCases():
+            expected = scalarEvaluate(reference, ENERGY, parameters)
+            actual = cls.function(ENERGY, *parameters)
+            self.assertEqual(actual.shape, ENERGY.shape, cls.__name__)
+            np.testing.assert_allclose(actual, expected, rtol=1e-12,
+                                       atol=1e-15, err_msg=cls.__name__)
+
+    def testJacobianMatchesCentralDifferences(self):
+        for cls, _reference, parameters in self.getCases():
+            expected = centralDifferences(cls.function, ENERGY, parameters)
+            actual = cls.jacobian(ENERGY, *parameters)
+            self.assertEqual(actual.shape, (ENERGY.size, len(parameters)),
+                             cls.__name__)
+            for i in xrange(len(parameters)):
+                scale = np.abs(expected[:, i]).max()
+                np.testing.assert_allclose(actual[:, i], expected[:, i],
+                        rtol=1e-5, atol=1e-6 * scale,
+                        err_msg='{} parameter {}'.format(cls.__name__, i))
+
+    def testNonPositiveTemperature(self):
+        for cls in (WaveVectorConservingPLSpectrum,
+                    WaveVectorNonConservingPLSpectrum):
+            self.assertTrue(np.all(cls.function(ENERGY, 3., 1., 0.) == 0.))
+            self.assertTrue(np.all(cls.jacobian(ENERGY, 3., 1., 0.) == 0.))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Checks that the text files written by spectrum_data.saveSpectrum are
+byte-identical to those of the original per-row writer.
+'''
+
+# std lib imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# third party imports
+import numpy as np
+
+# local imports
+from simplepl.spectrum_data import saveSpectrum, writeTable, WRITE_CHUNK_ROWS
+
+
+def saveSpectrumPerRow(spectrum, filepath):
+    '''
+    The original saveSpectrum, which writes each value separately.
+    '''
+    wavelengths = spectrum.getWavelength()
+    signals = spectrum.getSignal()
+    rawSignals = spectrum.getRawSignal()
+    phases = spectrum.getPhase()
+    signalErrors = spectrum.getSignalError()
+    rawSignalErrors = spectrum.getRawSignalError()
+    settleTimes = spectrum.getSettleTime()
+    hasErrors = (signalErrors is not None or rawSignalErrors is not None)
+    hasSettleTimes = (settleTimes is not None and
+                      np.isfinite(settleTimes).any())
+    with open(filepath, 'w') as f:
+        if hasErrors:
+            f.write('Wavelength\tSignal\tRaw_Signal\tPhase'
+                    '\tSignal_Error\tRaw_Signal_Error')
+        else:
+            f.write('Wavelength\tSignal\tRaw_Signal\tPhase')
+        if hasSettleTimes:
+            f.write('\tSettle_Time')
+        f.write('\n')
+        for i in xrange(wavelengths.size):
+            if wavelengths is not None:
+                wavelength = wavelengths[i]
+            else:
+                wavelength = np.nan
+            if signals is not None:
+                signal = signals[i]
+            else:
+                signal = np.nan
+            if rawSignals is not None:
+                rawSignal = rawSignals[i]
+            else:
+                rawSignal = np.nan
+            if phases is not None:
+                phase = phases[i]
+            else:
+                phase = np.nan
+            f.write('%.1f\t%E\t%E\t%.1f' % (wavelength,
+                                           signal,
+                                           rawSignal,
+                                           phase))
+            if hasErrors:
+                if signalErrors is not None:
+                    signalError = signalErrors[i]
+                else:
+                    signalError = np.nan
+                if rawSignalErrors is not None:
+                    rawSignalError = rawSignalErrors[i]
+                else:
+                    rawSignalError = np.nan
+                f.write('\t%E\t%E' % (signalError, rawSignalError))
+            if hasSettleTimes:
+                f.write('\t%.3f' % settleTimes[i])
+            f.write('\n')
+
+
+class Spectrum(object):
+    '''
+    A spectrum with the AbstractSpectrum getters, without Qt.
+    '''
+
+    def __init__(self, wavelength, signal=None, rawSignal=None, phase=None,
+                 signalError=None, rawSignalError=None, settleTime=None):
+        self._columns = dict(wavelength=wavelength, signal=signal,
+                             rawSignal=rawSignal, phase=phase,
+                             signalError=signalError,
+                             rawSignalError=rawSignalError,
+                             settleTime=settleTime)
+
+    def getWavelength(self):
+        return self._columns['wavelength']
+
+    def getSignal(self):
+        return self._columns['signal']
+
+    def getRawSignal(self):
+        return self._columns['rawSignal']
+
+    def getPhase(self):
+        return self._columns['phase']
+
+    def getSignalError(self):
+        return self._columns['signalError']
+
+    def getRawSignalError(self):
+        return self._columns['rawSignalError']
+
+    def getSettleTime(self):
+        return self._columns['settleTime']
+
+
+def makeColumn(size, seed):
+    '''
+    Returns random values over many decades and both signs, with NaN, INF
+    and -INF mixed in, and values that round half way.
+    '''
+    random = np.random.RandomState(seed)
+    values = (random.choice([-1., 1.], size) *
+              10. ** random.uniform(-15, 15, size))
+    values[::97] = np.nan
+    values[1::89] = np.inf
+    values[2::83] = -np.inf
+    values[3::79] = 0.
+    values[4::73] = 1.25
+    values[5::71] = -0.05
+    return values
+
+
+class TestSaveSpectrum(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameBytes(self, spectrum):
+        expectedPath = os.path.join(self.directory, 'expected.txt')
+        actualPath = os.path.join(self.directory, 'actual.txt')
+        saveSpectrumPerRow(spectrum, expectedPath)
+        saveSpectrum(spectrum, actualPath)
+        with open(expectedPath, 'rb') as f:
+            expected = f.read()
+        with open(actualPath, 'rb') as f:
+            actual = f.read()
+        self.assertEqual(len(actual), len(expected))
+        self.assertTrue(actual == expected)
+
+    def getSpectrum(self, size, errors=True, settleTimes=True):
+        settleTime = None
+        if settleTimes:
+            settleTime = np.abs(makeColumn(size, 7))
+        return Spectrum(wavelength=makeColumn(size, 1),
+                        signal=makeColumn(size, 2),
+                        rawSignal=makeColumn(size, 3),
+                        phase=makeColumn(size, 4),
+                        signalError=makeColumn(size, 5) if errors else None,
+                        rawSignalError=(makeColumn(size, 6) if errors
+                                        else None),
+                        settleTime=settleTime)
+
+    def testAllColumns(self):
+        # not a multiple of WRITE_CHUNK_ROWS, so the last chunk is short
+        size = 2 * WRITE_CHUNK_ROWS + 37
+        self.assertSameBytes(self.getSpectrum(size))
+
+    def testWithoutErrorsOrSettleTimes(self):
+        size = WRITE_CHUNK_ROWS + 1
+        self.assertSameBytes(self.getSpectrum(size, errors=False,
+                                              settleTimes=False))
+
+    def testMissingColumns(self):
+        size = WRITE_CHUNK_ROWS - 1
+        spectrum = self.getSpectrum(size)
+        spectrum._columns['phase'] = None
+        spectrum._columns['rawSignalError'] = None
+        spectrum._columns['settleTime'] = np.full(size, np.nan)
+        self.assertSameBytes(spectrum)
+
+    def testShortSpectra(self):
+        for size in (0, 1, 2):
+            self.assertSameBytes(self.getSpectrum(size))
+
+
+class TestWriteTable(unittest.TestCase):
+
+    def testMatchesPerRowFormatting(self):
+        columns = [makeColumn(1000, 1), makeColumn(1000, 2)]
+        rowFormat = '%.1f\t%E\n'
+        expected = ''.join(rowFormat % row for row in zip(*columns))
+        for chunkRows in (1, 7, 1000, 4096):
+            f = tempfile.TemporaryFile()
+            try:
+                writeTable(f, rowFormat, columns, chunkRows)
+                f.seek(0)
+                self.assertTrue(f.read() == expected, chunkRows)
+            finally:
+                f.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
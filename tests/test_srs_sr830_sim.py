@@ -0,0 +1,82 @@
+#
+#   Copyright (c) 2013, Scott J Maddox
+#
+#   This file is part of SimplePL.
+#
+#   SimplePL is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   SimplePL is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public
+#   License along with semicontrol.  If not, see
+#   <http://www.gnu.org/licenses/>.
+#
+#######################################################################
+'''
+Checks the settle detection of the SR830 drivers with the simulated
+lock-in.
+'''
+
+# std lib imports
+import threading
+import time
+import unittest
+
+# local imports
+from simplepl.instruments.drivers.srs_sr830_sim import SR830
+
+
+class RangeHoppingSR830(SR830):
+    '''
+    A simulated SR830 whose signal jumps between two ranges on every
+    reading, so that each reading changes the sensitivity.
+    '''
+
+    def __init__(self):
+        super(RangeHoppingSR830, self).__init__()
+        self._readings = 0
+
+    def _get_outputs_at(self, t):
+        self._readings += 1
+        if self._readings % 2:
+            return 1e-3, 0.
+        return 1e-6, 0.
+
+
+class TestSettleAndGetOutputs(unittest.TestCase):
+
+    def testSettlesOnSteadySignal(self):
+        sr830 = SR830()
+        sr830.init_output_generator(seed=0)
+        sr830.set_time_constant_index(4)  # 1 ms
+        sr830.set_sensitivity_index(15)  # 200 uV, for the 100 uV model
+        R, _theta, settleTime = sr830.settle_and_get_outputs()
+        self.assertLessEqual(settleTime, sr830.get_suggested_delay() + 0.05)
+        self.assertAlmostEqual(R / sr830.model(sr830.model.center), 1., 1)
+        self.assertEqual(sr830.wasted_settle_count, 0)
+
+    def testRangeChangesDontHoldUpTheScan(self):
+        sr830 = RangeHoppingSR830()
+        sr830.set_time_constant_index(4)  # 1 ms
+        results = []
+        thread = threading.Thread(
+                    target=lambda: results.append(
+                        sr830.settle_and_get_outputs(max_delay=0.05)))
+        thread.daemon = True
+        start = time.time()
+        thread.start()
+        thread.join(5.)
+        self.assertFalse(thread.is_alive(), 'max_delay was not enforced')
+        self.assertLess(time.time() - start, 1.)
+        self.assertGreater(sr830.wasted_settle_count, 0)
+        self.assertEqual(len(results), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()